@@ -6,7 +6,10 @@ import homeassistant.helpers.config_validation as cv
 from homeassistant import config_entries
 from homeassistant.core import HomeAssistant
 
-from .coordinator import PvCurtailingCoordinator
+from .coordinator import PvCurtailingCoordinator, site_key
+from .inverter import SunSpecInverter
+from .model_cache import ModelCache
+from .connection import ModbusConnectionPool
 from .const import *
 
 _LOGGER = logging.getLogger(__name__)
@@ -16,21 +19,68 @@ async def async_setup_entry(
 ) -> bool:
     """Set up platform from ConfigEntry"""
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][CONFIG] = entry.data
+    hass.data[DOMAIN].setdefault(SITES, {})
+    if MODEL_CACHE not in hass.data[DOMAIN]:
+        hass.data[DOMAIN][MODEL_CACHE] = ModelCache(hass)
+    if CONNECTION_POOL not in hass.data[DOMAIN]:
+        hass.data[DOMAIN][CONNECTION_POOL] = ModbusConnectionPool()
     _LOGGER.info(entry.data)
 
-    pv_coordinator = PvCurtailingCoordinator(
-        hass=hass, config_entry=entry
-    )
+    # The device is connected in the background, its entities are unavailable until it is set up
+    inverter = SunSpecInverter(hass=hass, config_entry=entry)
 
-    hass.data[DOMAIN][COORDINATOR] = pv_coordinator
+    # Inverters behind the same grid meter share one coordinator (fleet mode)
+    key = site_key(entry.data)
+    pv_coordinator = hass.data[DOMAIN][SITES].get(key)
+    if pv_coordinator == None:
+        pv_coordinator = PvCurtailingCoordinator(hass=hass, config_entry=entry)
+        hass.data[DOMAIN][SITES][key] = pv_coordinator
+    pv_coordinator.add_inverter(inverter)
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
 
-    await hass.async_add_executor_job(pv_coordinator.sunspec_setup)  # Connect with SunSpec device (blocking call)
-    if not pv_coordinator.sunspec_setup_success:
-        return False
+    hass.data[DOMAIN][entry.entry_id] = {
+        COORDINATOR: pv_coordinator,
+        INVERTER: inverter,
+    }
 
     # Forward setup to platforms
     hass.async_create_task(
-        hass.config_entries.async_forward_entry_setups(entry=entry, platforms=["sensor", "switch"])
+        hass.config_entries.async_forward_entry_setups(entry=entry, platforms=PLATFORMS)
     )
-    return True
\ No newline at end of file
+    inverter.start_setup()
+    return True
+
+async def async_unload_entry(
+    hass: HomeAssistant, entry: config_entries.ConfigEntry
+) -> bool:
+    """Unload a config entry, its setup and reconnect tasks and socket are stopped by the unload callbacks"""
+    if not await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+        return False
+    entry_data = hass.data[DOMAIN].pop(entry.entry_id)
+    pv_coordinator: PvCurtailingCoordinator = entry_data[COORDINATOR]
+    inverter: SunSpecInverter = entry_data[INVERTER]
+    inverter.shutdown()
+    pv_coordinator.remove_inverter(inverter)
+
+    # The site stops with its owner (it holds the switch and the options) or its last inverter,
+    # remaining inverters are reloaded so one of them creates the site again.
+    # After a reload of the owner the site may already hold a new coordinator, which is left alone
+    key = site_key(entry.data)
+    if hass.data[DOMAIN][SITES].get(key) is not pv_coordinator:
+        return True
+    if pv_coordinator.owner_entry_id == entry.entry_id or len(pv_coordinator.inverters) == 0:
+        hass.data[DOMAIN][SITES].pop(key)
+        await pv_coordinator.async_shutdown()
+        for remaining in pv_coordinator.inverters:
+            hass.config_entries.async_schedule_reload(remaining.config_entry.entry_id)
+    return True
+
+async def async_update_options(hass: HomeAssistant, entry: config_entries.ConfigEntry) -> None:
+    """Apply changed options to the running coordinator, options saved on another entry of the site are copied to the owner"""
+    pv_coordinator: PvCurtailingCoordinator = hass.data[DOMAIN][entry.entry_id][COORDINATOR]
+    pv_coordinator.apply_options(entry.options)
+    if entry.entry_id == pv_coordinator.owner_entry_id:
+        return
+    owner = hass.config_entries.async_get_entry(pv_coordinator.owner_entry_id)
+    if owner != None and owner.options != entry.options:
+        hass.config_entries.async_update_entry(owner, options=dict(entry.options))  # so they are used after a restart
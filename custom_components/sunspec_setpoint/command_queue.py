@@ -0,0 +1,79 @@
+import asyncio
+import heapq
+import itertools
+import logging
+
+from typing import Any, Awaitable, Callable
+
+from .const import CommandPriority
+
+_LOGGER = logging.getLogger(__name__)
+
+class CommandPreempted(Exception):
+    """A running command was cancelled for a more important one"""
+
+class CommandQueue:
+    """
+    Runs the commands that access the inverters of a site one at a time, most important first.
+    A command that arrives while a less important one runs cancels it, so user and safety
+    commands never wait for a control update that is stuck on a slow device
+    """
+
+    def __init__(self) -> None:
+        self._busy: bool = False    # A command runs, or the slot was handed to a waiter that didn't start yet
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []  # Heap of (priority, order, future)
+        self._order = itertools.count()
+        self._running: tuple[CommandPriority, asyncio.Task] | None = None
+        self._preempted: set[asyncio.Task] = set()
+        self.preempt_count: int = 0  # Total number of commands cancelled for a more important one
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for *_, waiter in self._waiters if not waiter.done())
+
+    async def run(self, priority: CommandPriority, func: Callable[[], Awaitable[Any]], name: str) -> Any:
+        """Run func when it's its turn and return its result. Raises CommandPreempted if it was preempted"""
+        if self._busy:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+            self.preempt(priority)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release()  # the slot was handed over right before the cancellation
+                raise
+        self._busy = True
+
+        task = asyncio.get_running_loop().create_task(func(), name=name)  # pyright: ignore[reportArgumentType]
+        self._running = (priority, task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task in self._preempted:
+                raise CommandPreempted(f"{name} was preempted") from None
+            raise
+        finally:
+            self._preempted.discard(task)
+            self._running = None
+            self._release()
+
+    def preempt(self, priority: CommandPriority) -> None:
+        """Cancel the running command if it is less important than priority"""
+        if self._running == None:
+            return
+        running_priority, task = self._running
+        if running_priority > priority and not task.done() and task not in self._preempted:
+            _LOGGER.debug(f"{task.get_name()} is preempted by a {priority.name.lower()} command")
+            self._preempted.add(task)
+            self.preempt_count += 1
+            task.cancel()
+
+    def _release(self) -> None:
+        """Hand the slot to the most important waiter, or free it"""
+        while self._waiters:
+            *_, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return  # still busy, now for the waiter
+        self._busy = False
@@ -4,8 +4,9 @@ import logging
 from typing import Any
 from homeassistant import config_entries
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.selector import selector, EntitySelector, EntityFilterSelectorConfig
+from homeassistant.helpers.selector import selector, EntitySelector, EntityFilterSelectorConfig, EntitySelectorConfig
 from .const import *
+from .discovery import DiscoveredDevice, async_discover, async_probe_device
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,15 +34,91 @@ ENERGY_METER_SCHEMA = vol.Schema(
     }
 )
 
+METER_MODE_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_METER_MODE, default=MeterMode.IMPORT_EXPORT.value): selector({
+            "select": {
+                "options": [mode.value for mode in MeterMode]
+            }
+        })
+    }
+)
+
+NET_METER_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_NET_PWR_ENT_ID): EntitySelector(EntityFilterSelectorConfig(domain="sensor")),
+        vol.Required(CONF_EXPORT_POSITIVE, default=False): bool,
+    }
+)
+
+PHASE_METER_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_PHASE_PWR_ENT_IDS): EntitySelector(EntitySelectorConfig(domain="sensor", multiple=True)),
+        vol.Required(CONF_EXPORT_POSITIVE, default=False): bool,
+    }
+)
+
+SCAN_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_DISCOVERY_TARGET, default=""): str,
+    }
+)
+
+MANUAL_DEVICE = "manual"
+
 INJ_TARIFF_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_INJ_TARIFF_ENT_ID): EntitySelector(EntityFilterSelectorConfig(domain="sensor")),
     }
 )
 
+def options_schema(options: dict[str, Any]) -> vol.Schema:
+    """Control options, defaulting to the current options of the entry"""
+    return vol.Schema(
+        {
+            vol.Required(CONF_CUTOFF_TARIFF, default=options.get(CONF_CUTOFF_TARIFF, DEFAULT_CUTOFF_TARIFF)): vol.Coerce(float),
+            vol.Required(CONF_EVENT_MODE, default=options.get(CONF_EVENT_MODE, DEFAULT_EVENT_MODE)): bool,
+            vol.Required(CONF_NIGHT_POLL_INTERVAL, default=options.get(CONF_NIGHT_POLL_INTERVAL, DEFAULT_NIGHT_POLL_INTERVAL)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_FAST_POLL_INTERVAL, default=options.get(CONF_FAST_POLL_INTERVAL, DEFAULT_FAST_POLL_INTERVAL)): vol.All(vol.Coerce(float), vol.Range(min=MIN_FAST_POLL_INTERVAL)),
+            vol.Required(CONF_ADAPTIVE_INTERVAL, default=options.get(CONF_ADAPTIVE_INTERVAL, DEFAULT_ADAPTIVE_INTERVAL)): bool,
+            vol.Required(CONF_MAX_POLL_INTERVAL, default=options.get(CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL)): vol.All(vol.Coerce(float), vol.Range(min=MIN_FAST_POLL_INTERVAL)),
+            vol.Required(CONF_MEDIUM_POLL_INTERVAL, default=options.get(CONF_MEDIUM_POLL_INTERVAL, DEFAULT_MEDIUM_POLL_INTERVAL)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_SLOW_POLL_INTERVAL, default=options.get(CONF_SLOW_POLL_INTERVAL, DEFAULT_SLOW_POLL_INTERVAL)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_DEBOUNCE, default=options.get(CONF_DEBOUNCE, DEFAULT_DEBOUNCE)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_MIN_WRITE_INTERVAL, default=options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_MIN_DELTA_PCT, default=options.get(CONF_MIN_DELTA_PCT, DEFAULT_MIN_DELTA_PCT)): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+            vol.Required(CONF_MAX_WRITES_PER_HOUR, default=options.get(CONF_MAX_WRITES_PER_HOUR, DEFAULT_MAX_WRITES_PER_HOUR)): vol.All(vol.Coerce(int), vol.Range(min=1)),
+            vol.Required(CONF_VERIFY_WRITES, default=options.get(CONF_VERIFY_WRITES, DEFAULT_VERIFY_WRITES)): bool,
+            vol.Required(CONF_WIN_TMS, default=options.get(CONF_WIN_TMS, DEFAULT_WIN_TMS)): vol.All(vol.Coerce(int), vol.Range(min=0, max=65535)),
+            vol.Required(CONF_RVRT_TMS, default=options.get(CONF_RVRT_TMS, DEFAULT_RVRT_TMS)): vol.All(vol.Coerce(int), vol.Range(min=0, max=65535)),
+            vol.Required(CONF_RVRT_PCT, default=options.get(CONF_RVRT_PCT, DEFAULT_RVRT_PCT)): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+            vol.Required(CONF_RMP_TMS, default=options.get(CONF_RMP_TMS, DEFAULT_RMP_TMS)): vol.All(vol.Coerce(int), vol.Range(min=0, max=65535)),
+            vol.Required(CONF_CONTROLLER, default=options.get(CONF_CONTROLLER, DEFAULT_CONTROLLER.value)): selector({
+                "select": {
+                    "options": [controller.value for controller in ControllerType]
+                }
+            }),
+            vol.Required(CONF_KP, default=options.get(CONF_KP, DEFAULT_KP)): vol.Coerce(float),
+            vol.Required(CONF_KI, default=options.get(CONF_KI, DEFAULT_KI)): vol.Coerce(float),
+            vol.Required(CONF_KD, default=options.get(CONF_KD, DEFAULT_KD)): vol.Coerce(float),
+            vol.Required(CONF_DEADBAND, default=options.get(CONF_DEADBAND, DEFAULT_DEADBAND)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_RAMP_RATE, default=options.get(CONF_RAMP_RATE, DEFAULT_RAMP_RATE)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_TARGET_EXPORT, default=options.get(CONF_TARGET_EXPORT, DEFAULT_TARGET_EXPORT)): vol.Coerce(float),
+            vol.Required(CONF_PUBLISH_THRESHOLD, default=options.get(CONF_PUBLISH_THRESHOLD, DEFAULT_PUBLISH_THRESHOLD)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_PUBLISH_MIN_INTERVAL, default=options.get(CONF_PUBLISH_MIN_INTERVAL, DEFAULT_PUBLISH_MIN_INTERVAL)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_PUBLISH_MAX_INTERVAL, default=options.get(CONF_PUBLISH_MAX_INTERVAL, DEFAULT_PUBLISH_MAX_INTERVAL)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Required(CONF_INSTRUMENTATION, default=options.get(CONF_INSTRUMENTATION, DEFAULT_INSTRUMENTATION)): bool,
+        }
+    )
+
 class PvCurtailmentConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Config flow for the PV Curtailment integration setup"""
 
+    @staticmethod
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry) -> config_entries.OptionsFlow:
+        """Options flow for the control settings"""
+        return PvCurtailmentOptionsFlow()
+
     async def async_step_user(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
         """Invoked when a user initiates a config flow via the UI
         In this step, the inverter brand is selected
@@ -51,9 +128,69 @@ class PvCurtailmentConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         if user_input is not None:
             self.brand = Brand(user_input[CONF_INVERTER_BRAND])
             self.data[CONF_USER_STEP] = user_input
-            return await self.async_step_connect()
+            return await self.async_step_scan()
         
         return self.async_show_form(step_id="user", data_schema=USER_SCHEMA, errors=errors)
+
+    async def async_step_scan(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
+        """Look for SunSpec devices at a host or subnet (like 192.168.1.0/24), leave empty to enter them manually"""
+        errors = {}
+
+        if user_input is not None:
+            target = user_input.get(CONF_DISCOVERY_TARGET, "").strip()
+            if target == "":
+                return await self.async_step_connect()
+            slave_ids = list(DISCOVERY_SLAVE_IDS)
+            default_id = map_default_ID(brand=self.brand)
+            if default_id != None and default_id not in slave_ids:
+                slave_ids.append(default_id)
+            try:
+                devices = await async_discover(target, slave_ids=slave_ids)
+            except ValueError as e:
+                _LOGGER.warning(f"Discovery target {target} is invalid: {e}")
+                errors["base"] = "invalid_input"
+            else:
+                configured = {
+                    (entry.data[CONF_CONNECT_STEP][CONF_IP], int(entry.data[CONF_CONNECT_STEP][CONF_PORT]), int(entry.data[CONF_CONNECT_STEP][CONF_SLAVE_ID]))
+                    for entry in self._async_current_entries()
+                    if CONF_CONNECT_STEP in entry.data
+                }
+                self.discovered = {
+                    device.label: device for device in devices
+                    if (device.host, device.port, device.slave_id) not in configured
+                }
+                if len(self.discovered) == 0:
+                    errors["base"] = "no_devices_found"
+                else:
+                    return await self.async_step_pick_device()
+
+        return self.async_show_form(step_id="scan", data_schema=SCAN_SCHEMA, errors=errors)
+
+    async def async_step_pick_device(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
+        """Select one of the discovered devices"""
+        if user_input is not None:
+            label = user_input[CONF_DISCOVERED_DEVICE]
+            if label not in self.discovered:
+                return await self.async_step_connect()
+            device: DiscoveredDevice = self.discovered[label]
+            self.data[CONF_CONNECT_STEP] = {
+                CONF_IP: device.host,
+                CONF_PORT: device.port,
+                CONF_SLAVE_ID: device.slave_id,
+                CONF_MODBUS_TIMEOUT: DEFAULT_MODBUS_TIMEOUT,
+            }
+            return await self.async_step_meter_mode()
+
+        PICK_DEVICE_SCHEMA = vol.Schema(
+            {
+                vol.Required(CONF_DISCOVERED_DEVICE): selector({
+                    "select": {
+                        "options": [*self.discovered, MANUAL_DEVICE]
+                    }
+                })
+            }
+        )
+        return self.async_show_form(step_id="pick_device", data_schema=PICK_DEVICE_SCHEMA)
     
     async def async_step_connect(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
         """Configure IP, port and modbus slave ID"""
@@ -62,6 +199,8 @@ class PvCurtailmentConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 vol.Required(CONF_IP): str,
                 vol.Required(CONF_PORT): vol.Coerce(int),
                 vol.Required(CONF_SLAVE_ID, default=map_default_ID(brand=self.brand)): vol.Coerce(int),
+                vol.Optional(CONF_MODBUS_TIMEOUT, default=DEFAULT_MODBUS_TIMEOUT): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
+                vol.Optional(CONF_SKIP_PROBE, default=False): bool,
             }
         )
         errors = {}
@@ -71,22 +210,65 @@ class PvCurtailmentConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 validated_schema = CONNECT_SCHEMA(user_input)
             except Exception as e:
                 errors["base"] = "invalid_input"
+
+            if not errors and not validated_schema[CONF_SKIP_PROBE]:
+                device = await async_probe_device(
+                    host=validated_schema[CONF_IP],
+                    port=validated_schema[CONF_PORT],
+                    slave_id=validated_schema[CONF_SLAVE_ID],
+                    timeout=validated_schema[CONF_MODBUS_TIMEOUT],
+                )
+                if device == None:
+                    errors["base"] = "cannot_connect"  # an offline inverter can still be added with skip_probe
             
             if not errors:
-                self.data[CONF_CONNECT_STEP] = user_input
-                return await self.async_step_energy_meter()
+                self.data[CONF_CONNECT_STEP] = {key: value for key, value in user_input.items() if key != CONF_SKIP_PROBE}
+                return await self.async_step_meter_mode()
         
         return self.async_show_form(step_id="connect", data_schema=CONNECT_SCHEMA, errors=errors)
     
+    async def async_step_meter_mode(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
+        """Choose how the grid meter publishes its power"""
+        if user_input is not None:
+            mode = MeterMode(user_input[CONF_METER_MODE])
+            if mode == MeterMode.NET:
+                return await self.async_step_net_meter()
+            if mode == MeterMode.PHASES:
+                return await self.async_step_phase_meter()
+            return await self.async_step_energy_meter()
+
+        return self.async_show_form(step_id="meter_mode", data_schema=METER_MODE_SCHEMA)
+
     async def async_step_energy_meter(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
         """Configure energy meter entity IDs"""
         errors = {}
 
         if user_input is not None:
-            self.data[CONF_ENERGY_METER_STEP] = user_input
+            self.data[CONF_ENERGY_METER_STEP] = {CONF_METER_MODE: MeterMode.IMPORT_EXPORT.value, **user_input}
             return await self.async_step_inj_tariff()
         
         return self.async_show_form(step_id="energy_meter", data_schema=ENERGY_METER_SCHEMA, errors=errors)
+
+    async def async_step_net_meter(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
+        """Configure the signed net power entity ID"""
+        if user_input is not None:
+            self.data[CONF_ENERGY_METER_STEP] = {CONF_METER_MODE: MeterMode.NET.value, **user_input}
+            return await self.async_step_inj_tariff()
+
+        return self.async_show_form(step_id="net_meter", data_schema=NET_METER_SCHEMA)
+
+    async def async_step_phase_meter(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
+        """Configure the signed power entity IDs of the phases"""
+        errors = {}
+
+        if user_input is not None:
+            if len(user_input[CONF_PHASE_PWR_ENT_IDS]) == 0:
+                errors["base"] = "invalid_input"
+            else:
+                self.data[CONF_ENERGY_METER_STEP] = {CONF_METER_MODE: MeterMode.PHASES.value, **user_input}
+                return await self.async_step_inj_tariff()
+
+        return self.async_show_form(step_id="phase_meter", data_schema=PHASE_METER_SCHEMA, errors=errors)
     
     async def async_step_inj_tariff(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
         """Configure SDAC injection tariff entity ID"""
@@ -96,4 +278,19 @@ class PvCurtailmentConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             self.data[CONF_INJ_TARIFF_STEP] = user_input
             return self.async_create_entry(title=DOMAIN, data=self.data)
         
-        return self.async_show_form(step_id="inj_tariff", data_schema=INJ_TARIFF_SCHEMA)
\ No newline at end of file
+        return self.async_show_form(step_id="inj_tariff", data_schema=INJ_TARIFF_SCHEMA)
+
+class PvCurtailmentOptionsFlow(config_entries.OptionsFlow):
+    """Options flow for the control settings of the PV Curtailment integration"""
+
+    async def async_step_init(self, user_input: dict[str, Any] | None = None) -> config_entries.ConfigFlowResult:
+        """Configure control options"""
+        if user_input is not None:
+            return self.async_create_entry(data=user_input)
+
+        # The options of the site are kept on its owner entry, show those for every entry of the site
+        options = dict(self.config_entry.options)
+        entry_data = self.hass.data.get(DOMAIN, {}).get(self.config_entry.entry_id)
+        if entry_data != None:
+            options = dict(entry_data[COORDINATOR].options)
+        return self.async_show_form(step_id="init", data_schema=options_schema(options))
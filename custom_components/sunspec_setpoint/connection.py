@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import random
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING
+from sunspec2.modbus.modbus import FUNC_READ_HOLDING, ModbusClientTCP, ModbusClientError
+
+from .const import RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY
+
+if TYPE_CHECKING:
+    import sunspec2.modbus.client as client
+
+_LOGGER = logging.getLogger(__name__)
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential reconnect delay with jitter, so devices behind one gateway don't retry in lockstep"""
+    delay = min(RECONNECT_MIN_DELAY * 2 ** attempt, RECONNECT_MAX_DELAY)
+    return random.uniform(delay / 2, delay)
+
+class SharedModbusConnection:
+    """Persistent Modbus TCP socket to one IP:port, shared by all slave IDs behind it"""
+
+    def __init__(self, ip: str, port: int, timeout: float) -> None:
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.socket: socket.socket | None = None
+        self.lock = threading.RLock()           # Only one request on the socket at a time
+        self.users: int = 0                     # Number of coordinators using this connection
+        self.last_activity: float = 0.0         # time.monotonic() of the last successful request
+        self.online_events: set[asyncio.Event] = set()  # Set by notify_online(), for slaves waiting to reconnect
+
+    def notify_online(self) -> None:
+        """A slave was read successfully, so the others don't have to wait out their reconnect backoff"""
+        for event in self.online_events:
+            event.set()
+
+    def ensure_connected(self) -> None:
+        """Open the socket if it is not open yet (blocking call)"""
+        with self.lock:
+            if self.socket != None:
+                return
+            try:
+                self.socket = socket.create_connection((self.ip, self.port), timeout=self.timeout)
+                self.socket.settimeout(self.timeout)
+            except OSError as e:
+                raise ModbusClientError(f"Connection error: {e}")
+            _LOGGER.info(f"Opened Modbus TCP connection to {self.ip}:{self.port}")
+
+    def close(self) -> None:
+        """Close the socket, the next request opens it again"""
+        with self.lock:
+            if self.socket == None:
+                return
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+
+class PooledModbusClientTCP(ModbusClientTCP):
+    """Modbus TCP client for one slave ID that sends its requests over a shared connection"""
+
+    def __init__(self, connection: SharedModbusConnection, slave_id: int) -> None:
+        super().__init__(slave_id=slave_id, ipaddr=connection.ip, ipport=connection.port, timeout=connection.timeout)
+        self.connection = connection
+
+    def connect(self, timeout=None) -> None:
+        self.connection.ensure_connected()
+
+    def disconnect(self) -> None:
+        """Keep the shared socket open, it is closed by the pool"""
+
+    def is_connected(self) -> bool:
+        return self.connection.socket != None
+
+    def _request(self, func, *args):
+        with self.connection.lock:
+            self.connection.ensure_connected()
+            self.socket = self.connection.socket
+            try:
+                result = func(*args)
+            except Exception:
+                # A failed request can leave a partial response on the socket, so don't reuse it
+                self.connection.close()
+                raise
+            finally:
+                self.socket = None
+            self.connection.last_activity = time.monotonic()
+            return result
+
+    def read(self, addr, count, op=FUNC_READ_HOLDING):
+        return self._request(super().read, addr, count, op)
+
+    def write(self, addr, data):
+        return self._request(super().write, addr, data)
+
+class ModbusConnectionPool:
+    """Hands out one shared connection per IP:port"""
+
+    def __init__(self) -> None:
+        self._connections: dict[tuple[str, int], SharedModbusConnection] = {}
+
+    def acquire(self, ip: str, port: int, timeout: float) -> SharedModbusConnection:
+        """Get the connection to IP:port, creating it if no coordinator uses it yet"""
+        connection = self._connections.get((ip, port))
+        if connection == None:
+            connection = SharedModbusConnection(ip=ip, port=port, timeout=timeout)
+            self._connections[(ip, port)] = connection
+        connection.users += 1
+        return connection
+
+    def release(self, connection: SharedModbusConnection) -> None:
+        """Release a connection, closing it when the last coordinator is done with it"""
+        connection.users -= 1
+        if connection.users <= 0:
+            connection.close()
+            self._connections.pop((connection.ip, connection.port), None)
+
+def pooled_device(connection: SharedModbusConnection, slave_id: int) -> "client.SunSpecModbusClientDeviceTCP":
+    """Create a SunSpec device that talks over a shared connection"""
+    import sunspec2.modbus.client as client  # loaded on first use, not when HA imports the integration
+    d = client.SunSpecModbusClientDeviceTCP(slave_id=slave_id, ipaddr=connection.ip, ipport=connection.port, timeout=connection.timeout)
+    d.client = PooledModbusClientTCP(connection=connection, slave_id=slave_id)
+    return d
@@ -1,23 +1,108 @@
-from enum import StrEnum
+from enum import IntEnum, StrEnum
 
 DOMAIN = "pv_curtailment"
 COORDINATOR = "coordinator"
-CONFIG = "config"
+INVERTER = "inverter"
+SITES = "sites"
+MODEL_CACHE = "model_cache"
+CONNECTION_POOL = "connection_pool"
+PLATFORMS = ["sensor", "switch"]
 
 CONF_INJ_TARIFF_ENT_ID = "injection_tariff_entity_id"
 CONF_PWR_IMP_ENT_ID = "power_import_entity_id"
 CONF_PWR_EXP_ENT_ID = "power_export_entity_id"
+CONF_METER_MODE = "meter_mode"
+CONF_NET_PWR_ENT_ID = "net_power_entity_id"
+CONF_PHASE_PWR_ENT_IDS = "phase_power_entity_ids"
+CONF_EXPORT_POSITIVE = "export_positive"
 CONF_INVERTER_BRAND = "inverter_brand"
 CONF_IP = "ip_address"
 CONF_PORT = "port"
 CONF_SLAVE_ID = "slave_id"
+CONF_MODBUS_TIMEOUT = "modbus_timeout"
+CONF_SKIP_PROBE = "skip_probe"  # Configure an inverter that is offline (e.g. at night) without probing it
 CONF_USER_STEP = "user_step"
 CONF_CONNECT_STEP = "connect_step"
+CONF_DISCOVERY_TARGET = "discovery_target"
+CONF_DISCOVERED_DEVICE = "discovered_device"
 CONF_ENERGY_METER_STEP = "energy_meter_step"
 CONF_INJ_TARIFF_STEP = "inj_tariff_step"
 
+# Options
+CONF_EVENT_MODE = "event_mode"
+CONF_DEBOUNCE = "debounce"
+CONF_MIN_WRITE_INTERVAL = "min_write_interval"
+CONF_MIN_DELTA_PCT = "min_delta_pct"
+CONF_MAX_WRITES_PER_HOUR = "max_writes_per_hour"
+CONF_VERIFY_WRITES = "verify_writes"
+CONF_CONTROLLER = "controller"
+CONF_KP = "kp"
+CONF_KI = "ki"
+CONF_KD = "kd"
+CONF_DEADBAND = "deadband"
+CONF_RAMP_RATE = "ramp_rate"
+CONF_TARGET_EXPORT = "target_export"
+CONF_INSTRUMENTATION = "instrumentation"
+CONF_CUTOFF_TARIFF = "cutoff_tariff"
+CONF_WIN_TMS = "limit_window_time"
+CONF_RVRT_TMS = "limit_reversion_time"
+CONF_RVRT_PCT = "limit_reversion_pct"
+CONF_RMP_TMS = "limit_ramp_time"
+CONF_NIGHT_POLL_INTERVAL = "night_poll_interval"
+CONF_FAST_POLL_INTERVAL = "fast_poll_interval"
+CONF_MEDIUM_POLL_INTERVAL = "medium_poll_interval"
+CONF_SLOW_POLL_INTERVAL = "slow_poll_interval"
+CONF_ADAPTIVE_INTERVAL = "adaptive_interval"
+CONF_MAX_POLL_INTERVAL = "max_poll_interval"
+CONF_PUBLISH_THRESHOLD = "publish_threshold"
+CONF_PUBLISH_MIN_INTERVAL = "publish_min_interval"
+CONF_PUBLISH_MAX_INTERVAL = "publish_max_interval"
+
 INJ_CUTOFF_TARIFF = 200  # [€/MwH] (200 as temporary testing value)
+DEFAULT_CUTOFF_TARIFF = INJ_CUTOFF_TARIFF  # curtail below this injection tariff, in the unit of the tariff entity
 UPDATE_INTERVAL = 10  # [s]
+DEFAULT_FAST_POLL_INTERVAL = UPDATE_INTERVAL  # [s] update interval, the inverter power is read and the setpoint calculated every update
+DEFAULT_MEDIUM_POLL_INTERVAL = 60  # [s] power limit read-back and operating state
+DEFAULT_SLOW_POLL_INTERVAL = 3600  # [s] rating and scale factors
+MIN_FAST_POLL_INTERVAL = 0.5  # [s]
+DEFAULT_ADAPTIVE_INTERVAL = False  # poll slower than the fast poll interval while the grid is steady and nothing is curtailed
+DEFAULT_MAX_POLL_INTERVAL = 60  # [s] slowest adaptive update interval
+ADAPTIVE_BACKOFF = 1.5  # factor the adaptive update interval grows by per steady update
+ADAPTIVE_WINDOW = 10  # updates the volatility is judged on
+VOLATILITY_THRESHOLD = 100  # [W] grid power standard deviation above which the grid is volatile
+OSCILLATION_THRESHOLD = 2  # setpoint reversals within the window from which the control counts as oscillating
+HISTORY_SIZE = 60  # updates kept in the rolling history
+WATCHDOG_INTERVAL = 60  # [s] fallback update interval in event mode
+DEFAULT_EVENT_MODE = False  # recalculate on grid meter state changes instead of polling
+DEFAULT_NIGHT_POLL_INTERVAL = 900  # [s] update interval while the inverters sleep at night, 0 to stop polling until sunrise
+NIGHT_SUN_ELEVATION = -3  # [°] below this sun elevation idle or unreachable inverters are considered asleep
+SUN_ENTITY_ID = "sun.sun"
+DEFAULT_DEBOUNCE = 1.0  # [s] min time between two event triggered updates
+DEFAULT_MIN_WRITE_INTERVAL = 2.0  # [s] min time between two setpoint writes to an inverter
+DEFAULT_MIN_DELTA_PCT = 1.0  # [%] smaller setpoint changes are not written
+DEFAULT_MAX_WRITES_PER_HOUR = 360  # setpoint write budget per inverter per rolling hour
+DEFAULT_VERIFY_WRITES = True  # read the setpoint back after writing it
+DEFAULT_WIN_TMS = 0  # [s] time window in which the inverter applies a new power limit, 0 for immediately
+DEFAULT_RVRT_TMS = 0  # [s] the inverter reverts the power limit if it isn't written again within this time, 0 to never revert
+DEFAULT_RVRT_PCT = 100  # [%] power limit the inverter reverts to (model 704 only, model 123 reverts to no limit)
+DEFAULT_RMP_TMS = 0  # [s] time the inverter takes to ramp to a new power limit (model 123 only), 0 for the default ramp
+DEFAULT_PUBLISH_THRESHOLD = 10  # [W] smaller power and setpoint changes are not written to the recorder
+DEFAULT_PUBLISH_MIN_INTERVAL = 10  # [s] min time between two recorded power and setpoint values
+DEFAULT_PUBLISH_MAX_INTERVAL = 300  # [s] power and setpoint values are recorded at least this often
+DEFAULT_INSTRUMENTATION = False  # record update phase timings and Modbus latency histograms
+DEFAULT_MODBUS_TIMEOUT = 3  # [s] max duration of a single Modbus call
+MAX_READ_COUNT = 125  # max number of registers in one Modbus read request
+KEEPALIVE_INTERVAL = 30  # [s] idle time after which the connection is checked with a small read
+RECONNECT_MIN_DELAY = 1  # [s] first reconnect delay, doubled after every failed attempt
+RECONNECT_MAX_DELAY = 300  # [s] max reconnect delay
+RECONNECT_PROBE_INTERVAL = 10  # [s] TCP reachability check while waiting to reconnect
+DISCOVERY_PORTS = [502, 1502]  # Modbus TCP ports probed for SunSpec devices
+DISCOVERY_SLAVE_IDS = [1, 2, 3, 126]  # Slave IDs probed on every port, 126 is the SMA default
+DISCOVERY_TIMEOUT = 1.0  # [s] per connection attempt and request while discovering
+DISCOVERY_CONCURRENCY = 32  # max simultaneous discovery connections
+MAX_DISCOVERY_HOSTS = 1024  # max addresses of a discovered subnet
+METER_MAX_SKEW = 1.0  # [s] max time between the reports of the grid meter entities of one reading
+LIMIT_VIOLATION_MARGIN = 500  # [W] export above the target export that triggers an emergency curtailment in event mode
 
 # Supported brands
 class Brand(StrEnum):
@@ -28,6 +113,32 @@ class Brand(StrEnum):
     SMA = "sma"
     SOLAREDGE = "solaredge"
 
+# Grid meter inputs
+class MeterMode(StrEnum):
+    IMPORT_EXPORT = "import_export"  # separate import and export power entities
+    NET = "net"                      # one signed net power entity
+    PHASES = "phases"                # one signed power entity per phase, summed
+
+# Setpoint controller strategies
+class ControllerType(StrEnum):
+    RULE = "rule"  # setpoint = PV + import, or PV - export
+    PID = "pid"    # closed loop PI(D) controller on the grid power
+
+# Priorities of the commands that access the inverters, lower runs first and preempts higher
+class CommandPriority(IntEnum):
+    SAFETY = 0   # protective commands: the system switch off (100 %) and emergency curtailments
+    USER = 1     # user actions, like turning the system switch on
+    CONTROL = 2  # routine control updates
+
+DEFAULT_CONTROLLER = ControllerType.RULE
+DEFAULT_KP = 0.3  # [-]
+DEFAULT_KI = 0.05  # [1/s]
+DEFAULT_KD = 0.0  # [s]
+DEFAULT_DEADBAND = 20  # [W]
+DEFAULT_RAMP_RATE = 0  # [W/s] 0 for no limit
+DEFAULT_TARGET_EXPORT = 0  # [W]
+CONTROLLER_OPTIONS = [CONF_CONTROLLER, CONF_KP, CONF_KI, CONF_KD, CONF_DEADBAND, CONF_RAMP_RATE, CONF_TARGET_EXPORT]
+
 # default slave ID mapping for each Brand:
 SLAVE_ID_MAP = {
     Brand.SMA: 126,
@@ -45,13 +156,38 @@ CONTROLS_MID = 123
 DER_MEASURE_AC_MID = 701
 DER_CAPACITY_MID = 702
 DER_CTL_AC_MID = 704
+# Models a device is checked for, the definitions of other models are never loaded
+SUPPORTED_MIDS = [
+    DER_MEASURE_AC_MID, INVERTER_SINGLE_PHASE_MID, INVERTER_SPLIT_PHASE_MID, INVERTER_THREE_PAHSE_MID,
+    DER_CTL_AC_MID, CONTROLS_MID,
+    DER_CAPACITY_MID, NAMEPLATE_MID,
+]
 
 # SunSpec offsets
     # 100 series
 WRTG_OFFSET_1XX = 3  # rated nominal power of inverter
 W_OFFSET_1XX = 14  # AC power
 WMAXLIMPCT_OFFSET_1XX = 5  # Set power output to specified level
+WINTMS_OFFSET_1XX = 6  # Time window for the power limit change
+RVRTTMS_OFFSET_1XX = 7  # Timeout period for the power limit
+RMPTMS_OFFSET_1XX = 8  # Ramp time for moving from the current to the new power limit
+WMAXLIM_ENA_OFFSET_1XX = 9  # Power limit enabled
+ST_OFFSET_1XX = 38  # Operating state
     # 700 series
 WRTG_OFFSET_7XX = 2
 W_OFFSET_7XX = 10
-WMAXLIMPCT_OFFSET_7XX = 15
\ No newline at end of file
+WMAXLIMPCT_OFFSET_7XX = 15
+WMAXLIMPCT_ENA_OFFSET_7XX = 14  # Power limit enabled
+WMAXLIMPCT_RVRT_OFFSET_7XX = 16  # Power limit to revert to
+WMAXLIMPCT_ENA_RVRT_OFFSET_7XX = 17  # Reversion enabled
+WMAXLIMPCT_RVRT_TMS_OFFSET_7XX = 18  # Reversion time
+INVST_OFFSET_7XX = 4  # Inverter state
+
+# Operating states in which the inverter doesn't produce: off, sleeping and standby
+IDLE_STATES_1XX = (1, 2, 8)
+IDLE_STATES_7XX = (0, 1, 7)
+
+# SolarEdge proprietary power control registers
+    # Advanced power control has to be enabled on the inverter for the active power limit to be used
+SOLAREDGE_ACTIVE_POWER_LIMIT_ADDR = 0xF001  # uint16 [%]
+SOLAREDGE_MAX_ACTIVE_POWER_ADDR = 0xF304  # float32 [W] with the low word first, used as rating if the device has no ratings model
\ No newline at end of file
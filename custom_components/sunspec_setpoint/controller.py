@@ -0,0 +1,108 @@
+import abc
+import logging
+
+from typing import Any, Mapping
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+class SetpointController(abc.ABC):
+    """Strategy that calculates the site setpoint while curtailing, it can keep state across updates"""
+
+    needs_new_meter_data: bool = True  # Keep the previous setpoint while the energy meter hasn't updated
+
+    def reset(self) -> None:
+        """Forget controller state, called when curtailing stops"""
+
+    @abc.abstractmethod
+    def calc_setpoint_W(self, pwr_import: float, pwr_export: float, pwr_PV: float, pwr_rated: float, now: float) -> float:
+        """Return the setpoint in Watt, now is a monotonic timestamp in seconds"""
+
+class RuleController(SetpointController):
+    """One-step rule: PV + import when importing, PV - export when exporting"""
+
+    def calc_setpoint_W(self, pwr_import: float, pwr_export: float, pwr_PV: float, pwr_rated: float, now: float) -> float:
+        if pwr_import > 5:
+            sp = min(pwr_PV + pwr_import, pwr_rated)  # don't go above max power
+            _LOGGER.info(f"PV setpoint calculated during curtailing and importing from grid, PV: {pwr_PV} W, import: {pwr_import} W, export: {pwr_export} W, setpoint: {sp} W")
+            return sp
+
+        else: # injecting during negative price
+            sp = max(pwr_PV - pwr_export, 0)  # no negative power
+            _LOGGER.info(f"PV setpoint calculated during curtailing and exporting to grid, PV: {pwr_PV} W, import: {pwr_import} W, export: {pwr_export} W, setpoint: {sp} W")
+            return sp
+
+class PIDController(SetpointController):
+    """
+    PI(D) controller on the grid power, in velocity form: every update changes the previous
+    setpoint instead of recomputing it from the (possibly stale) inverter power.
+    Clamping the setpoint between 0 and the rating is the anti-windup, the integral
+    can't grow while the output is saturated.
+    """
+
+    needs_new_meter_data = False  # A steady grid power error keeps integrating
+
+    def __init__(
+            self,
+            kp: float = DEFAULT_KP,
+            ki: float = DEFAULT_KI,
+            kd: float = DEFAULT_KD,
+            deadband: float = DEFAULT_DEADBAND,
+            ramp_rate: float = DEFAULT_RAMP_RATE,
+            target_export: float = DEFAULT_TARGET_EXPORT,
+    ) -> None:
+        self.kp = kp                        # Proportional gain [-]
+        self.ki = ki                        # Integral gain [1/s]
+        self.kd = kd                        # Derivative gain [s]
+        self.deadband = deadband            # [W] grid power errors smaller than this are ignored
+        self.ramp_rate = ramp_rate          # [W/s] max setpoint change rate, 0 for no limit
+        self.target_export = target_export  # [W] grid export to settle at
+        self.reset()
+
+    def reset(self) -> None:
+        self.sp: float | None = None        # Previous setpoint [W]
+        self.last_time: float | None = None
+        self.last_error: float = 0.0
+        self.prev_last_error: float = 0.0
+
+    def calc_setpoint_W(self, pwr_import: float, pwr_export: float, pwr_PV: float, pwr_rated: float, now: float) -> float:
+        # Positive error: more grid power available for PV than targeted, so the setpoint can go up
+        error = pwr_import - pwr_export + self.target_export
+        if abs(error) < self.deadband:
+            error = 0.0
+
+        if self.sp == None or self.last_time == None:
+            # Bumpless start from the current inverter power
+            self.sp, self.last_time = pwr_PV, now
+            self.last_error = self.prev_last_error = error
+        dt = max(now - self.last_time, 1e-3)
+
+        delta = (
+            self.kp * (error - self.last_error) +
+            self.ki * error * dt +
+            self.kd * (error - 2 * self.last_error + self.prev_last_error) / dt
+        )
+        if self.ramp_rate > 0:
+            max_delta = self.ramp_rate * dt
+            delta = min(max(delta, -max_delta), max_delta)
+
+        self.sp = min(max(self.sp + delta, 0), pwr_rated)
+        self.last_time = now
+        self.prev_last_error, self.last_error = self.last_error, error
+        _LOGGER.debug(f"PID setpoint calculated, PV: {pwr_PV} W, import: {pwr_import} W, export: {pwr_export} W, error: {error} W, setpoint: {self.sp} W")
+        return self.sp
+
+def controller_from_options(options: Mapping[str, Any]) -> SetpointController:
+    """Create the controller strategy selected in the options"""
+    strategy = options.get(CONF_CONTROLLER, DEFAULT_CONTROLLER)
+    if strategy == ControllerType.PID:
+        return PIDController(
+            kp=float(options.get(CONF_KP, DEFAULT_KP)),
+            ki=float(options.get(CONF_KI, DEFAULT_KI)),
+            kd=float(options.get(CONF_KD, DEFAULT_KD)),
+            deadband=float(options.get(CONF_DEADBAND, DEFAULT_DEADBAND)),
+            ramp_rate=float(options.get(CONF_RAMP_RATE, DEFAULT_RAMP_RATE)),
+            target_export=float(options.get(CONF_TARGET_EXPORT, DEFAULT_TARGET_EXPORT)),
+        )
+    return RuleController()
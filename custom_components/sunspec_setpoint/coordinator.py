@@ -1,10 +1,9 @@
 import logging
 import datetime
 import asyncio
-import sunspec2.modbus.client as client
-from sunspec2.modbus.client import SunSpecModbusClientDeviceTCP
+import time
 
-from typing import Any
+from typing import Any, Mapping
 from homeassistant.helpers.update_coordinator import (
     CoordinatorEntity,
     DataUpdateCoordinator,
@@ -12,12 +11,41 @@ from homeassistant.helpers.update_coordinator import (
 )
 from homeassistant import config_entries
 from homeassistant.helpers.typing import ConfigType
-from homeassistant.core import HomeAssistant, State
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.event import async_call_later, async_track_point_in_utc_time, async_track_state_change_event
+from homeassistant.util import dt as dt_util
 from .const import *
+from .inverter import SunSpecInverter
+from .controller import SetpointController, controller_from_options
+from .tariff import TariffEngine
+from .publisher import PublishSettings
+from .command_queue import CommandPreempted, CommandQueue
+from .history import TickHistory
+from .meter import GridMeter, MeterSnapshot, PowerStateConverter, grid_meter_from_config
+from .instrumentation import PHASE_CALC, PHASE_READ, PHASE_STATE_FETCH, PHASE_WRITE, LatencyHistogram, UpdateTimings
 
 _LOGGER = logging.getLogger(__name__)
 
+def site_key(config: Mapping[str, Any]) -> tuple[str, ...]:
+    """Inverters configured with the same grid meter and tariff entities are controlled as one site"""
+    meter = grid_meter_from_config(config[CONF_ENERGY_METER_STEP], PowerStateConverter())
+    return (*meter.entity_ids, config[CONF_INJ_TARIFF_STEP][CONF_INJ_TARIFF_ENT_ID])
+
+def site_owner(hass: HomeAssistant, config_entry: config_entries.ConfigEntry) -> config_entries.ConfigEntry:
+    """
+    Oldest enabled config entry of the site of config_entry, it holds the switch, the site sensors and
+    the options. It doesn't depend on the order in which the entries are set up
+    """
+    key = site_key(config_entry.data)
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        if entry.disabled_by == None and site_key(entry.data) == key:
+            return entry
+    return config_entry
+
 class PvCurtailingCoordinator(DataUpdateCoordinator):
+    """Controls all inverters behind one grid meter, polling and writing them concurrently"""
+
     def __init__(
             self,
             hass: HomeAssistant,
@@ -29,292 +57,434 @@ class PvCurtailingCoordinator(DataUpdateCoordinator):
             name="PV_Curtailing_coordinator",
             config_entry=None,
             update_interval=datetime.timedelta(seconds=UPDATE_INTERVAL),
+            request_refresh_debouncer=Debouncer(hass, _LOGGER, cooldown=DEFAULT_DEBOUNCE, immediate=True),
         )
-        self.setpoint_W: int | None = None          # Holds setpoint in Watt
-        self.last_setpoint_W: int | None = None     # Last sent setpoint
-        self.W: float | None = None                 # Holds power of inverter
+        self.setpoint_W: int | None = None          # Holds site setpoint in Watt
+        self.W: float | None = None                 # Holds summed power of the inverters
         self.setpoint_pct: float | None = None      # Holds setpoint in percentage
         self.last_import_pwr: float | None = None   # Holds previous import pwr from DSMR
         self.last_export_pwr: float | None = None   # Holds previous export pwr from DSMR
-        self.d = None                               # SunSpec client device
-        self.WRtg: int | None = None                # Rated inverter power
+        self.last_meter_time: datetime.datetime | None = None  # Timestamp of the meter reading used for the setpoint
+        self.WRtg: int | None = None                # Summed rated power of the inverters
         self.shutdown_flag: bool = False            # flag for disabling async_update_data()
+        self.curtailing: bool = False               # Injection tariff was below the cutoff in the last calculation
         self.system_switch: bool = False            # System on or off, set by switch entity
-        self.sleep: bool = False                    # Sleep mode on or off (when reconnecting)
-        self.sunspec_setup_success: bool = False    # Indicate whether sunspec connection was successfully set up
-
-        # SunSpec models and offsets
-        self.measurands_mid: int | None = None
-        self.controls_mid: int | None = None
-        self.rating_mid: int | None = None
-        self.W_offset: int | None = None
-        self.WRtg_offset: int | None = None
-        self.WMaxLimPct_offset: int | None = None
+        self.inverters: list[SunSpecInverter] = []  # Inverters of this site, one per config entry
+        owner = site_owner(hass, config_entry)
+        self.owner_entry_id: str = owner.entry_id   # Oldest config entry of the site, it holds the switch and the options
+        self.event_mode: bool = DEFAULT_EVENT_MODE  # Recalculate on grid meter changes, polling only as watchdog
+        self.options: Mapping[str, Any] = {}        # Options of the owner entry
+        self._unsub_state_events: CALLBACK_TYPE | None = None
+        self.controller: SetpointController = controller_from_options({})  # Calculates the setpoint while curtailing
+        self.controller_options: dict[str, Any] = {}
+        self.timings = UpdateTimings()              # Phase timings of the updates, while instrumentation is on
+        self.power_converter = PowerStateConverter()  # Converts the grid meter states to Watt with cached units
+        self._unsub_meter_retry: CALLBACK_TYPE | None = None
+        self.tariff = TariffEngine(cutoff=DEFAULT_CUTOFF_TARIFF)  # Day-ahead tariff schedule and curtailment windows
+        self._unsub_tariff_transition: CALLBACK_TYPE | None = None
+        self.publish_settings = PublishSettings()   # When the power and setpoint sensors write their state
+        self.night: bool = False                    # Sun is down and the inverters sleep, polled at the night interval
+        self.night_poll_interval: float = DEFAULT_NIGHT_POLL_INTERVAL  # [s] 0 to stop polling until sunrise
+        self._unsub_sun: CALLBACK_TYPE | None = None
+        self.fast_poll_interval: float = DEFAULT_FAST_POLL_INTERVAL  # [s] update interval while polling
+        self.commands = CommandQueue()              # Single writer for the inverters, user commands preempt control updates
+        self._emergency_task: asyncio.Task | None = None  # Running emergency curtailment
+        self.history = TickHistory()                # Rolling history of the last updates
+        self.adaptive_interval: bool = DEFAULT_ADAPTIVE_INTERVAL  # Poll slower while the grid is steady
+        self.max_poll_interval: float = DEFAULT_MAX_POLL_INTERVAL  # [s] slowest adaptive update interval
+        self.poll_interval: float = DEFAULT_FAST_POLL_INTERVAL  # [s] current update interval while polling, adapted to the volatility
 
         # unpack config
-        config = hass.data[DOMAIN][CONFIG]
+        config = config_entry.data
         self.inj_trf_ent_id: str = config[CONF_INJ_TARIFF_STEP][CONF_INJ_TARIFF_ENT_ID]
-        self.pwr_imp_ent_id: str = config[CONF_ENERGY_METER_STEP][CONF_PWR_IMP_ENT_ID]
-        self.pwr_exp_ent_id: str = config[CONF_ENERGY_METER_STEP][CONF_PWR_EXP_ENT_ID]
-        self.IP:             str = config[CONF_CONNECT_STEP][CONF_IP]
-        self.PORT                = int(config[CONF_CONNECT_STEP][CONF_PORT])
-        self.SLAVE_ID            = int(config[CONF_CONNECT_STEP][CONF_SLAVE_ID])
-        self.brand: Brand        = Brand(str(config[CONF_USER_STEP][CONF_INVERTER_BRAND]).lower())
+        self.meter: GridMeter = grid_meter_from_config(config[CONF_ENERGY_METER_STEP], self.power_converter)
+
+        # The callbacks are stopped by async_shutdown() when the site is unloaded, not with the entry
+        # that happened to set up first
+        self.apply_options(owner.options)
     
     async def _async_setup(self) -> None:
         """Set up coordinator"""
 
-    def sunspec_setup(self) -> None:
-        """Connect to SunSpec device for config through yaml"""
+    def apply_options(self, options: Mapping[str, Any]) -> None:
+        """Apply the control options of the owner entry"""
+        self.options = options
+        self.tariff.set_cutoff(float(options.get(CONF_CUTOFF_TARIFF, DEFAULT_CUTOFF_TARIFF)))
+        self.publish_settings.configure(
+            threshold=float(options.get(CONF_PUBLISH_THRESHOLD, DEFAULT_PUBLISH_THRESHOLD)),
+            min_interval=float(options.get(CONF_PUBLISH_MIN_INTERVAL, DEFAULT_PUBLISH_MIN_INTERVAL)),
+            max_interval=float(options.get(CONF_PUBLISH_MAX_INTERVAL, DEFAULT_PUBLISH_MAX_INTERVAL)),
+        )
+        self.timings.enabled = bool(options.get(CONF_INSTRUMENTATION, DEFAULT_INSTRUMENTATION))
+        for inverter in self.inverters:
+            self.apply_write_options(inverter)
+            self.apply_instrumentation(inverter)
+        if self._debounced_refresh != None:
+            self._debounced_refresh.cooldown = float(options.get(CONF_DEBOUNCE, DEFAULT_DEBOUNCE))
+        self.event_mode = bool(options.get(CONF_EVENT_MODE, DEFAULT_EVENT_MODE))
+        self.night_poll_interval = float(options.get(CONF_NIGHT_POLL_INTERVAL, DEFAULT_NIGHT_POLL_INTERVAL))
+        self.fast_poll_interval = max(float(options.get(CONF_FAST_POLL_INTERVAL, DEFAULT_FAST_POLL_INTERVAL)), MIN_FAST_POLL_INTERVAL)
+        self.adaptive_interval = bool(options.get(CONF_ADAPTIVE_INTERVAL, DEFAULT_ADAPTIVE_INTERVAL))
+        self.max_poll_interval = max(float(options.get(CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL)), self.fast_poll_interval)
+        self.poll_interval = self.fast_poll_interval
+        for inverter in self.inverters:
+            inverter.night_poll_interval = self.night_poll_interval
+            self.apply_poll_options(inverter)
+
+        # Only replace the controller if its settings changed, so it keeps its state otherwise
+        controller_options = {key: options.get(key) for key in CONTROLLER_OPTIONS}
+        if controller_options != self.controller_options:
+            self.controller = controller_from_options(options)
+            self.controller_options = controller_options
+        if self.event_mode:
+            self.start_event_mode()
+        else:
+            self.stop_event_mode()
+
+    def start_event_mode(self) -> None:
+        """Recalculate as soon as the grid meter or tariff changes, the fixed poll only remains as watchdog"""
+        if self._unsub_state_events == None:
+            self._unsub_state_events = async_track_state_change_event(
+                self.hass, [*self.meter.entity_ids, self.inj_trf_ent_id], self._async_state_changed
+            )
+        self.apply_update_interval()
+
+    @callback
+    def stop_event_mode(self) -> None:
+        """Go back to polling at the fast poll interval"""
+        if self._unsub_state_events != None:
+            self._unsub_state_events()
+            self._unsub_state_events = None
+        self.apply_update_interval()
 
-        _LOGGER.info("Setting up SunSpec connection")
-        self.shutdown_flag = False
-        # Connect to inverter with sunspec
+    def apply_update_interval(self) -> None:
+        """Poll at the night interval (or not at all) at night, as watchdog in event mode, else at the (adaptive) poll interval"""
+        if self.night:
+            self.update_interval = datetime.timedelta(seconds=self.night_poll_interval) if self.night_poll_interval > 0 else None
+        elif self._unsub_state_events != None:
+            self.update_interval = datetime.timedelta(seconds=WATCHDOG_INTERVAL)
+        else:
+            self.update_interval = datetime.timedelta(seconds=self.poll_interval)
+
+    def adapt_poll_interval(self) -> None:
+        """
+        Poll at the fast interval while curtailing, while the grid power is volatile or while the setpoint
+        oscillates. While it's steady the interval grows step by step up to the max poll interval
+        """
+        if not self.adaptive_interval:
+            return
+        stats = self.history.stats(window=ADAPTIVE_WINDOW)
+        variance = stats["grid_variance_W2"]
+        volatile = (
+            self.curtailing
+            or stats["samples"] < ADAPTIVE_WINDOW
+            or (variance != None and variance >= VOLATILITY_THRESHOLD ** 2)
+            or stats["oscillation_count"] >= OSCILLATION_THRESHOLD
+        )
+        if volatile:
+            poll_interval = self.fast_poll_interval
+        else:
+            poll_interval = min(self.poll_interval * ADAPTIVE_BACKOFF, self.max_poll_interval)
+        if poll_interval != self.poll_interval:
+            _LOGGER.debug(f"Grid is {'volatile' if volatile else 'steady'}, polling every {poll_interval:.1f} s")
+            self.poll_interval = poll_interval
+            self.apply_update_interval()
+
+    @callback
+    def _async_state_changed(self, event: Event) -> None:
+        """Request a debounced update when a grid meter or tariff entity changes, curtail right away on a limit violation"""
+        if self.night:
+            return  # nothing to control while the inverters sleep
+        if self.limit_violated():
+            if self._emergency_task == None or self._emergency_task.done():
+                self._emergency_task = self.hass.async_create_task(self.async_emergency_curtail())
+            return
+        self.hass.async_create_task(self.async_request_refresh())
+
+    def limit_violated(self) -> bool:
+        """The grid export is far above the target export while curtailing"""
+        if not self.system_switch or not self.curtailing:
+            return False
+        net_W = self.meter.current_net_power(self.hass)
+        target_export = float(self.options.get(CONF_TARGET_EXPORT, DEFAULT_TARGET_EXPORT))
+        return net_W != None and -net_W > target_export + LIMIT_VIOLATION_MARGIN
+
+    async def async_emergency_curtail(self) -> None:
+        """Update as safety command, it preempts a running control update and isn't held back by the write gate"""
+        if self.shutdown_flag:
+            return
+        _LOGGER.debug("Grid export exceeds the target, curtailing right away")
         try:
-            self.d = client.SunSpecModbusClientDeviceTCP(slave_id=self.SLAVE_ID, ipaddr=self.IP, ipport=self.PORT)
-            self.d.scan()
-        except Exception as e:
-            _LOGGER.error(f"Failed to connect to SunSpec device, error: {e}")
+            data = await self.commands.run(CommandPriority.SAFETY, lambda: self.async_control(force=True), name="Emergency curtailment")
+        except CommandPreempted:
             return
-        
-        # Check which models and offsets to use for read and write
-        self.set_models_and_offsets(d=self.d)
-        if None in [self.rating_mid, self.controls_mid, self.measurands_mid]:
-            self.shutdown_flag = True
+        self.async_set_updated_data(data)
+
+    def sun_elevation(self) -> float | None:
+        """Elevation of the sun from the sun integration, None if it isn't set up"""
+        state = self.hass.states.get(SUN_ENTITY_ID)
+        if state == None:
+            return None
+        try:
+            return float(state.attributes["elevation"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def update_night_mode(self) -> None:
+        """
+        Enter night mode when the sun is down and every inverter reports an idle state or doesn't answer,
+        leave it when an inverter produces again. Without the sun integration there is no night mode
+        """
+        elevation = self.sun_elevation()
+        sun_down = elevation != None and elevation < NIGHT_SUN_ELEVATION
+        asleep = all(inverter.idle or not inverter.available for inverter in self.inverters)
+        self.set_night(sun_down and asleep)
+
+    def set_night(self, night: bool) -> None:
+        if night == self.night:
             return
+        self.night = night
+        for inverter in self.inverters:
+            inverter.night = night
+            if not night:
+                inverter.network_event.set()  # reconnect right away instead of waiting for the night interval
+        self.apply_update_interval()
+        if night:
+            _LOGGER.info("Inverters are asleep and the sun is down, polling at the night interval until sunrise")
+            if self._unsub_sun == None:
+                self._unsub_sun = async_track_state_change_event(self.hass, [SUN_ENTITY_ID], self._async_sun_changed)
+        else:
+            _LOGGER.info("Inverters are awake or the sun is up, resuming normal polling")
+            self.stop_sun_tracking()
 
-        # Get power rating of inverter
-        rating = self.offset_get(d=self.d, mid=self.rating_mid, trg_offset=self.WRtg_offset) # pyright: ignore[reportArgumentType]
-        if rating != None:
-            self.WRtg = int(rating)
-        _LOGGER.info(f"Max rated power read from SunSpec device: {rating} W")
+    @callback
+    def stop_sun_tracking(self) -> None:
+        if self._unsub_sun != None:
+            self._unsub_sun()
+            self._unsub_sun = None
+
+    @callback
+    def _async_sun_changed(self, event: Event) -> None:
+        """Leave night mode at sunrise"""
+        elevation = self.sun_elevation()
+        if elevation != None and elevation >= NIGHT_SUN_ELEVATION:
+            self.set_night(False)
+            self.hass.async_create_task(self.async_request_refresh())
+
+    def schedule_meter_retry(self) -> None:
+        """Update again once the rest of a half reported meter reading had the time to arrive"""
+        if self._unsub_meter_retry == None:
+            self._unsub_meter_retry = async_call_later(self.hass, self.meter.max_skew, self._async_meter_retry)
+
+    @callback
+    def cancel_meter_retry(self) -> None:
+        if self._unsub_meter_retry != None:
+            self._unsub_meter_retry()
+            self._unsub_meter_retry = None
+
+    @callback
+    def _async_meter_retry(self, now: datetime.datetime) -> None:
+        self._unsub_meter_retry = None
+        self.hass.async_create_task(self.async_request_refresh())
+
+    def schedule_tariff_transition(self) -> None:
+        """Update right at the next start or end of a curtailment window, instead of up to one poll later"""
+        self.cancel_tariff_transition()
+        transition = self.tariff.next_transition(dt_util.utcnow())
+        if transition != None:
+            _LOGGER.debug(f"Next curtailment transition at {transition}")
+            self._unsub_tariff_transition = async_track_point_in_utc_time(self.hass, self._async_tariff_transition, transition)
+
+    @callback
+    def cancel_tariff_transition(self) -> None:
+        if self._unsub_tariff_transition != None:
+            self._unsub_tariff_transition()
+            self._unsub_tariff_transition = None
+
+    @callback
+    def _async_tariff_transition(self, now: datetime.datetime) -> None:
+        self._unsub_tariff_transition = None
+        self.schedule_tariff_transition()
+        self.hass.async_create_task(self.async_request_refresh())
+
+    def apply_write_options(self, inverter: SunSpecInverter) -> None:
+        """Configure write gating of an inverter from the site options"""
+        inverter.write_gate.configure(
+            min_delta_pct=float(self.options.get(CONF_MIN_DELTA_PCT, DEFAULT_MIN_DELTA_PCT)),
+            min_interval=float(self.options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL)),
+            max_writes_per_hour=int(self.options.get(CONF_MAX_WRITES_PER_HOUR, DEFAULT_MAX_WRITES_PER_HOUR)),
+        )
+        inverter.verify_writes = bool(self.options.get(CONF_VERIFY_WRITES, DEFAULT_VERIFY_WRITES))
+        inverter.win_tms = int(self.options.get(CONF_WIN_TMS, DEFAULT_WIN_TMS))
+        inverter.rvrt_tms = int(self.options.get(CONF_RVRT_TMS, DEFAULT_RVRT_TMS))
+        inverter.rvrt_pct = float(self.options.get(CONF_RVRT_PCT, DEFAULT_RVRT_PCT))
+        inverter.rmp_tms = int(self.options.get(CONF_RMP_TMS, DEFAULT_RMP_TMS))
+
+    def apply_instrumentation(self, inverter: SunSpecInverter) -> None:
+        """Record the Modbus round-trip times of an inverter while instrumentation is on"""
+        if not self.timings.enabled:
+            inverter.io.histogram = None
+        elif inverter.io.histogram == None:
+            inverter.io.histogram = LatencyHistogram()
+
+    def apply_poll_options(self, inverter: SunSpecInverter) -> None:
+        """Configure how often the medium and slow point groups of an inverter are read"""
+        inverter.scheduler.configure(
+            medium_interval=float(self.options.get(CONF_MEDIUM_POLL_INTERVAL, DEFAULT_MEDIUM_POLL_INTERVAL)),
+            slow_interval=float(self.options.get(CONF_SLOW_POLL_INTERVAL, DEFAULT_SLOW_POLL_INTERVAL)),
+        )
+
+    def add_inverter(self, inverter: SunSpecInverter) -> None:
+        """Add an inverter to the site, if there are several the site setpoint is split between them"""
+        self.apply_write_options(inverter)
+        self.apply_instrumentation(inverter)
+        self.apply_poll_options(inverter)
+        inverter.night = self.night
+        inverter.night_poll_interval = self.night_poll_interval
+        self.inverters.append(inverter)
+        if len(self.inverters) > 1:
+            _LOGGER.info(f"Fleet mode: {len(self.inverters)} inverters are controlled with the same grid meter")
+
+    def remove_inverter(self, inverter: SunSpecInverter) -> None:
+        """Stop controlling an inverter whose config entry is unloaded"""
+        if inverter in self.inverters:
+            self.inverters.remove(inverter)
+
+    async def async_shutdown(self) -> None:
+        """Stop updating and cancel the scheduled callbacks, called when the site is unloaded"""
+        self.shutdown_flag = True
+        self.stop_event_mode()
+        self.cancel_meter_retry()
+        self.cancel_tariff_transition()
+        self.stop_sun_tracking()
+        await super().async_shutdown()
+
+    async def async_set_system_switch(self, on: bool) -> None:
+        """
+        Turn the system on or off and apply it right away, instead of at the next update. Turning it on runs
+        as user command and turning it off (back to 100 %) as safety command, both preempt a running control update
+        """
+        self.system_switch = on
+        if self.shutdown_flag:
+            return
+        priority = CommandPriority.USER if on else CommandPriority.SAFETY
+        try:
+            data = await self.commands.run(priority, self.async_control, name="System switch")
+        except CommandPreempted:
+            return  # a safety command took over
+        self.async_set_updated_data(data)
 
-        # SunSpec setup successful
-        self.sunspec_setup_success = True
-    
     async def _async_update_data(self) -> dict[str, Any]:
-        """Read, calculate setpoint and write every {UPDATE_INTERVAL} seconds"""
-        if self.shutdown_flag or self.sleep:
-            return {}
-        
-        if self.d == None:
-            await self.try_reconnect()
+        """Read, calculate setpoint and write, every fast poll interval"""
+        if self.shutdown_flag:
             return {}
+        try:
+            return await self.commands.run(CommandPriority.CONTROL, self.async_control, name="Control update")
+        except CommandPreempted:
+            _LOGGER.debug("Control update was preempted by a user or safety command")
+            return self.data or {}
+
+    async def async_control(self, force: bool = False) -> dict[str, Any]:
+        """Read the inverters, calculate the setpoint and write it, only run through the command queue. force bypasses the write gate"""
+        self.timings.start_update()
 
         # Read states from dependant sensors
         inj_tariff_state = self.hass.states.get(self.inj_trf_ent_id)
-        pwr_import_state = self.hass.states.get(self.pwr_imp_ent_id)
-        pwr_export_state = self.hass.states.get(self.pwr_exp_ent_id)
-
-        # temporary type fix
-        if (
-            inj_tariff_state == None or
-            pwr_import_state == None or
-            pwr_export_state == None
-        ):
+        if inj_tariff_state == None:
             _LOGGER.error("An entity needed for this integration has no value")
             return {}
 
-        # Exctract data from dependant sensors
-        inj_tariff = float(inj_tariff_state.state)
-        pwr_import = self.convert_pwr_state_to_watt(pwr_import_state)
-        pwr_export = self.convert_pwr_state_to_watt(pwr_export_state)
+        # Exctract data from dependant sensors, the grid meter entities as one reading
+        if self.tariff.update(inj_tariff_state):
+            self.schedule_tariff_transition()  # New day-ahead prices or cutoff
+        inj_tariff = self.tariff.price(inj_tariff_state, dt_util.utcnow())
+        meter = self.meter.snapshot(self.hass)
+        self.timings.end_phase(PHASE_STATE_FETCH)
 
-        # Read inverter power through SunSpec
-        if self.measurands_mid != None and self.W_offset != None:
-            self.W = await self.offset_read(d=self.d, mid=self.measurands_mid, trg_offset=self.W_offset)
-        else:
+        # Read power and current power limit of all inverters at the same time
+        inverters = [inverter for inverter in self.inverters if inverter.available]
+        results = await asyncio.gather(*[inverter.async_read() for inverter in inverters])
+        inverters = [inverter for inverter, success in zip(inverters, results) if success and inverter.WRtg]
+        self.timings.end_phase(PHASE_READ)
+        self.update_night_mode()
+        if len(inverters) == 0:
             return {}
+        self.W = sum(inverter.W for inverter in inverters)  # pyright: ignore[reportArgumentType, reportCallIssue]
+        self.WRtg = sum(inverter.WRtg for inverter in inverters)  # pyright: ignore[reportArgumentType, reportCallIssue]
         
         # Calculate setpoints for inverter power and send it to inverter
         if self.system_switch:
-            if self.W != None and self.WRtg != None and pwr_export != None and pwr_import != None:
-                self.setpoint_W = self.calc_setpoint_W(inj_tariff, pwr_import, pwr_export, self.W, pwr_rated=self.WRtg)
+            if meter != None and not meter.aligned:
+                # Don't act on a half updated reading, like a new import with the previous export
+                _LOGGER.debug("Grid meter reading is not complete yet, keeping the setpoint until it is")
+                self.schedule_meter_retry()
+            elif self.W != None and self.WRtg != None and meter != None and inj_tariff != None:
+                self.setpoint_W = self.calc_setpoint_W(inj_tariff, meter, self.W, pwr_rated=self.WRtg)
                 self.setpoint_pct = self.calc_setpoint_pct(sp_W=self.setpoint_W, pwr_rated=self.WRtg)
-                if not (self.last_setpoint_W == self.WRtg and self.setpoint_W == self.WRtg):  # Don't keep sending 100% setpoints       
-                    await self.write_setpoint(d=self.d, sp_pct=self.setpoint_pct)
+                self.timings.end_phase(PHASE_CALC)
+                await self.send_setpoints(inverters=inverters, sp_W=self.setpoint_W, force=force)
+                self.timings.end_phase(PHASE_WRITE)
             else:
                 _LOGGER.warning("Missing data for setpoint calculation, so no setpoint has been sent to the inverter")
 
         # If system switch is off, set sp to 100% and only send it once
         else:
+            self.controller.reset()
             self.setpoint_W = self.WRtg
             self.setpoint_pct = 100
-            if not (self.last_setpoint_W == self.WRtg):
-                await self.write_setpoint(d=self.d, sp_pct=self.setpoint_pct)
+            self.timings.end_phase(PHASE_CALC)
+            await self.send_setpoints(inverters=inverters, sp_W=self.setpoint_W, force=True)
+            self.timings.end_phase(PHASE_WRITE)
         
         # Save last state of energy meter
-        self.last_export_pwr = pwr_export
-        self.last_import_pwr = pwr_import
+        if meter != None and meter.aligned:
+            self.last_export_pwr = meter.export_W
+            self.last_import_pwr = meter.import_W
+            self.last_meter_time = meter.timestamp
+        self.history.append(
+            time.monotonic(),
+            W=self.W,
+            import_W=meter.import_W if meter != None else None,
+            export_W=meter.export_W if meter != None else None,
+            setpoint_W=self.setpoint_W,
+        )
+        self.adapt_poll_interval()
+        self.timings.end_update(modbus_loop_time=sum(inverter.io.tick_loop_time for inverter in inverters))
 
         return {
             "setpoint_W": self.setpoint_W,
             "setpoint_pct": self.setpoint_pct,
         }
+
+    async def send_setpoints(self, inverters: list[SunSpecInverter], sp_W: int, force: bool = False) -> None:
+        """Split the site setpoint over the inverters in proportion to their rating and write them at the same time"""
+        total_rating = sum(inverter.WRtg for inverter in inverters)  # pyright: ignore[reportArgumentType, reportCallIssue]
+        writes = []
+        for inverter in inverters:
+            inverter_sp_W = round(sp_W * inverter.WRtg / total_rating)  # pyright: ignore[reportOperatorIssue]
+            inverter_sp_pct = self.calc_setpoint_pct(sp_W=inverter_sp_W, pwr_rated=inverter.WRtg)  # pyright: ignore[reportArgumentType]
+            writes.append(inverter.async_send_setpoint(sp_W=inverter_sp_W, sp_pct=inverter_sp_pct, force=force))
+        await asyncio.gather(*writes)
     
-    def convert_pwr_state_to_watt(self, state: State) -> float | None:
-        try:
-            value = float(state.state)
-        except:
-            _LOGGER.warning(f"The state \"{state.state}\" of provided power entity {state.entity_id} could not be parsed as a number")
-            return None
-        unit = state.attributes.get("unit_of_measurement", None)
-        if unit == "kW":
-            return value * 1e3
-        elif unit == "W":
-            return value
-        elif unit == "mW" or unit == "MW":
-            return value / 1e3
-        else:
-            _LOGGER.error(f"Provided power entity {state.entity_id} has no known unit")
-            return None
-    
-    def calc_setpoint_W(self, inj_tariff: float, pwr_import: float, pwr_export: float, pwr_PV: float, pwr_rated: float) -> int:
-        # Only update setpoint if energy meter data has been updated
-        if pwr_import == self.last_import_pwr and pwr_export == self.last_export_pwr and self.setpoint_W != None:
-            sp = self.setpoint_W
-            return round(sp)
-        
-        if inj_tariff >= INJ_CUTOFF_TARIFF:
+    def calc_setpoint_W(self, inj_tariff: float, meter: MeterSnapshot, pwr_PV: float, pwr_rated: float, now: float | None = None) -> int:
+        """Site setpoint in Watt, now is a monotonic timestamp in seconds (the current time if None, a replay passes its own)"""
+        if inj_tariff >= self.tariff.cutoff:
+            self.curtailing = False
+            self.controller.reset()  # start from the actual inverter power when curtailing starts again
             return round(pwr_rated)
-        
-        if pwr_import > 5 and inj_tariff < INJ_CUTOFF_TARIFF:
-            sp = min(pwr_PV + pwr_import, pwr_rated)  # don't go above max power
-            _LOGGER.info(f"PV setpoint calculated during curtailing and importing from grid, PV: {pwr_PV} W, import: {pwr_import} W, export: {pwr_export} W, setpoint: {sp} W")
-            return round(sp)
 
-        else: # injecting during negative price
-            sp = max(pwr_PV - pwr_export, 0)  # no negative power
-            _LOGGER.info(f"PV setpoint calculated during curtailing and exporting to grid, PV: {pwr_PV} W, import: {pwr_import} W, export: {pwr_export} W, setpoint: {sp} W")
+        # Only update setpoint if energy meter data has been updated, unless curtailing just started
+        meter_unchanged = meter.timestamp == self.last_meter_time
+        if meter_unchanged and self.curtailing and self.setpoint_W != None and self.controller.needs_new_meter_data:
+            sp = self.setpoint_W
             return round(sp)
+        self.curtailing = True
+
+        sp = self.controller.calc_setpoint_W(meter.import_W, meter.export_W, pwr_PV, pwr_rated, now=time.monotonic() if now == None else now)
+        return round(sp)
     
     def calc_setpoint_pct(self, sp_W: int, pwr_rated: float) -> float:
         """Calc setpoint in percentage from setpoint in Watt"""
         sp_pct = (sp_W / pwr_rated) * 100
         return round(sp_pct, 2)  # percentage with 2 decimals
     
-    async def offset_read(self, d, mid: int, trg_offset: int) -> float | None:
-        """Read a point from the SunSpec device and return the scaled value"""
-        for name, point in d.models[mid][0].points.items():
-            if point.offset == trg_offset:
-                try:
-                    point.read()
-                except Exception as e:
-                    _LOGGER.error(f"Failed to read sunspec register, trying to reconnect now. Read error: {e}")
-                    await self.try_reconnect()
-                val = point.cvalue
-                return val
-        _LOGGER.error(f"SunSpec point with model id {mid} and offset {trg_offset} was not found and could not be read")
-        return None
-    
-    def offset_get(self, d, mid: int, trg_offset: int) -> float | None:
-        """Get a value from SunSpec device python instance, without reading"""
-        for name, point in d.models[mid][0].points.items():
-            if point.offset == trg_offset:
-                val = point.cvalue
-                return val
-        _LOGGER.error(f"SunSpec point with model id {mid} and offset {trg_offset} was not found")
-        return None
-    
-    def set_models_and_offsets(self, d) -> None:
-        """Check which models are available on the SunSpec device"""
-        # Measurands model:
-        if DER_MEASURE_AC_MID in d.models:
-            self.measurands_mid = DER_MEASURE_AC_MID
-            self.W_offset = W_OFFSET_7XX
-        elif INVERTER_SINGLE_PHASE_MID in d.models:
-            self.measurands_mid = INVERTER_SINGLE_PHASE_MID
-            self.W_offset = W_OFFSET_1XX
-        elif INVERTER_SPLIT_PHASE_MID in d.models:
-            self.measurands_mid = INVERTER_SPLIT_PHASE_MID
-            self.W_offset = W_OFFSET_1XX
-        elif INVERTER_THREE_PAHSE_MID in d.models:
-            self.measurands_mid = INVERTER_THREE_PAHSE_MID
-            self.W_offset = W_OFFSET_1XX
-        else:
-            _LOGGER.error("No measurands model was found on the SunSpec device, this integration will now freeze")
-            self.shutdown_flag = True
-            return
-        
-        # Control model:
-        if DER_CTL_AC_MID in d.models:
-            self.controls_mid = DER_CTL_AC_MID
-            self.WMaxLimPct_offset = WMAXLIMPCT_OFFSET_7XX
-        elif CONTROLS_MID in d.models:
-            self.controls_mid = CONTROLS_MID
-            self.WMaxLimPct_offset = WMAXLIMPCT_OFFSET_1XX
-        else:
-            _LOGGER.error("No controls model was found on the SunSpec device, this integration will now freeze")
-            self.shutdown_flag = True
-            return
-        
-        # Rating model:
-        if DER_CAPACITY_MID in d.models:
-            self.rating_mid = DER_CAPACITY_MID
-            self.WRtg_offset = WRTG_OFFSET_7XX
-        elif NAMEPLATE_MID in d.models:
-            self.rating_mid = NAMEPLATE_MID
-            self.WRtg_offset = WRTG_OFFSET_1XX
-        else:
-            _LOGGER.error("No ratings model was found on the SunSpec device, this integration will now freeze")
-            self.shutdown_flag = True
-            return
-    
-    async def write_setpoint(self, d, sp_pct: float) -> None:
-        """Write a power setpoint to the SunSpec device, tailored to its brand"""
-        for name, point in d.models[self.controls_mid][0].points.items():
-            if point.offset == self.WMaxLimPct_offset:
-                try:
-                    point.read()
-                except Exception as e:
-                    _LOGGER.error(f"Failed to read sunspec register, trying to reconnect now. Read error: {e}")
-                    await self.try_reconnect()
-
-                # SMA
-                if self.brand == Brand.SMA:
-                    point.cvalue = sp_pct
-                    try:
-                        point.write()
-                        _LOGGER.info(f"Setpoint sent to inverter: {sp_pct} %")
-                        self.last_setpoint_W = self.setpoint_W
-                    except Exception as e:
-                        _LOGGER.error(f"Failed to write setpoint to inverter: {e}")
-                        return
-                
-                #SolarEdge
-                elif self.brand == Brand.SOLAREDGE:
-                    self.last_setpoint_W = self.setpoint_W
-                    _LOGGER.warning("Writing setpoints to this inverter is not yet implemented, but is planned for the future")
-                else:
-                    _LOGGER.error("Writing setpoint to this inverter brand is not implemented")
-                    return
-    
-    async def try_reconnect(self) -> None:
-        """Create reconnection loop while not connected"""
-        is_connected = False
-        try_counter = 0
-        sleep_time = 60
-
-        while not is_connected:
-            self.sleep = True
-            await asyncio.sleep(sleep_time)
-            try:
-                self.d = None
-                self.d = await self.hass.async_add_executor_job(self.connect_and_scan)  # blocking call
-                if len(self.d.models) == 0:
-                    _LOGGER.error("Modbus client succesfully reconnected to slave, but no SunSpec models are available. This integration will now shut down, a manual restart of Home Assistant is required to resume.")
-                    self.shutdown_flag = True
-                    return
-                is_connected = True
-                self.sleep = False
-                _LOGGER.info("Modbus client successfully reconnected to slave")
-            except Exception as e:
-                try_counter += 1
-                if try_counter > 3:
-                    sleep_time = 600
-                _LOGGER.warning(f"Failed reconnecting to SunSpec device, reconnecting in {sleep_time} s")
-    
-    def connect_and_scan(self) -> SunSpecModbusClientDeviceTCP:
-        d = client.SunSpecModbusClientDeviceTCP(slave_id=self.SLAVE_ID, ipaddr=self.IP, ipport=self.PORT)
-        d.scan()
-        return d
\ No newline at end of file
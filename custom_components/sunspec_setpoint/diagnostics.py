@@ -0,0 +1,102 @@
+from typing import Any
+
+from homeassistant import config_entries
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .coordinator import PvCurtailingCoordinator
+from .inverter import SunSpecInverter
+from .const import *
+
+TO_REDACT = {CONF_IP}
+
+def inverter_diagnostics(inverter: SunSpecInverter) -> dict[str, Any]:
+    """State, counters and Modbus latency of one inverter"""
+    return {
+        "available": inverter.available,
+        "sleep": inverter.sleep,
+        "shutdown_flag": inverter.shutdown_flag,
+        "status": inverter.status,
+        "night": inverter.night,
+        "models": {
+            "measurands": inverter.measurands_mid,
+            "controls": inverter.controls_mid,
+            "rating": inverter.rating_mid,
+            "layout_from_cache": inverter.layout_from_cache,
+        },
+        "poll_groups": inverter.scheduler.as_dict(),
+        "WRtg": inverter.WRtg,
+        "W": inverter.W,
+        "setpoint_W": inverter.setpoint_W,
+        "setpoint_pct": inverter.setpoint_pct,
+        "modbus": {
+            "call_count": inverter.io.call_count,
+            "timeout_count": inverter.io.timeout_count,
+            "error_count": inverter.io.error_count,
+            "last_wait_ms": round(inverter.io.tick_wait_time * 1e3, 3),
+            "last_loop_time_ms": round(inverter.io.tick_loop_time * 1e3, 3),
+            "latency": inverter.io.histogram.as_dict() if inverter.io.histogram != None else None,
+        },
+        "reconnect_count": inverter.reconnect_count,
+        "reconnect_attempt_count": inverter.reconnect_attempt_count,
+        "limit_controls": {
+            "supported": inverter.controls_supported,
+            "written": inverter.written_controls,
+        },
+        "writes": {
+            "write_count": inverter.write_gate.write_count,
+            "suppressed_count": inverter.write_gate.suppressed_count,
+            "verify_fail_count": inverter.write_gate.verify_fail_count,
+        },
+    }
+
+def tariff_diagnostics(pv_coordinator: PvCurtailingCoordinator) -> dict[str, Any]:
+    """Cutoff and the curtailment windows planned from the day-ahead prices"""
+    schedule = pv_coordinator.tariff.schedule
+    next_transition = pv_coordinator.tariff.next_transition(dt_util.utcnow())
+    return {
+        "cutoff": pv_coordinator.tariff.cutoff,
+        "curtailing": pv_coordinator.curtailing,
+        "intervals": len(schedule.starts) if schedule != None else 0,
+        "curtailment_windows": [
+            [dt_util.utc_from_timestamp(start).isoformat(), dt_util.utc_from_timestamp(end).isoformat()]
+            for start, end in schedule.windows
+        ] if schedule != None else [],
+        "next_transition": next_transition.isoformat() if next_transition != None else None,
+    }
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: config_entries.ConfigEntry
+) -> dict[str, Any]:
+    """Diagnostics download of a config entry, with its inverter and the site it belongs to"""
+    pv_coordinator: PvCurtailingCoordinator = hass.data[DOMAIN][entry.entry_id][COORDINATOR]
+    inverter: SunSpecInverter = hass.data[DOMAIN][entry.entry_id][INVERTER]
+    return {
+        "entry": {
+            "data": async_redact_data(entry.data, TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "site": {
+            "owner": pv_coordinator.owner_entry_id == entry.entry_id,
+            "inverter_count": len(pv_coordinator.inverters),
+            "system_switch": pv_coordinator.system_switch,
+            "event_mode": pv_coordinator.event_mode,
+            "night": pv_coordinator.night,
+            "controller": type(pv_coordinator.controller).__name__,
+            "setpoint_W": pv_coordinator.setpoint_W,
+            "setpoint_pct": pv_coordinator.setpoint_pct,
+            "W": pv_coordinator.W,
+            "WRtg": pv_coordinator.WRtg,
+            "last_update_success": pv_coordinator.last_update_success,
+            "timings": pv_coordinator.timings.as_dict(),
+            "poll_interval": pv_coordinator.poll_interval,
+            "history": pv_coordinator.history.stats(),
+            "commands": {
+                "pending": pv_coordinator.commands.pending,
+                "preempt_count": pv_coordinator.commands.preempt_count,
+            },
+            "tariff": tariff_diagnostics(pv_coordinator),
+        },
+        "inverter": inverter_diagnostics(inverter),
+    }
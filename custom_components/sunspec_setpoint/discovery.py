@@ -0,0 +1,187 @@
+import asyncio
+import ipaddress
+import logging
+import struct
+
+from typing import NamedTuple
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+SUNSPEC_BASE_ADDRS = (40000, 0, 50000)  # Base addresses a SunSpec register map can start at
+COMMON_MID = 1
+MN_OFFSET = 2  # Manufacturer in the common model, directly followed by the model string
+STRING_LEN = 16  # [registers] of the manufacturer and model strings
+WRTG_SF_OFFSET_1XX = 4
+W_SF_OFFSET_7XX = 45
+MAX_CHAIN_MODELS = 32  # Models walked to find the rating model
+NOT_IMPLEMENTED_SF = -32768
+
+class DiscoveredDevice(NamedTuple):
+    """SunSpec device that answered a discovery probe"""
+    host: str
+    port: int
+    slave_id: int
+    manufacturer: str
+    model: str
+    rating_W: float | None
+
+    @property
+    def label(self) -> str:
+        rating = f"{self.rating_W:.0f} W" if self.rating_W != None else "unknown rating"
+        return f"{self.manufacturer} {self.model} ({rating}) at {self.host}:{self.port}, slave ID {self.slave_id}"
+
+class ModbusProbe:
+    """
+    Minimal asyncio Modbus TCP client to look for SunSpec devices, it runs on the event loop
+    without executor threads, so many hosts can be probed at the same time
+    """
+
+    def __init__(self, host: str, port: int, timeout: float) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout  # [s] for connecting and for every request
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.transaction_id: int = 0
+
+    async def open(self) -> bool:
+        """Open the connection, returns False if nothing listens on the port"""
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), timeout=self.timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        return True
+
+    def close(self) -> None:
+        if self.writer != None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def read(self, slave_id: int, addr: int, count: int) -> bytes | None:
+        """Read holding registers, None for an exception response. Raises on timeouts and closed connections"""
+        if self.reader == None or self.writer == None:
+            raise ConnectionError("Probe connection is not open")
+        self.transaction_id = (self.transaction_id + 1) & 0xFFFF
+        self.writer.write(struct.pack(">HHHBBHH", self.transaction_id, 0, 6, slave_id, 3, addr, count))
+        await self.writer.drain()
+        header = await asyncio.wait_for(self.reader.readexactly(7), timeout=self.timeout)
+        transaction_id, _, length, _ = struct.unpack(">HHHB", header)
+        if length < 2:
+            raise ConnectionError(f"Invalid Modbus response length {length}")
+        pdu = await asyncio.wait_for(self.reader.readexactly(length - 1), timeout=self.timeout)
+        if transaction_id != self.transaction_id:
+            raise ConnectionError("Unexpected Modbus transaction ID")
+        if pdu[0] & 0x80 or len(pdu) < 2 + count * 2:
+            return None
+        return pdu[2:2 + count * 2]
+
+def decode_string(data: bytes) -> str:
+    return data.split(b"\0", 1)[0].decode("ascii", errors="ignore").strip()
+
+async def identify(probe: ModbusProbe, slave_id: int) -> DiscoveredDevice | None:
+    """Look for the SunSpec marker of a slave, then read its manufacturer, model and rating"""
+    base_addr = None
+    for addr in SUNSPEC_BASE_ADDRS:
+        header = await probe.read(slave_id, addr, 4)
+        if header != None and header[:4] == b"SunS":
+            base_addr = addr
+            break
+    if base_addr == None:
+        return None
+
+    manufacturer = model = ""
+    rating_W = None
+    addr = base_addr + 2
+    for _ in range(MAX_CHAIN_MODELS):
+        header = await probe.read(slave_id, addr, 2)
+        if header == None:
+            break
+        mid, length = struct.unpack(">HH", header)
+        if mid == 0xFFFF:
+            break
+        if mid == COMMON_MID:
+            strings = await probe.read(slave_id, addr + MN_OFFSET, 2 * STRING_LEN)
+            if strings != None:
+                manufacturer = decode_string(strings[:2 * STRING_LEN])
+                model = decode_string(strings[2 * STRING_LEN:])
+        elif mid in (NAMEPLATE_MID, DER_CAPACITY_MID):
+            if mid == NAMEPLATE_MID:
+                value = await probe.read(slave_id, addr + WRTG_OFFSET_1XX, 1)
+                sf = await probe.read(slave_id, addr + WRTG_SF_OFFSET_1XX, 1)
+            else:
+                value = await probe.read(slave_id, addr + WRTG_OFFSET_7XX, 1)
+                sf = await probe.read(slave_id, addr + W_SF_OFFSET_7XX, 1)
+            if value != None and sf != None:
+                (raw,), (exponent,) = struct.unpack(">H", value), struct.unpack(">h", sf)
+                if raw != 0xFFFF and exponent != NOT_IMPLEMENTED_SF:
+                    rating_W = raw * 10 ** exponent
+            break  # the common model comes first, so everything is known
+        addr += length + 2
+    return DiscoveredDevice(
+        host=probe.host,
+        port=probe.port,
+        slave_id=slave_id,
+        manufacturer=manufacturer or "SunSpec",
+        model=model or "device",
+        rating_W=rating_W,
+    )
+
+async def probe_port(host: str, port: int, slave_ids: list[int], timeout: float) -> list[DiscoveredDevice]:
+    """Probe the slave IDs behind one host and port over one connection, reopened after a timeout"""
+    probe = ModbusProbe(host=host, port=port, timeout=timeout)
+    if not await probe.open():
+        return []
+    devices = []
+    try:
+        for slave_id in slave_ids:
+            if probe.writer == None and not await probe.open():
+                break
+            try:
+                device = await identify(probe, slave_id)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError) as e:
+                _LOGGER.debug(f"No answer from slave ID {slave_id} at {host}:{port}: {e!r}")
+                probe.close()  # a late response would be taken for the next request
+                continue
+            if device != None:
+                devices.append(device)
+    finally:
+        probe.close()
+    return devices
+
+def discovery_hosts(target: str) -> list[str]:
+    """Hosts of an IP address, host name or subnet like 192.168.1.0/24. Raises ValueError for too large subnets"""
+    target = target.strip()
+    if "/" not in target:
+        return [target]
+    network = ipaddress.ip_network(target, strict=False)
+    if network.num_addresses > MAX_DISCOVERY_HOSTS:
+        raise ValueError(f"Subnet {target} has more than {MAX_DISCOVERY_HOSTS} addresses")
+    hosts = [str(host) for host in network.hosts()]
+    return hosts or [str(network.network_address)]
+
+async def async_discover(
+        target: str,
+        ports: list[int] = DISCOVERY_PORTS,
+        slave_ids: list[int] = DISCOVERY_SLAVE_IDS,
+        timeout: float = DISCOVERY_TIMEOUT,
+        concurrency: int = DISCOVERY_CONCURRENCY,
+) -> list[DiscoveredDevice]:
+    """Probe every host and port of the target concurrently, at most concurrency connections at a time"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_probe(host: str, port: int) -> list[DiscoveredDevice]:
+        async with semaphore:
+            return await probe_port(host=host, port=port, slave_ids=slave_ids, timeout=timeout)
+
+    results = await asyncio.gather(*[bounded_probe(host, port) for host in discovery_hosts(target) for port in ports])
+    devices = [device for result in results for device in result]
+    _LOGGER.info(f"Discovery of {target} found {len(devices)} SunSpec devices")
+    return devices
+
+async def async_probe_device(host: str, port: int, slave_id: int, timeout: float = DISCOVERY_TIMEOUT) -> DiscoveredDevice | None:
+    """Check that a SunSpec device answers at host, port and slave ID"""
+    devices = await probe_port(host=host, port=port, slave_ids=[slave_id], timeout=timeout)
+    return devices[0] if devices else None
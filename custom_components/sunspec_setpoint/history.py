@@ -0,0 +1,90 @@
+import array
+import math
+
+from typing import Any
+
+from .const import HISTORY_SIZE
+
+HISTORY_COLUMNS = ("time", "W", "import_W", "export_W", "setpoint_W")
+
+class TickHistory:
+    """
+    Ring buffer of the last size control updates, one preallocated float array per column,
+    so recording a tick doesn't allocate. Unknown values are stored as NaN
+    """
+
+    def __init__(self, size: int = HISTORY_SIZE) -> None:
+        self.size = size
+        self.columns: dict[str, array.array] = {column: array.array("d", bytes(8 * size)) for column in HISTORY_COLUMNS}
+        self.index: int = 0     # Position of the next tick
+        self.count: int = 0     # Number of recorded ticks, at most size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: float, W: float | None, import_W: float | None, export_W: float | None, setpoint_W: float | None) -> None:
+        i = self.index
+        columns = self.columns
+        columns["time"][i] = timestamp
+        columns["W"][i] = math.nan if W == None else W
+        columns["import_W"][i] = math.nan if import_W == None else import_W
+        columns["export_W"][i] = math.nan if export_W == None else export_W
+        columns["setpoint_W"][i] = math.nan if setpoint_W == None else setpoint_W
+        self.index = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def clear(self) -> None:
+        self.index = self.count = 0
+
+    def window(self, window: int | None = None) -> int:
+        """Number of ticks in the last window ticks, all recorded ticks if None"""
+        return self.count if window == None else min(window, self.count)
+
+    def ordered(self, column: str, window: int | None = None) -> list[float]:
+        """Values of the last window ticks, oldest first"""
+        n = self.window(window)
+        data = self.columns[column]
+        start = self.index - n
+        return [data[(start + k) % self.size] for k in range(n)]
+
+    def values(self, column: str, window: int | None = None) -> list[float]:
+        """Known values of the last window ticks, oldest first"""
+        return [value for value in self.ordered(column, window) if not math.isnan(value)]
+
+    def stats(self, window: int | None = None) -> dict[str, Any]:
+        """Variance of the grid and inverter power and the setpoint reversals of the last window ticks"""
+        grid = [
+            import_W - export_W
+            for import_W, export_W in zip(self.ordered("import_W", window), self.ordered("export_W", window))
+            if not math.isnan(import_W) and not math.isnan(export_W)
+        ]
+        power = self.values("W", window)
+        return {
+            "samples": self.window(window),
+            "grid_mean_W": round(mean(grid), 1) if grid else None,
+            "grid_variance_W2": round(variance(grid), 1) if grid else None,
+            "power_variance_W2": round(variance(power), 1) if power else None,
+            "oscillation_count": reversals(self.values("setpoint_W", window)),
+        }
+
+def mean(values: list[float]) -> float:
+    return sum(values) / len(values)
+
+def variance(values: list[float]) -> float:
+    """Population variance"""
+    m = mean(values)
+    return sum((value - m) ** 2 for value in values) / len(values)
+
+def reversals(values: list[float]) -> int:
+    """Number of times the values changed direction, unchanged values are skipped"""
+    count = 0
+    last_direction = 0.0
+    for previous, value in zip(values, values[1:]):
+        direction = value - previous
+        if direction == 0:
+            continue
+        if direction * last_direction < 0:
+            count += 1
+        last_direction = direction
+    return count
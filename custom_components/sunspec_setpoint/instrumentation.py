@@ -0,0 +1,129 @@
+import bisect
+import time
+
+from typing import Any
+
+# Upper bounds [ms] of the Modbus latency histogram buckets, the last bucket holds everything slower
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Phases of a coordinator update
+PHASE_STATE_FETCH = "state_fetch"   # Reading and converting the grid meter and tariff states
+PHASE_READ = "read"                 # Reading the inverters
+PHASE_CALC = "calc"                 # Calculating the setpoint
+PHASE_WRITE = "write"               # Writing the setpoints
+PHASES = (PHASE_STATE_FETCH, PHASE_READ, PHASE_CALC, PHASE_WRITE)
+BLOCKING_PHASES = (PHASE_STATE_FETCH, PHASE_CALC)  # Phases that run on the event loop without awaiting
+
+class LatencyHistogram:
+    """Histogram of Modbus round-trip times with fixed buckets, so observing is a bisect and an increment"""
+
+    def __init__(self) -> None:
+        self.counts: list[int] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0     # [s]
+        self.max: float = 0.0       # [s]
+
+    def observe(self, duration: float) -> None:
+        """Add a round-trip time in seconds"""
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, duration * 1e3)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def mean_ms(self) -> float | None:
+        if self.count == 0:
+            return None
+        return round(self.total / self.count * 1e3, 1)
+
+    def percentile_ms(self, fraction: float) -> float | None:
+        """Upper bound of the bucket holding the given fraction of the calls, capped at the slowest call"""
+        if self.count == 0:
+            return None
+        max_ms = round(self.max * 1e3, 1)
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(float(bound), max_ms)
+        return max_ms
+
+    def as_dict(self) -> dict[str, Any]:
+        buckets = {f"le_{bound}ms": count for bound, count in zip(LATENCY_BUCKETS_MS, self.counts)}
+        buckets[f"gt_{LATENCY_BUCKETS_MS[-1]}ms"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": self.mean_ms(),
+            "p50_ms": self.percentile_ms(0.5),
+            "p95_ms": self.percentile_ms(0.95),
+            "max_ms": round(self.max * 1e3, 1),
+            "buckets": buckets,
+        }
+
+class UpdateTimings:
+    """
+    Phase timings of the coordinator updates. While disabled every call returns right away,
+    so the update only pays for an attribute check per phase
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.reset()
+
+    def reset(self) -> None:
+        self.last: dict[str, float] = {}                        # [s] phase durations of the last update
+        self.totals: dict[str, float] = dict.fromkeys(PHASES, 0.0)  # [s] summed phase durations
+        self.max: dict[str, float] = dict.fromkeys(PHASES, 0.0)     # [s] slowest phase durations
+        self.update_count: int = 0
+        self.last_duration: float | None = None                 # [s] duration of the last update
+        self.last_loop_block: float | None = None               # [s] event loop time blocked by the last update
+        self.max_loop_block: float = 0.0                        # [s]
+        self._update_start: float = 0.0
+        self._phase_start: float = 0.0
+
+    def start_update(self) -> None:
+        if not self.enabled:
+            return
+        self.last = {}
+        self._update_start = self._phase_start = time.perf_counter()
+
+    def end_phase(self, phase: str) -> None:
+        """Close the running phase, the next phase starts now"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        duration = now - self._phase_start
+        self._phase_start = now
+        self.last[phase] = duration
+        self.totals[phase] += duration
+        if duration > self.max[phase]:
+            self.max[phase] = duration
+
+    def end_update(self, modbus_loop_time: float = 0.0) -> None:
+        """Finish the update, modbus_loop_time is the event loop time spent scheduling Modbus calls"""
+        if not self.enabled:
+            return
+        self.update_count += 1
+        self.last_duration = time.perf_counter() - self._update_start
+        self.last_loop_block = sum(self.last.get(phase, 0.0) for phase in BLOCKING_PHASES) + modbus_loop_time
+        if self.last_loop_block > self.max_loop_block:
+            self.max_loop_block = self.last_loop_block
+
+    def as_dict(self) -> dict[str, Any]:
+        def ms(value: float | None) -> float | None:
+            return None if value == None else round(value * 1e3, 3)
+
+        return {
+            "enabled": self.enabled,
+            "update_count": self.update_count,
+            "last_update_ms": ms(self.last_duration),
+            "last_phase_ms": {phase: ms(duration) for phase, duration in self.last.items()},
+            "mean_phase_ms": {
+                phase: ms(total / self.update_count) if self.update_count else None
+                for phase, total in self.totals.items()
+            },
+            "max_phase_ms": {phase: ms(duration) for phase, duration in self.max.items()},
+            "last_loop_block_ms": ms(self.last_loop_block),
+            "max_loop_block_ms": ms(self.max_loop_block),
+        }
@@ -0,0 +1,628 @@
+import logging
+import datetime
+import asyncio
+import struct
+import time
+import sunspec2.mb as mb
+
+from typing import TYPE_CHECKING, Any
+from homeassistant import config_entries
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.core import HomeAssistant
+from .const import *
+from .modbus_io import ModbusIO
+from .scheduler import POLL_SLOW, PollScheduler
+from .model_cache import ModelCache, RESOLVED_ATTRS, cache_key, create_models, device_layout, load_cached_models, scan_model_chain
+from .connection import ModbusConnectionPool, SharedModbusConnection, backoff_delay, pooled_device
+from .write_gate import WriteGate
+
+if TYPE_CHECKING:
+    from sunspec2.modbus.client import SunSpecModbusClientDeviceTCP
+
+_LOGGER = logging.getLogger(__name__)
+
+def solaredge_f32(data: bytes) -> float:
+    """Decode a SolarEdge proprietary float32, which has the low word first"""
+    return struct.unpack(">f", data[2:4] + data[0:2])[0]
+
+class SunSpecInverter:
+    """Connection, SunSpec models and setpoint of one inverter (one config entry)"""
+
+    def __init__(
+            self,
+            hass: HomeAssistant,
+            config_entry: config_entries.ConfigEntry,
+    ) -> None:
+        self.hass = hass
+        self.config_entry = config_entry
+        self.setpoint_W: int | None = None          # Holds setpoint in Watt
+        self.last_setpoint_W: int | None = None     # Last sent setpoint
+        self.W: float | None = None                 # Holds power of inverter
+        self.setpoint_pct: float | None = None      # Holds setpoint in percentage
+        self.d = None                               # SunSpec client device
+        self.WRtg: int | None = None                # Rated inverter power
+        self.shutdown_flag: bool = False            # flag for disabling reads and writes
+        self.sleep: bool = False                    # Sleep mode on or off (when reconnecting)
+        self.sunspec_setup_success: bool = False    # Indicate whether sunspec connection was successfully set up
+        self.reconnect_task: asyncio.Task | None = None  # Background reconnection, while it runs the inverter is skipped
+        self.write_gate = WriteGate()               # Suppresses small, frequent and excessive setpoint writes
+        self.verify_writes: bool = DEFAULT_VERIFY_WRITES  # Read the setpoint back after writing it
+        self.reconnect_count: int = 0               # Total number of lost connections that started a reconnect
+        self.reconnect_attempt_count: int = 0       # Total number of reconnect attempts
+        self.network_event = asyncio.Event()        # Set when the device is reachable again, ends the backoff early
+        self.reachable: bool | None = None          # Result of the last reachability probe while waiting to reconnect
+        self.status: int | None = None              # Operating state (St or InvSt) of the last read
+        self.night: bool = False                    # Site is in night mode, reconnects wait for sunrise instead of retrying
+        self.night_poll_interval: float = DEFAULT_NIGHT_POLL_INTERVAL  # [s] reconnect interval at night, 0 to wait for sunrise
+
+        # Power limit controls, written next to the power limit
+        self.win_tms: int = DEFAULT_WIN_TMS         # [s] time window to apply a new power limit
+        self.rvrt_tms: int = DEFAULT_RVRT_TMS       # [s] power limit reverts if not written again within this time
+        self.rvrt_pct: float = DEFAULT_RVRT_PCT     # [%] power limit to revert to
+        self.rmp_tms: int = DEFAULT_RMP_TMS         # [s] ramp time to a new power limit
+        self.controls_supported: bool = True        # Device accepted the control points, else only the limit is written
+        self.written_controls: dict[int, float] | None = None  # Control point values last written, by offset
+
+        # SunSpec models and offsets
+        self.measurands_mid: int | None = None
+        self.controls_mid: int | None = None
+        self.rating_mid: int | None = None
+        self.W_offset: int | None = None
+        self.WRtg_offset: int | None = None
+        self.WMaxLimPct_offset: int | None = None
+        self.points: dict[tuple[int, int], Any] = {}  # Resolved SunSpec points, indexed by (model id, offset)
+        self.scheduler = PollScheduler()                # Reads the points at the cadence of their group, merged into block reads
+        self.layout: dict[str, Any] | None = None       # Cached SunSpec model layout of the device
+        self.layout_from_cache: bool = False            # Models were created from the cached layout instead of a scan
+        self.model_chain: list[list[int]] = []          # [model id, address, length] of every model on the device
+        self.setup_task: asyncio.Task | None = None     # Background setup, retried while the device is offline
+
+        # unpack config
+        config = config_entry.data
+        self.IP:             str = config[CONF_CONNECT_STEP][CONF_IP]
+        self.PORT                = int(config[CONF_CONNECT_STEP][CONF_PORT])
+        self.SLAVE_ID            = int(config[CONF_CONNECT_STEP][CONF_SLAVE_ID])
+        self.brand: Brand        = Brand(str(config[CONF_USER_STEP][CONF_INVERTER_BRAND]).lower())
+        self.modbus_timeout      = float(config[CONF_CONNECT_STEP].get(CONF_MODBUS_TIMEOUT, DEFAULT_MODBUS_TIMEOUT))
+
+        self.io = ModbusIO(hass=hass, timeout=self.modbus_timeout)  # Runs register access off the event loop
+        self.model_cache: ModelCache = hass.data[DOMAIN][MODEL_CACHE]
+        self.cache_key = cache_key(ip=self.IP, port=self.PORT, slave_id=self.SLAVE_ID)
+
+        # Persistent socket, shared with other inverters behind the same IP:port
+        pool: ModbusConnectionPool = hass.data[DOMAIN][CONNECTION_POOL]
+        self.connection: SharedModbusConnection = pool.acquire(ip=self.IP, port=self.PORT, timeout=self.modbus_timeout)
+        config_entry.async_on_unload(self.shutdown)
+        config_entry.async_on_unload(lambda: pool.release(self.connection))
+        config_entry.async_on_unload(
+            async_track_time_interval(hass, self.async_keep_alive, datetime.timedelta(seconds=KEEPALIVE_INTERVAL))
+        )
+
+    @property
+    def available(self) -> bool:
+        """Inverter can be read and written in this update"""
+        return self.sunspec_setup_success and not self.shutdown_flag and not self.sleep and self.d != None
+
+    @property
+    def status_offset(self) -> int | None:
+        """Offset of the operating state in the measurands model"""
+        if self.measurands_mid == DER_MEASURE_AC_MID:
+            return INVST_OFFSET_7XX
+        if self.measurands_mid != None:
+            return ST_OFFSET_1XX
+        return None
+
+    @property
+    def idle(self) -> bool:
+        """Inverter reported that it is off, sleeping or in standby"""
+        idle_states = IDLE_STATES_7XX if self.measurands_mid == DER_MEASURE_AC_MID else IDLE_STATES_1XX
+        return self.status in idle_states
+
+    def shutdown(self) -> None:
+        """Stop reading and writing and stop the setup and reconnect tasks, called on unload"""
+        self.shutdown_flag = True
+        self.connection.online_events.discard(self.network_event)
+        for task in (self.setup_task, self.reconnect_task):
+            if task != None and not task.done():
+                task.cancel()
+
+    def start_setup(self) -> None:
+        """Set up the SunSpec connection in the background, so HA startup doesn't wait for the device"""
+        self.setup_task = self.config_entry.async_create_background_task(
+            self.hass, self.async_setup_with_retry(), name=f"SunSpec setup {self.cache_key}"
+        )
+
+    async def async_setup_with_retry(self) -> None:
+        """Retry the setup with jittered exponential backoff while the device is offline, like at night"""
+        attempt = 0
+        while True:
+            await self.async_sunspec_setup()
+            if self.sunspec_setup_success or self.shutdown_flag:
+                return  # set up, or the device lacks the needed models and retrying won't help
+            sleep_time = self.reconnect_delay(attempt)
+            attempt += 1
+            _LOGGER.info(f"SunSpec device is not reachable, retrying the setup in {sleep_time:.1f} s")
+            await self.async_wait_for_network(sleep_time)
+
+    async def async_sunspec_setup(self) -> None:
+        """Connect to SunSpec device, using the cached model layout if available and storing it after a scan"""
+        self.layout = await self.model_cache.async_get(self.cache_key)
+        await self.hass.async_add_executor_job(self.sunspec_setup)  # blocking call
+        if self.sunspec_setup_success and self.layout != None:
+            await self.model_cache.async_put(self.cache_key, self.layout)
+
+    def sunspec_setup(self) -> None:
+        """Connect to SunSpec device for config through yaml"""
+
+        _LOGGER.info("Setting up SunSpec connection")
+        self.shutdown_flag = False
+        # Connect to inverter with sunspec
+        try:
+            self.d = self.connect_and_scan()
+        except Exception as e:
+            _LOGGER.error(f"Failed to connect to SunSpec device, error: {e}")
+            return
+        
+        # Check which models and offsets to use for read and write
+        if self.layout_from_cache:
+            self.restore_models_and_offsets()
+        else:
+            self.set_models_and_offsets(d=self.d)
+        if not self.models_complete():
+            self.shutdown_flag = True
+            return
+
+        # Resolve the points used for read and write once, so they don't have to be searched every update
+        if not self.build_point_index(d=self.d):
+            self.shutdown_flag = True
+            return
+
+        # Get power rating of inverter, the rating model is only read at setup
+        if self.rating_mid != None:
+            try:
+                self.d.models[self.rating_mid][0].read()
+            except Exception as e:
+                _LOGGER.error(f"Failed to read the ratings model of the SunSpec device, error: {e}")
+                return
+            rating = self.offset_get(mid=self.rating_mid, trg_offset=self.WRtg_offset)
+        else:
+            rating = self.read_solaredge_rating()
+        if rating != None:
+            self.WRtg = int(rating)
+        _LOGGER.info(f"Max rated power read from SunSpec device: {rating} W")
+
+        if not self.layout_from_cache:
+            self.layout = device_layout(base_addr=self.d.base_addr, models=self.model_chain, resolved=self.resolved_models_and_offsets())
+
+        # SunSpec setup successful
+        self.sunspec_setup_success = True
+
+    async def async_read(self) -> bool:
+        """Read the inverter power and current power limit, returns False if the inverter could not be read"""
+        self.io.start_tick()
+        if not await self.read_registers():
+            return False
+        self.connection.notify_online()  # other slaves behind this connection can reconnect right away
+        self.W = self.offset_get(mid=self.measurands_mid, trg_offset=self.W_offset) # pyright: ignore[reportArgumentType]
+        self.status = self.offset_get(mid=self.measurands_mid, trg_offset=self.status_offset) # pyright: ignore[reportArgumentType]
+        return self.W != None
+
+    async def async_send_setpoint(self, sp_W: int, sp_pct: float, force: bool = False) -> None:
+        """Send this inverter's share of the site setpoint, if the write gate allows it"""
+        self.setpoint_W = sp_W
+        self.setpoint_pct = sp_pct
+        if self.write_gate.last_pct == None:
+            # Nothing written yet, compare with the limit that is currently active on the inverter
+            if self.brand == Brand.SOLAREDGE:
+                self.write_gate.last_pct = await self.read_solaredge_limit()
+            elif self.controls_mid != None:
+                self.write_gate.last_pct = self.offset_get(mid=self.controls_mid, trg_offset=self.WMaxLimPct_offset) # pyright: ignore[reportArgumentType]
+        now = time.monotonic()
+        # With a reversion time the limit is written again in time, also if it didn't change
+        last_write = self.write_gate.last_write_time
+        refresh = self.rvrt_tms > 0 and last_write != None and now - last_write >= self.rvrt_tms / 2
+        if not refresh and not self.write_gate.allow(sp_pct=sp_pct, now=now, force=force):
+            return
+        try:
+            written = await self.write_setpoint(sp_pct=sp_pct)
+        except asyncio.CancelledError:
+            # Preempted, the write may still reach the inverter from the executor, so the active limit is unknown
+            self.write_gate.last_pct = None
+            raise
+        if written:
+            self.write_gate.record_write(sp_pct=sp_pct, now=now)
+
+    async def read_registers(self) -> bool:
+        """Read the point groups that are due, including their scale factors, in as few Modbus reads as possible"""
+        if not self.scheduler.ready:
+            return False
+        now = time.monotonic()
+        groups = self.scheduler.due(now, all_groups=self.night)  # at night the operating state shows when the inverter wakes up
+        try:
+            await self.io.async_call(self.scheduler.plan(groups).execute, self.d)
+        except Exception as e:
+            if self.night:
+                _LOGGER.info(f"Inverter doesn't answer at night, reconnecting after sunrise. Read error: {e}")
+            else:
+                _LOGGER.error(f"Failed to read sunspec registers, trying to reconnect now. Read error: {e}")
+            self.start_reconnect()
+            return False
+        self.scheduler.mark_read(groups, now)
+        if POLL_SLOW in groups and self.rating_mid != None:
+            rating = self.offset_get(mid=self.rating_mid, trg_offset=self.WRtg_offset)  # pyright: ignore[reportArgumentType]
+            if rating != None and int(rating) != self.WRtg:
+                _LOGGER.info(f"Max rated power of SunSpec device changed from {self.WRtg} W to {rating} W")
+                self.WRtg = int(rating)
+        return True
+    
+    def offset_get(self, mid: int, trg_offset: int) -> float | None:
+        """Get a value from SunSpec device python instance, without reading"""
+        point = self.points.get((mid, trg_offset))
+        if point == None:
+            return None
+        val = point.cvalue
+        return val
+    
+    def build_point_index(self, d) -> bool:
+        """Index the points of the used SunSpec models by (model id, offset) and build the read plan
+        Returns False if a point needed for read or write is missing on the device
+        """
+        self.points = {}
+        for mid in [self.measurands_mid, self.rating_mid, self.controls_mid]:
+            if mid == None or mid not in d.models:
+                continue
+            for name, point in d.models[mid][0].points.items():
+                self.points[(mid, point.offset)] = point
+        
+        self.written_controls = None  # Write the controls again to the new points
+        
+        # Report missing points once here, instead of on every update
+        all_found = True
+        for mid, offset in [
+            (self.measurands_mid, self.W_offset),
+            (self.rating_mid, self.WRtg_offset),
+            (self.controls_mid, self.WMaxLimPct_offset),
+        ]:
+            if mid == None and self.brand == Brand.SOLAREDGE:
+                continue  # SolarEdge proprietary registers are used instead
+            if (mid, offset) not in self.points:
+                _LOGGER.error(f"SunSpec point with model id {mid} and offset {offset} was not found on the SunSpec device")
+                all_found = False
+        if not all_found:
+            return False
+
+        # W is read every update, WMaxLimPct and the operating state at the medium and WRtg at the slow interval
+        fast = [self.points[(self.measurands_mid, self.W_offset)]]  # pyright: ignore[reportIndexIssue]
+        medium = []
+        status_point = self.points.get((self.measurands_mid, self.status_offset))  # pyright: ignore[reportArgumentType]
+        if status_point != None:
+            medium.append(status_point)
+        if self.controls_mid != None:
+            medium.append(self.points[(self.controls_mid, self.WMaxLimPct_offset)])  # pyright: ignore[reportIndexIssue]
+        slow = []
+        if self.rating_mid != None:
+            slow.append(self.points[(self.rating_mid, self.WRtg_offset)])  # pyright: ignore[reportIndexIssue]
+        self.scheduler.set_points(fast=fast, medium=medium, slow=slow)
+        return True
+
+    def models_complete(self) -> bool:
+        """Check that a model was found for everything the inverter is used for"""
+        if self.measurands_mid == None:
+            return False
+        if self.brand == Brand.SOLAREDGE:
+            return True  # power limit and rating have proprietary registers
+        return self.controls_mid != None and self.rating_mid != None
+    
+    def set_models_and_offsets(self, d) -> None:
+        """Check which models are available on the SunSpec device"""
+        # Measurands model:
+        if DER_MEASURE_AC_MID in d.models:
+            self.measurands_mid = DER_MEASURE_AC_MID
+            self.W_offset = W_OFFSET_7XX
+        elif INVERTER_SINGLE_PHASE_MID in d.models:
+            self.measurands_mid = INVERTER_SINGLE_PHASE_MID
+            self.W_offset = W_OFFSET_1XX
+        elif INVERTER_SPLIT_PHASE_MID in d.models:
+            self.measurands_mid = INVERTER_SPLIT_PHASE_MID
+            self.W_offset = W_OFFSET_1XX
+        elif INVERTER_THREE_PAHSE_MID in d.models:
+            self.measurands_mid = INVERTER_THREE_PAHSE_MID
+            self.W_offset = W_OFFSET_1XX
+        else:
+            _LOGGER.error("No measurands model was found on the SunSpec device, this integration will now freeze")
+            self.shutdown_flag = True
+            return
+        
+        # Control model:
+        if DER_CTL_AC_MID in d.models:
+            self.controls_mid = DER_CTL_AC_MID
+            self.WMaxLimPct_offset = WMAXLIMPCT_OFFSET_7XX
+        elif CONTROLS_MID in d.models:
+            self.controls_mid = CONTROLS_MID
+            self.WMaxLimPct_offset = WMAXLIMPCT_OFFSET_1XX
+        elif self.brand == Brand.SOLAREDGE:
+            _LOGGER.info("No controls model was found on the SolarEdge device, the proprietary power limit register is used")
+        else:
+            _LOGGER.error("No controls model was found on the SunSpec device, this integration will now freeze")
+            self.shutdown_flag = True
+            return
+        
+        # Rating model:
+        if DER_CAPACITY_MID in d.models:
+            self.rating_mid = DER_CAPACITY_MID
+            self.WRtg_offset = WRTG_OFFSET_7XX
+        elif NAMEPLATE_MID in d.models:
+            self.rating_mid = NAMEPLATE_MID
+            self.WRtg_offset = WRTG_OFFSET_1XX
+        elif self.brand == Brand.SOLAREDGE:
+            _LOGGER.info("No ratings model was found on the SolarEdge device, the proprietary max active power register is used")
+        else:
+            _LOGGER.error("No ratings model was found on the SunSpec device, this integration will now freeze")
+            self.shutdown_flag = True
+            return
+    
+    def resolved_models_and_offsets(self) -> dict[str, int | None]:
+        """Models and offsets chosen by set_models_and_offsets(), to be stored in the model cache"""
+        return {attr: getattr(self, attr) for attr in RESOLVED_ATTRS}
+
+    def restore_models_and_offsets(self) -> None:
+        """Set models and offsets from the cached layout, instead of checking the scanned models"""
+        if self.layout == None:
+            return
+        for attr in RESOLVED_ATTRS:
+            setattr(self, attr, self.layout["resolved"][attr])
+    
+    async def write_setpoint(self, sp_pct: float) -> bool:
+        """Write a power setpoint to the SunSpec device, tailored to its brand, returns True if it was written"""
+        # SMA
+        if self.brand == Brand.SMA:
+            written = await self.write_sunspec_limit(sp_pct=sp_pct)
+        
+        #SolarEdge
+        elif self.brand == Brand.SOLAREDGE:
+            written = await self.write_solaredge_limit(sp_pct=sp_pct)
+        else:
+            _LOGGER.error("Writing setpoint to this inverter brand is not implemented")
+            return False
+        if written:
+            _LOGGER.info(f"Setpoint sent to inverter: {sp_pct} %")
+            self.last_setpoint_W = self.setpoint_W
+        return written
+
+    def limit_controls(self) -> dict[int, float]:
+        """Values of the control points next to the power limit in the controls model, by offset"""
+        if self.controls_mid == CONTROLS_MID:
+            return {
+                WINTMS_OFFSET_1XX: self.win_tms,
+                RVRTTMS_OFFSET_1XX: self.rvrt_tms,
+                RMPTMS_OFFSET_1XX: self.rmp_tms,
+                WMAXLIM_ENA_OFFSET_1XX: 1,
+            }
+        if self.controls_mid == DER_CTL_AC_MID:
+            return {
+                WMAXLIMPCT_ENA_OFFSET_7XX: 1,
+                WMAXLIMPCT_RVRT_OFFSET_7XX: self.rvrt_pct,
+                WMAXLIMPCT_ENA_RVRT_OFFSET_7XX: 1 if self.rvrt_tms > 0 else 0,
+                WMAXLIMPCT_RVRT_TMS_OFFSET_7XX: self.rvrt_tms,
+            }
+        return {}
+
+    async def write_sunspec_limit(self, sp_pct: float) -> bool:
+        """
+        Write WMaxLimPct of the controls model. The enable, time window, reversion and ramp points
+        are only written when their settings changed, in the same Modbus write as the limit
+        """
+        # The scale factor of the point is refreshed with the slow point group by read_registers()
+        point = self.points.get((self.controls_mid, self.WMaxLimPct_offset))  # pyright: ignore[reportArgumentType]
+        if point == None:
+            return False
+        point.cvalue = sp_pct
+
+        controls = self.limit_controls()
+        control_points = [self.points.get((self.controls_mid, offset)) for offset in controls]  # pyright: ignore[reportArgumentType]
+        write_controls = self.controls_supported and controls != self.written_controls and None not in control_points
+        try:
+            if write_controls:
+                for control_point, value in zip(control_points, controls.values()):
+                    control_point.cvalue = value  # pyright: ignore[reportOptionalMemberAccess]
+                await self.io.async_call(point.group.write)  # writes all dirty points, contiguous ones at once
+                self.written_controls = controls
+            else:
+                await self.io.async_write(point)
+        except Exception as e:
+            if not write_controls:
+                _LOGGER.error(f"Failed to write setpoint to inverter: {e}")
+                return False
+            # The device may not implement the control points, only write the limit from now on
+            _LOGGER.warning(f"Failed to write the power limit controls to inverter, only the power limit is written from now on: {e}")
+            self.controls_supported = False
+            for control_point in control_points:
+                control_point.dirty = False  # pyright: ignore[reportOptionalMemberAccess]
+            return await self.write_sunspec_limit(sp_pct=sp_pct)
+        if self.verify_writes:
+            await self.verify_setpoint(point=point, sp_pct=sp_pct)
+        return True
+
+    async def write_solaredge_limit(self, sp_pct: float) -> bool:
+        """Write the proprietary active power limit register of a SolarEdge inverter (integer percentage)"""
+        if self.d == None:
+            return False
+        limit = int(round(sp_pct))
+        try:
+            await self.io.async_call(self.d.write, SOLAREDGE_ACTIVE_POWER_LIMIT_ADDR, mb.u16_to_data(limit))
+        except Exception as e:
+            _LOGGER.error(f"Failed to write setpoint to inverter: {e}")
+            return False
+        if self.verify_writes:
+            try:
+                data = await self.io.async_call(self.d.read, SOLAREDGE_ACTIVE_POWER_LIMIT_ADDR, 1)
+            except Exception as e:
+                _LOGGER.warning(f"Failed to read back setpoint from inverter: {e}")
+                return True
+            if mb.data_to_u16(data) != limit:
+                self.write_gate.verify_fail_count += 1
+                _LOGGER.warning(f"Setpoint read back from inverter ({mb.data_to_u16(data)} %) differs from the written setpoint ({limit} %)")
+        return True
+
+    async def read_solaredge_limit(self) -> float | None:
+        """Read the proprietary active power limit register of a SolarEdge inverter [%]"""
+        if self.d == None:
+            return None
+        try:
+            data = await self.io.async_call(self.d.read, SOLAREDGE_ACTIVE_POWER_LIMIT_ADDR, 1)
+        except Exception as e:
+            _LOGGER.warning(f"Failed to read the active power limit from SolarEdge inverter: {e}")
+            return None
+        return mb.data_to_u16(data)
+
+    def read_solaredge_rating(self) -> float | None:
+        """Read the max active power of a SolarEdge inverter without ratings model (blocking call)"""
+        try:
+            rating = solaredge_f32(self.d.read(SOLAREDGE_MAX_ACTIVE_POWER_ADDR, 2))  # pyright: ignore[reportOptionalMemberAccess]
+        except Exception as e:
+            _LOGGER.error(f"Failed to read max active power from SolarEdge inverter: {e}")
+            return None
+        return rating if rating > 0 and rating < float("inf") else None
+
+    async def verify_setpoint(self, point, sp_pct: float) -> None:
+        """Read the written power limit back and count it if the inverter did not accept it"""
+        try:
+            await self.io.async_read(point)
+        except Exception as e:
+            _LOGGER.warning(f"Failed to read back setpoint from inverter: {e}")
+            return
+        tolerance = 10 ** (point.sf_value or 0)  # resolution of the register
+        if point.cvalue == None or abs(point.cvalue - sp_pct) > tolerance:
+            self.write_gate.verify_fail_count += 1
+            _LOGGER.warning(f"Setpoint read back from inverter ({point.cvalue} %) differs from the written setpoint ({sp_pct} %)")
+    
+    async def async_keep_alive(self, now: datetime.datetime) -> None:
+        """Check an idle connection with a small read, so a dropped socket is noticed before the next write"""
+        if self.d == None or self.shutdown_flag or self.sleep:
+            return
+        if time.monotonic() - self.connection.last_activity < KEEPALIVE_INTERVAL:
+            return
+        try:
+            await self.io.async_call(self.check_device)
+        except Exception as e:
+            _LOGGER.warning(f"Keep-alive read to SunSpec device failed, trying to reconnect now. Error: {e}")
+            self.start_reconnect()
+
+    def check_device(self) -> bool:
+        """Check with a header read that the SunSpec device still answers with the known layout (blocking call)"""
+        if self.d == None or self.d.base_addr == None:
+            return False
+        return self.d.read(self.d.base_addr, 2) == b"SunS"
+
+    def start_reconnect(self) -> None:
+        """Reconnect in a background task, so the other inverters keep being controlled meanwhile"""
+        if self.reconnect_task != None and not self.reconnect_task.done():
+            return
+        self.sleep = True
+        self.reachable = None
+        self.reconnect_count += 1
+        self.reconnect_task = self.config_entry.async_create_background_task(
+            self.hass, self.try_reconnect(), name=f"SunSpec reconnect {self.cache_key}"
+        )
+
+    async def async_wait_for_network(self, timeout: float) -> None:
+        """
+        Wait up to timeout seconds before the next connection attempt. The wait ends early when another
+        slave on the same connection reads successfully, or when a TCP probe finds the device reachable
+        after it was unreachable, so a device that comes back doesn't wait out a long backoff
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self.network_event.clear()
+        self.connection.online_events.add(self.network_event)
+        try:
+            while (remaining := deadline - loop.time()) > 0:
+                # No probes at night, the coordinator sets the event at sunrise
+                wait = remaining if self.night else min(RECONNECT_PROBE_INTERVAL, remaining)
+                try:
+                    await asyncio.wait_for(self.network_event.wait(), timeout=wait)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                if self.night:
+                    continue
+                reachable = await self.async_probe()
+                was_reachable, self.reachable = self.reachable, reachable
+                if reachable and was_reachable == False:
+                    _LOGGER.info("SunSpec device is reachable again, reconnecting now")
+                    return
+        finally:
+            self.connection.online_events.discard(self.network_event)
+
+    async def async_probe(self) -> bool:
+        """Check that the device accepts TCP connections, without a Modbus request"""
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(self.IP, self.PORT), timeout=self.modbus_timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
+    def reconnect_delay(self, attempt: int) -> float:
+        """Backoff delay by day, the night poll interval at night (a day if polling stops, sunrise ends the wait)"""
+        if not self.night:
+            return backoff_delay(attempt)
+        return self.night_poll_interval if self.night_poll_interval > 0 else 86400
+
+    async def try_reconnect(self) -> None:
+        """Reopen the connection with jittered exponential backoff, the device is only scanned again if its layout changed"""
+        attempt = 0
+        self.sleep = True
+        while not self.shutdown_flag:
+            sleep_time = self.reconnect_delay(attempt)
+            _LOGGER.info(f"Reconnecting to SunSpec device in {sleep_time:.1f} s")
+            await self.async_wait_for_network(sleep_time)
+            attempt += 1
+            self.reconnect_attempt_count += 1
+            try:
+                if await self.io.async_call(self.check_device):
+                    break  # socket reopened, existing models and points are still valid
+
+                # Device was never set up or its layout changed, so create the models again
+                self.d = await self.hass.async_add_executor_job(self.connect_and_scan)  # blocking call
+                if len(self.d.models) == 0:
+                    _LOGGER.error("Modbus client succesfully reconnected to slave, but no SunSpec models are available. This integration will now shut down, a manual restart of Home Assistant is required to resume.")
+                    self.shutdown_flag = True
+                    return
+                if not self.layout_from_cache:  # the device was scanned again, so its layout may have changed
+                    self.set_models_and_offsets(d=self.d)
+                    self.layout = device_layout(base_addr=self.d.base_addr, models=self.model_chain, resolved=self.resolved_models_and_offsets())
+                    await self.model_cache.async_put(self.cache_key, self.layout)
+                if not self.build_point_index(d=self.d):  # Points of the old device instance are no longer valid
+                    # Scan the device again in the next attempt, instead of trusting this device instance or the cache
+                    _LOGGER.warning("Reconnected to SunSpec device, but points needed for control are missing")
+                    self.d = None
+                    self.layout = None
+                    continue
+                break
+            except Exception as e:
+                _LOGGER.warning(f"Failed reconnecting to SunSpec device: {e}")
+        if self.shutdown_flag:
+            return
+        self.sleep = False
+        _LOGGER.info("Modbus client successfully reconnected to slave")
+    
+    def connect_and_scan(self) -> "SunSpecModbusClientDeviceTCP":
+        """
+        Connect to the SunSpec device and scan its model headers, unless the cached model layout still matches
+        (blocking call). Only the models this integration can use are created
+        """
+        d = pooled_device(connection=self.connection, slave_id=self.SLAVE_ID)
+        self.layout_from_cache = False
+        if self.layout != None:
+            try:
+                self.layout_from_cache = load_cached_models(d=d, layout=self.layout)
+            except Exception as e:
+                _LOGGER.warning(f"Failed to use cached SunSpec model layout, scanning the device instead: {e}")
+        if self.layout_from_cache:
+            _LOGGER.info("SunSpec models were created from the cached layout, skipped the device scan")
+            self.model_chain = self.layout["models"]  # pyright: ignore[reportOptionalSubscript]
+        else:
+            self.model_chain = scan_model_chain(d=d)
+            create_models(d=d, models=self.model_chain, mids=SUPPORTED_MIDS)
+        return d
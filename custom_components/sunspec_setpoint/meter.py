@@ -0,0 +1,149 @@
+import abc
+import logging
+import datetime
+
+from typing import Any, Mapping, NamedTuple
+from homeassistant.const import ATTR_UNIT_OF_MEASUREMENT, STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.core import HomeAssistant, State
+from homeassistant.util import dt as dt_util
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+# Factor to convert a power unit to Watt
+POWER_UNIT_FACTORS: dict[str, float] = {
+    "mW": 1e-3,
+    "W": 1.0,
+    "kW": 1e3,
+    "MW": 1e6,
+    "GW": 1e9,
+}
+
+class PowerStateConverter:
+    """
+    Converts power entity states to Watt. The unit factor of an entity is resolved once and
+    only looked up again when the attributes of the entity change, so a tick costs a float parse
+    """
+
+    def __init__(self) -> None:
+        # entity_id -> (attributes the factor was resolved from, factor or None for an unknown unit)
+        self._factors: dict[str, tuple[Mapping[str, Any], float | None]] = {}
+
+    def factor(self, state: State) -> float | None:
+        """Unit factor of the entity, HA keeps the same attributes object while they don't change"""
+        cached = self._factors.get(state.entity_id)
+        if cached != None and cached[0] is state.attributes:
+            return cached[1]
+        unit = state.attributes.get(ATTR_UNIT_OF_MEASUREMENT)
+        factor = POWER_UNIT_FACTORS.get(unit)  # pyright: ignore[reportArgumentType]
+        if factor == None and (cached == None or cached[1] != None):
+            _LOGGER.error(f"Provided power entity {state.entity_id} has no known unit: {unit}")
+        self._factors[state.entity_id] = (state.attributes, factor)
+        return factor
+
+    def to_watt(self, state: State | None) -> float | None:
+        """Power of the entity in Watt, None if it is missing, unavailable, unknown or not a number"""
+        if state == None or state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+            return None
+        factor = self.factor(state)
+        if factor == None:
+            return None
+        try:
+            return float(state.state) * factor
+        except ValueError:
+            _LOGGER.warning(f"The state \"{state.state}\" of provided power entity {state.entity_id} could not be parsed as a number")
+            return None
+
+    def invalidate(self, entity_id: str | None = None) -> None:
+        """Forget the resolved unit of one entity, or of all entities"""
+        if entity_id == None:
+            self._factors.clear()
+        else:
+            self._factors.pop(entity_id, None)
+
+class MeterSnapshot(NamedTuple):
+    """Grid power at one moment, built from states that were reported together"""
+    import_W: float
+    export_W: float
+    timestamp: datetime.datetime    # Latest report of the meter entities in this snapshot
+    aligned: bool                   # False while only part of the entities reported a new reading
+
+def reported_at(state: State) -> datetime.datetime:
+    """Time the entity last reported, also when its value didn't change (HA 2024.7+)"""
+    return getattr(state, "last_reported", state.last_updated)
+
+class GridMeter(abc.ABC):
+    """Reads the grid power from one or more meter entities as one consistent snapshot"""
+
+    def __init__(self, entity_ids: list[str], converter: PowerStateConverter, max_skew: float = METER_MAX_SKEW) -> None:
+        self.entity_ids = entity_ids    # Meter entities, the coordinator listens to them in event mode
+        self.converter = converter
+        self.max_skew = max_skew        # [s] max time between the reports of the entities of one reading
+        self.last_changed: dict[str, datetime.datetime] = {}  # Last change of every entity in the previous complete reading
+
+    @abc.abstractmethod
+    def net_power(self, values: list[float]) -> float:
+        """Grid power from the entity values in Watt, positive when importing"""
+
+    def current_net_power(self, hass: HomeAssistant) -> float | None:
+        """Grid power of the current states in Watt, without taking a reading, None if a value is missing"""
+        values = [self.converter.to_watt(hass.states.get(entity_id)) for entity_id in self.entity_ids]
+        if None in values:
+            return None
+        return self.net_power(values)  # pyright: ignore[reportArgumentType]
+
+    def snapshot(self, hass: HomeAssistant) -> MeterSnapshot | None:
+        """Current grid power, None if an entity is missing or has no usable value"""
+        states = [hass.states.get(entity_id) for entity_id in self.entity_ids]
+        values = []
+        for state in states:
+            value = self.converter.to_watt(state)
+            if value == None:
+                return None
+            values.append(value)
+        net = self.net_power(values)
+
+        # Entities of one reading report one by one. Only the entities whose value changed since the previous
+        # complete reading are compared, an unchanged entity (like export while importing) is part of every
+        # reading. The reading is complete once the changes are within max_skew, or if no other change
+        # followed within max_skew
+        newest = max(reported_at(state) for state in states)  # pyright: ignore[reportArgumentType, reportCallIssue]
+        changed = [
+            state.last_changed for state in states  # pyright: ignore[reportOptionalMemberAccess]
+            if state.last_changed != self.last_changed.get(state.entity_id)  # pyright: ignore[reportOptionalMemberAccess]
+        ]
+        aligned = True
+        if len(self.last_changed) > 0 and len(changed) > 1:
+            skew = (max(changed) - min(changed)).total_seconds()
+            age = (dt_util.utcnow() - max(changed)).total_seconds()
+            aligned = skew <= self.max_skew or age > self.max_skew
+        if aligned:
+            self.last_changed = {state.entity_id: state.last_changed for state in states}  # pyright: ignore[reportOptionalMemberAccess]
+        return MeterSnapshot(import_W=max(net, 0.0), export_W=max(-net, 0.0), timestamp=newest, aligned=aligned)
+
+class ImportExportMeter(GridMeter):
+    """Separate import and export power entities, like a DSMR P1 meter"""
+
+    def net_power(self, values: list[float]) -> float:
+        pwr_import, pwr_export = values
+        return pwr_import - pwr_export
+
+class NetMeter(GridMeter):
+    """One signed net power entity (Shelly EM, HomeWizard P1), or one signed entity per phase that are summed"""
+
+    def __init__(self, entity_ids: list[str], converter: PowerStateConverter, export_positive: bool = False, max_skew: float = METER_MAX_SKEW) -> None:
+        super().__init__(entity_ids=entity_ids, converter=converter, max_skew=max_skew)
+        self.sign = -1.0 if export_positive else 1.0  # Some meters count export as positive
+
+    def net_power(self, values: list[float]) -> float:
+        return self.sign * sum(values)
+
+def grid_meter_from_config(config: Mapping[str, Any], converter: PowerStateConverter) -> GridMeter:
+    """Create the grid meter of the energy meter config step, entries without a mode use import/export entities"""
+    mode = config.get(CONF_METER_MODE, MeterMode.IMPORT_EXPORT)
+    export_positive = bool(config.get(CONF_EXPORT_POSITIVE, False))
+    if mode == MeterMode.NET:
+        return NetMeter(entity_ids=[config[CONF_NET_PWR_ENT_ID]], converter=converter, export_positive=export_positive)
+    if mode == MeterMode.PHASES:
+        return NetMeter(entity_ids=list(config[CONF_PHASE_PWR_ENT_IDS]), converter=converter, export_positive=export_positive)
+    return ImportExportMeter(entity_ids=[config[CONF_PWR_IMP_ENT_ID], config[CONF_PWR_EXP_ENT_ID]], converter=converter)
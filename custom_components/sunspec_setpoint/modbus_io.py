@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+from typing import Any, Callable
+from homeassistant.core import HomeAssistant
+
+from .instrumentation import LatencyHistogram
+
+class ModbusIO:
+    """Run blocking SunSpec register access in the executor, so the event loop never waits on the inverter"""
+
+    def __init__(self, hass: HomeAssistant, timeout: float) -> None:
+        self.hass = hass
+        self.timeout = timeout                      # Max time [s] the coordinator waits for one Modbus call
+        self._lock = threading.Lock()               # Prevents a timed out call from overlapping with the next one
+        self.call_count: int = 0                    # Total number of Modbus calls
+        self.timeout_count: int = 0                 # Total number of Modbus calls that timed out
+        self.error_count: int = 0                   # Total number of Modbus calls that failed, timeouts included
+        self.histogram: LatencyHistogram | None = None  # Round-trip times, only recorded while instrumentation is on
+        self.tick_wait_time: float = 0.0            # Time [s] spent waiting on Modbus calls in the current tick
+        self.tick_loop_time: float = 0.0            # Time [s] the event loop itself spent in Modbus calls this tick
+
+    def start_tick(self) -> None:
+        """Reset the per-tick timings"""
+        self.tick_wait_time = 0.0
+        self.tick_loop_time = 0.0
+
+    def _locked_call(self, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            return func(*args)
+
+    async def async_call(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking Modbus call in the executor with a timeout"""
+        self.call_count += 1
+        start = time.monotonic()
+        job = self.hass.async_add_executor_job(self._locked_call, func, *args)
+        self.tick_loop_time += time.monotonic() - start  # only scheduling the job happens on the loop
+        try:
+            return await asyncio.wait_for(job, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeout_count += 1
+            self.error_count += 1
+            raise TimeoutError(f"Modbus call did not finish within {self.timeout} s")
+        except Exception:
+            self.error_count += 1
+            raise
+        finally:
+            duration = time.monotonic() - start
+            self.tick_wait_time += duration
+            if self.histogram != None:
+                self.histogram.observe(duration)
+
+    async def async_read(self, point) -> None:
+        """Read a SunSpec point from the device"""
+        await self.async_call(point.read)
+
+    async def async_write(self, point) -> None:
+        """Write a SunSpec point to the device"""
+        await self.async_call(point.write)
@@ -0,0 +1,154 @@
+import logging
+import sunspec2.mb as mb
+
+from typing import Any
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_KEY = f"{DOMAIN}.model_cache"
+STORAGE_VERSION = 1
+
+# Coordinator attributes resolved by set_models_and_offsets(), stored with the layout
+RESOLVED_ATTRS = [
+    "measurands_mid",
+    "controls_mid",
+    "rating_mid",
+    "W_offset",
+    "WRtg_offset",
+    "WMaxLimPct_offset",
+]
+
+def cache_key(ip: str, port: int, slave_id: int) -> str:
+    """Key of a SunSpec device in the model cache"""
+    return f"{ip}:{port}:{slave_id}"
+
+class ModelCache:
+    """Persist the SunSpec model layout of devices in HA storage, so later setups can skip the scan"""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._store: Store[dict[str, Any]] = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._layouts: dict[str, Any] | None = None
+
+    async def async_get(self, key: str) -> dict[str, Any] | None:
+        """Return the cached layout of a device, or None if it was never stored"""
+        if self._layouts == None:
+            self._layouts = await self._store.async_load() or {}
+        return self._layouts.get(key)
+
+    async def async_put(self, key: str, layout: dict[str, Any]) -> None:
+        """Store the layout of a device"""
+        if self._layouts == None:
+            self._layouts = await self._store.async_load() or {}
+        if self._layouts.get(key) == layout:
+            return
+        self._layouts[key] = layout
+        await self._store.async_save(self._layouts)
+
+def device_layout(base_addr: int, models: list[list[int]], resolved: dict[str, int | None]) -> dict[str, Any]:
+    """Describe the model chain of a SunSpec device"""
+    return {
+        "base_addr": base_addr,
+        "models": models,
+        "resolved": resolved,
+    }
+
+def cached_headers_match(d, models: list[list[int]], mids: list[int]) -> bool:
+    """
+    Check the headers of the used models and of the last model, and the end marker after it (blocking call).
+    The first header is checked with the SunSpec marker, the models in between are never addressed
+    """
+    last_mid, last_addr, last_len = models[-1]
+    checks = [(mid, addr, length) for mid, addr, length in models[1:-1] if mid in mids]
+    if len(models) > 1:
+        checks.append((last_mid, last_addr, last_len))
+    for mid, addr, length in checks:
+        header = d.read(addr, 2)
+        if mb.data_to_u16(header[:2]) != mid or mb.data_to_u16(header[2:4]) != length:
+            _LOGGER.info(f"Cached header of SunSpec model {mid} at address {addr} does not match the device")
+            return False
+    if mb.data_to_u16(d.read(last_addr + last_len + 2, 1)) != mb.SUNS_END_MODEL_ID:
+        _LOGGER.info("SunSpec model chain of the device continues after the cached models")
+        return False
+    return True
+
+def scan_model_chain(d) -> list[list[int]]:
+    """
+    Find the SunSpec base address and walk the model headers, without reading or creating the models
+    (blocking call). Returns [model id, address, length] of every model on the device
+    """
+    header = b""
+    for base_addr in d.base_addr_list:
+        try:
+            header = d.read(base_addr, 4)
+        except Exception as e:
+            _LOGGER.debug(f"No SunSpec register map at base address {base_addr}: {e}")
+            continue
+        if header[:4] == b"SunS":
+            d.base_addr = base_addr
+            break
+    else:
+        raise ConnectionError(f"No SunSpec register map found at base addresses {d.base_addr_list}")
+
+    models = []
+    addr = d.base_addr + 2
+    header = header[4:]
+    while True:
+        if len(header) < 4:
+            header = d.read(addr, 2)
+        mid = mb.data_to_u16(header[:2])
+        if mid == mb.SUNS_END_MODEL_ID:
+            break
+        length = mb.data_to_u16(header[2:4])
+        models.append([mid, addr, length])
+        addr += length + 2
+        header = b""
+    return models
+
+def create_models(d, models: list[list[int]], mids: list[int]) -> None:
+    """
+    Create the models with the given ids from their [model id, address, length] headers, the other
+    models of the device are skipped, so only their definitions are loaded (blocking call)
+    """
+    for mid, addr, length in models:
+        if mid not in mids or mid in d.models:
+            continue
+        model = d.model_class(
+            model_id=mid,
+            model_addr=addr,
+            model_len=length,
+            data=mb.u16_to_data(mid) + mb.u16_to_data(length),
+            mb_device=d,
+        )
+        d.add_model(model)
+
+def load_cached_models(d, layout: dict[str, Any]) -> bool:
+    """
+    Create the used models of a SunSpec device from a cached layout, without scanning (blocking call)
+    The headers of the first, used and last models and the end marker validate that the layout still
+    matches the device, returns False if it does not
+    """
+    base_addr = layout["base_addr"]
+    first_mid, first_addr, first_len = layout["models"][0]
+    header = d.read(base_addr, 4)  # "SunS" marker, followed by ID and length of the first model
+    if (
+        len(header) < 8 or
+        header[:4] != b"SunS" or
+        first_addr != base_addr + 2 or
+        mb.data_to_u16(header[4:6]) != first_mid or
+        mb.data_to_u16(header[6:8]) != first_len
+    ):
+        _LOGGER.info(f"Cached SunSpec model layout does not match the device at base address {base_addr}")
+        return False
+
+    resolved = layout["resolved"]
+    used_mids = [mid for mid in (resolved["measurands_mid"], resolved["controls_mid"], resolved["rating_mid"]) if mid != None]
+    if not cached_headers_match(d=d, models=layout["models"], mids=used_mids):
+        return False
+    d.delete_models()
+    d.base_addr = base_addr
+    create_models(d=d, models=layout["models"], mids=used_mids)
+    return None not in [d.models.get(mid) for mid in used_mids]
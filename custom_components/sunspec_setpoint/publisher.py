@@ -0,0 +1,90 @@
+from typing import Any
+
+from .const import DEFAULT_PUBLISH_THRESHOLD, DEFAULT_PUBLISH_MIN_INTERVAL, DEFAULT_PUBLISH_MAX_INTERVAL
+
+class PublishSettings:
+    """When sensor values are written to the state machine (and so to the recorder), shared by the sensors of a site"""
+
+    def __init__(
+            self,
+            threshold: float = DEFAULT_PUBLISH_THRESHOLD,
+            min_interval: float = DEFAULT_PUBLISH_MIN_INTERVAL,
+            max_interval: float = DEFAULT_PUBLISH_MAX_INTERVAL,
+    ) -> None:
+        self.threshold = threshold          # [W] smaller changes are not published
+        self.min_interval = min_interval    # [s] min time between two published values
+        self.max_interval = max_interval    # [s] a value is published at least this often, also if it didn't change
+
+    def configure(self, threshold: float, min_interval: float, max_interval: float) -> None:
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+class PublishFilter:
+    """
+    Decides which values of one sensor are published. All values are collected in a window,
+    whose mean, min and max are published with the next value, so no resolution is lost
+    """
+
+    def __init__(self, settings: PublishSettings) -> None:
+        self.settings = settings
+        self.value: float | None = None             # Last published value
+        self.last_publish: float | None = None      # Monotonic timestamp of the last published value
+        self.stats: dict[str, Any] = {}             # Window statistics published with the last value
+        self._count: int = 0
+        self._total: float = 0.0
+        self._min: float | None = None
+        self._max: float | None = None
+
+    def update(self, value: float | None, now: float) -> bool:
+        """Add a value, returns True if it should be published"""
+        if value != None:
+            self._count += 1
+            self._total += value
+            self._min = value if self._min == None else min(self._min, value)
+            self._max = value if self._max == None else max(self._max, value)
+
+        if self.last_publish == None or (value == None) != (self.value == None):
+            return self.publish(value, now)  # first value, or the value became (un)known
+        if value == None or self.value == None:
+            return False
+        elapsed = now - self.last_publish
+        if elapsed < self.settings.min_interval:
+            return False
+        if abs(value - self.value) >= self.settings.threshold or elapsed >= self.settings.max_interval:
+            return self.publish(value, now)
+        return False
+
+    def publish(self, value: float | None, now: float) -> bool:
+        self.value = value
+        self.last_publish = now
+        if self._count > 0:
+            self.stats = {
+                "window_mean": round(self._total / self._count, 1),
+                "window_min": self._min,
+                "window_max": self._max,
+                "window_samples": self._count,
+            }
+        self._count = 0
+        self._total = 0.0
+        self._min = self._max = None
+        return True
+
+class PublishThrottle:
+    """
+    Decides when a diagnostic sensor whose state or attributes change on every update is written,
+    at most every max interval of the settings, and right away when its availability changes
+    """
+
+    def __init__(self, settings: PublishSettings) -> None:
+        self.settings = settings
+        self.last_publish: float | None = None  # Monotonic timestamp of the last written state
+        self.available: bool | None = None      # Availability of the last written state
+
+    def update(self, available: bool, now: float) -> bool:
+        """Returns True if the state should be written"""
+        if self.last_publish != None and available == self.available and now - self.last_publish < self.settings.max_interval:
+            return False
+        self.last_publish = now
+        self.available = available
+        return True
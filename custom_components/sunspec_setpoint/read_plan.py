@@ -0,0 +1,58 @@
+from typing import Any
+
+from .const import MAX_READ_COUNT
+
+def point_addr(point) -> int:
+    """Absolute Modbus address of a SunSpec point"""
+    return point.model.model_addr + point.offset
+
+def sf_point(point) -> Any:
+    """Return the scale factor point of a SunSpec point, or None if it has a fixed or no scale factor"""
+    if not point.sf:
+        return None
+    sf = point.group.points.get(point.sf)
+    if sf == None:
+        sf = point.model.points.get(point.sf)
+    return sf
+
+class ReadPlan:
+    """
+    Merge the registers of SunSpec points and their scale factors into as few
+    contiguous holding register reads as possible
+    """
+
+    def __init__(self, points: list[Any], scale_factors: bool = True) -> None:
+        # Add scale factor points, so they are refreshed together with their values
+        all_points = {}
+        for point in points:
+            all_points[point_addr(point)] = point
+            sf = sf_point(point) if scale_factors else None
+            if sf != None:
+                all_points[point_addr(sf)] = sf
+
+        # Greedily merge points, sorted by address, into blocks of at most MAX_READ_COUNT registers
+        self.blocks: list[tuple[int, int, list[Any]]] = []  # (start address, register count, points)
+        start = end = None
+        block_points = []
+        for addr in sorted(all_points):
+            point = all_points[addr]
+            point_end = addr + point.len
+            if start != None and end != None and point_end - start <= MAX_READ_COUNT:
+                end = max(end, point_end)
+                block_points.append(point)
+                continue
+            if start != None and end != None:
+                self.blocks.append((start, end - start, block_points))
+            start, end, block_points = addr, point_end, [point]
+        if start != None and end != None:
+            self.blocks.append((start, end - start, block_points))
+
+    def execute(self, d) -> None:
+        """Read all blocks from the SunSpec device and decode the points (blocking call)"""
+        for start, count, points in self.blocks:
+            data = d.read(start, count)
+            if len(data) < count * 2:
+                raise ValueError(f"Incomplete response for {count} registers at address {start}")
+            for point in points:
+                byte_offset = (point_addr(point) - start) * 2
+                point.set_mb(data=data[byte_offset:byte_offset + point.len * 2], dirty=False)
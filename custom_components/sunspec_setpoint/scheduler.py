@@ -0,0 +1,79 @@
+from typing import Any
+
+from .const import DEFAULT_MEDIUM_POLL_INTERVAL, DEFAULT_SLOW_POLL_INTERVAL
+from .read_plan import ReadPlan, sf_point
+
+POLL_FAST = "fast"      # Read every update, the power used for control
+POLL_MEDIUM = "medium"  # Power limit read-back and operating state
+POLL_SLOW = "slow"      # Rating and scale factors, which (almost) never change
+POLL_SLACK = 0.1        # Fraction of its interval a group may be read early, so update jitter doesn't skip a read
+
+class PollScheduler:
+    """
+    Reads the points of an inverter at the cadence of their group. The fast group is read every update,
+    the medium and slow groups when their interval passed. The groups due in an update are merged
+    into one read plan, so they cost as few Modbus transactions as possible
+    """
+
+    def __init__(
+            self,
+            medium_interval: float = DEFAULT_MEDIUM_POLL_INTERVAL,
+            slow_interval: float = DEFAULT_SLOW_POLL_INTERVAL,
+    ) -> None:
+        self.intervals: dict[str, float] = {POLL_MEDIUM: medium_interval, POLL_SLOW: slow_interval}  # [s]
+        self.groups: dict[str, list[Any]] = {POLL_FAST: [], POLL_MEDIUM: [], POLL_SLOW: []}
+        self.last_read: dict[str, float] = {}           # Monotonic timestamp of the last read of each group
+        self.read_counts: dict[str, int] = {POLL_FAST: 0, POLL_MEDIUM: 0, POLL_SLOW: 0}
+        self._plans: dict[frozenset[str], ReadPlan] = {}  # Read plan of every combination of due groups
+
+    @property
+    def ready(self) -> bool:
+        """Points are set, so there is something to read"""
+        return len(self.groups[POLL_FAST]) > 0
+
+    def configure(self, medium_interval: float, slow_interval: float) -> None:
+        self.intervals[POLL_MEDIUM] = medium_interval
+        self.intervals[POLL_SLOW] = slow_interval
+
+    def set_points(self, fast: list[Any], medium: list[Any], slow: list[Any]) -> None:
+        """
+        Set the points of every group, after a (re)connect. The scale factors of the fast and medium
+        points are moved to the slow group. Everything is read in the next update
+        """
+        scale_factors = [sf for point in fast + medium if (sf := sf_point(point)) != None]
+        self.groups = {POLL_FAST: fast, POLL_MEDIUM: medium, POLL_SLOW: slow + scale_factors}
+        self.last_read = {}
+        self._plans = {}
+
+    def due(self, now: float, all_groups: bool = False) -> frozenset[str]:
+        """Groups to read in an update at now, all_groups reads every group regardless of its interval"""
+        due = {POLL_FAST}
+        for group, interval in self.intervals.items():
+            last_read = self.last_read.get(group)
+            if all_groups or last_read == None or now - last_read >= interval * (1 - POLL_SLACK):
+                due.add(group)
+        return frozenset(group for group in due if self.groups[group])
+
+    def plan(self, groups: frozenset[str]) -> ReadPlan:
+        """Merged read plan of the groups, the slow group brings the scale factors of the others"""
+        plan = self._plans.get(groups)
+        if plan == None:
+            points = [point for group in groups for point in self.groups[group]]
+            plan = self._plans[groups] = ReadPlan(points, scale_factors=POLL_SLOW in groups)
+        return plan
+
+    def mark_read(self, groups: frozenset[str], now: float) -> None:
+        for group in groups:
+            self.last_read[group] = now
+            self.read_counts[group] += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        """Intervals, points and read counts per group, for diagnostics"""
+        return {
+            group: {
+                "interval": self.intervals.get(group),
+                "points": len(points),
+                "read_count": self.read_counts[group],
+            }
+            for group, points in self.groups.items()
+        }
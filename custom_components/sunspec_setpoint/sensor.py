@@ -1,14 +1,19 @@
 import logging
+import time
 
-from homeassistant.core import HomeAssistant
-from homeassistant.components.sensor import SensorEntity
+from typing import Any, Callable
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntity, SensorStateClass
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
-from homeassistant.const import UnitOfPower
+from homeassistant.const import EntityCategory, UnitOfPower, UnitOfTime
 from homeassistant import config_entries
 
 from .coordinator import PvCurtailingCoordinator
-from .const import DOMAIN, COORDINATOR
+from .inverter import SunSpecInverter
+from .publisher import PublishFilter, PublishThrottle
+from .const import DOMAIN, COORDINATOR, INVERTER, ADAPTIVE_WINDOW
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -18,37 +23,232 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ):
     """Set up sensor from config entry"""
-    pv_coordinator = hass.data[DOMAIN][COORDINATOR]
+    pv_coordinator = hass.data[DOMAIN][config_entry.entry_id][COORDINATOR]
+    inverter = hass.data[DOMAIN][config_entry.entry_id][INVERTER]
 
-    async_add_entities([SetpointSensor(coordinator=pv_coordinator), InverterPowerSensor(coordinator=pv_coordinator)])
+    entities: list[SensorEntity] = [
+        SetpointSensor(coordinator=pv_coordinator, inverter=inverter),
+        InverterPowerSensor(coordinator=pv_coordinator, inverter=inverter),
+        ModbusWaitTimeSensor(coordinator=pv_coordinator, inverter=inverter),
+        ModbusLatencySensor(coordinator=pv_coordinator, inverter=inverter),
+        SetpointWritesSensor(coordinator=pv_coordinator, inverter=inverter),
+        SuppressedWritesSensor(coordinator=pv_coordinator, inverter=inverter),
+    ]
+    # Site sensors are only added once, by the entry that created the site
+    if pv_coordinator.owner_entry_id == config_entry.entry_id:
+        entities.append(UpdateDurationSensor(coordinator=pv_coordinator))
+        entities.append(GridVolatilitySensor(coordinator=pv_coordinator))
+    async_add_entities(entities)
     _LOGGER.info("SunSpec Setpoint sensors were set up")
 
-class SetpointSensor(CoordinatorEntity, SensorEntity): # pyright: ignore[reportIncompatibleVariableOverride]
-    """Sensor to store and show power setpoint for inverter"""
+class InverterSensor(CoordinatorEntity, SensorEntity): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Sensor of one inverter of the site, unavailable while the inverter is not set up or reconnecting"""
 
-    _attr_name = "PV setpoint"
-    _attr_native_unit_of_measurement = UnitOfPower.WATT
+    def __init__(self, coordinator: PvCurtailingCoordinator, inverter: SunSpecInverter) -> None:
+        super().__init__(coordinator=coordinator)
+        self.coordinator = coordinator
+        self.inverter = inverter
+
+    @property
+    def available(self) -> bool: # pyright: ignore[reportIncompatibleVariableOverride]
+        return super().available and self.inverter.available
+
+class ThrottledSensor(CoordinatorEntity, SensorEntity): # pyright: ignore[reportIncompatibleVariableOverride]
+    """
+    Diagnostic sensor whose state or attributes change on every update, written at most every publish
+    max interval, so it doesn't add a recorder row per update
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
 
     def __init__(self, coordinator: PvCurtailingCoordinator) -> None:
         super().__init__(coordinator=coordinator)
         self.coordinator = coordinator
-    
+        self.throttle = PublishThrottle(coordinator.publish_settings)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        if self.throttle.update(self.available, time.monotonic()):
+            self.async_write_ha_state()
+
+class ThrottledInverterSensor(ThrottledSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Throttled diagnostic sensor of one inverter, unavailable while the inverter is not set up or reconnecting"""
+
+    def __init__(self, coordinator: PvCurtailingCoordinator, inverter: SunSpecInverter) -> None:
+        super().__init__(coordinator=coordinator)
+        self.inverter = inverter
+
+    @property
+    def available(self) -> bool: # pyright: ignore[reportIncompatibleVariableOverride]
+        return super().available and self.inverter.available
+
+class PublishedPowerSensor(InverterSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """
+    Power sensor that only writes significant changes to the state machine, at a limited rate,
+    with the mean, min and max of the skipped values as attributes
+    """
+
+    _attr_native_unit_of_measurement = UnitOfPower.WATT
+    _attr_device_class = SensorDeviceClass.POWER
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(
+            self,
+            coordinator: PvCurtailingCoordinator,
+            inverter: SunSpecInverter,
+            current_value: Callable[[], float | None],
+    ) -> None:
+        super().__init__(coordinator=coordinator, inverter=inverter)
+        self.current_value = current_value  # Latest value from the coordinator
+        self.publish_filter = PublishFilter(coordinator.publish_settings)
+        self.publish_filter.update(self.current_value(), time.monotonic())
+        self.published_available: bool = False  # Availability of the last written state
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        publish = self.publish_filter.update(self.current_value(), time.monotonic())
+        if publish or self.available != self.published_available:
+            self.published_available = self.available
+            self.async_write_ha_state()
+
     @property
     def native_value(self) -> float | None: # pyright: ignore[reportIncompatibleVariableOverride]
-        """Return setpoint so it gets stored by HA in the sensor"""
-        return self.coordinator.setpoint_W
+        """Return the last published value"""
+        return self.publish_filter.value
 
-class InverterPowerSensor(CoordinatorEntity, SensorEntity): # pyright: ignore[reportIncompatibleVariableOverride]
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Mean, min and max of the values since the previous published value"""
+        return self.publish_filter.stats
+
+class SetpointSensor(PublishedPowerSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Sensor to store and show power setpoint for inverter"""
+
+    _attr_name = "PV setpoint"
+
+    def __init__(self, coordinator: PvCurtailingCoordinator, inverter: SunSpecInverter) -> None:
+        # Setpoint of this inverter, so it gets stored by HA in the sensor
+        super().__init__(coordinator=coordinator, inverter=inverter, current_value=lambda: inverter.setpoint_W)
+
+class InverterPowerSensor(PublishedPowerSensor): # pyright: ignore[reportIncompatibleVariableOverride]
     """Sensor to store and show production power of inverter"""
 
     _attr_name = "Inverter power"
-    _attr_native_unit_of_measurement = UnitOfPower.WATT
 
-    def __init__(self, coordinator: PvCurtailingCoordinator) -> None:
-        super().__init__(coordinator=coordinator)
-        self.coordinator = coordinator
+    def __init__(self, coordinator: PvCurtailingCoordinator, inverter: SunSpecInverter) -> None:
+        # Power of the inverter, so it gets stored by HA in the sensor
+        super().__init__(coordinator=coordinator, inverter=inverter, current_value=lambda: inverter.W)
+
+class ModbusWaitTimeSensor(ThrottledInverterSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Sensor to show how long the last update waited on Modbus calls"""
+
+    _attr_name = "Modbus wait time"
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
 
     @property
     def native_value(self) -> float | None: # pyright: ignore[reportIncompatibleVariableOverride]
-        """Return power of inverter so it gets storen by HA in the sensor"""
-        return self.coordinator.W
\ No newline at end of file
+        """Return Modbus wait time of the last update in ms"""
+        return round(self.inverter.io.tick_wait_time * 1e3, 1)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, float | int]: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Failure counters, the call count and event loop time are in the diagnostics"""
+        return {
+            "timeout_count": self.inverter.io.timeout_count,
+            "error_count": self.inverter.io.error_count,
+            "reconnect_count": self.inverter.reconnect_count,
+            "reconnect_attempt_count": self.inverter.reconnect_attempt_count,
+        }
+
+class ModbusLatencySensor(ThrottledInverterSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Sensor to show the Modbus round-trip times, recorded while instrumentation is on"""
+
+    _attr_name = "Modbus latency"
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+
+    @property
+    def native_value(self) -> float | None: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Return the 95th percentile round-trip time in ms"""
+        if self.inverter.io.histogram == None:
+            return None
+        return self.inverter.io.histogram.percentile_ms(0.95)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Latency histogram"""
+        if self.inverter.io.histogram == None:
+            return None
+        return self.inverter.io.histogram.as_dict()
+
+class SetpointWritesSensor(ThrottledInverterSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Sensor to count setpoint writes to the inverter"""
+
+    _attr_name = "Setpoint writes"
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    @property
+    def native_value(self) -> int: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Return total number of setpoint writes"""
+        return self.inverter.write_gate.write_count
+
+    @property
+    def extra_state_attributes(self) -> dict[str, int]: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Writes in the last hour and failed read-back verifications"""
+        return {
+            "writes_last_hour": self.inverter.write_gate.writes_last_hour(time.monotonic()),
+            "verify_failures": self.inverter.write_gate.verify_fail_count,
+        }
+
+class SuppressedWritesSensor(ThrottledInverterSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Sensor to count setpoint writes suppressed by the write gate"""
+
+    _attr_name = "Suppressed setpoint writes"
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    @property
+    def native_value(self) -> int: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Return total number of suppressed setpoint writes"""
+        return self.inverter.write_gate.suppressed_count
+
+class UpdateDurationSensor(ThrottledSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Sensor to show how long the last site update took, recorded while instrumentation is on"""
+
+    _attr_name = "Control loop update duration"
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+
+    @property
+    def native_value(self) -> float | None: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Return duration of the last update in ms"""
+        if not self.coordinator.timings.enabled or self.coordinator.timings.last_duration == None:
+            return None
+        return round(self.coordinator.timings.last_duration * 1e3, 1)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Phase timings and event loop blocking time"""
+        if not self.coordinator.timings.enabled:
+            return None
+        return self.coordinator.timings.as_dict()
+
+class GridVolatilitySensor(ThrottledSensor): # pyright: ignore[reportIncompatibleVariableOverride]
+    """Sensor to show how much the grid power varied over the last updates, which the adaptive update interval follows"""
+
+    _attr_name = "Grid power volatility"
+    _attr_native_unit_of_measurement = UnitOfPower.WATT
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    @property
+    def native_value(self) -> float | None: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Return the standard deviation of the grid power over the adaptive window"""
+        variance = self.coordinator.history.stats(window=ADAPTIVE_WINDOW)["grid_variance_W2"]
+        if variance == None:
+            return None
+        return round(variance ** 0.5, 1)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]: # pyright: ignore[reportIncompatibleVariableOverride]
+        """Rolling statistics over the whole history and the current update interval"""
+        return {
+            **self.coordinator.history.stats(),
+            "update_interval_s": self.coordinator.update_interval.total_seconds() if self.coordinator.update_interval != None else None,
+        }
@@ -25,12 +25,12 @@ class CurtailmentSwitch(CoordinatorEntity, SwitchEntity): # pyright: ignore[repo
         return self.coordinator.system_switch
     
     async def async_turn_on(self, **kwargs) -> None:
-        self.coordinator.system_switch = True
+        await self.coordinator.async_set_system_switch(True)
         self.async_write_ha_state()
         _LOGGER.info("Curtailment system was activated")
 
     async def async_turn_off(self, **kwargs) -> None:
-        self.coordinator.system_switch = False
+        await self.coordinator.async_set_system_switch(False)
         self.async_write_ha_state()
         _LOGGER.info("Curtailment system was deactivated")
 
@@ -40,6 +40,8 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     """Set up switch from config entry"""
-    pv_coordinator = hass.data[DOMAIN][COORDINATOR]
+    pv_coordinator = hass.data[DOMAIN][config.entry_id][COORDINATOR]
+    if pv_coordinator.owner_entry_id != config.entry_id:
+        return  # the switch of a site with several inverters belongs to the entry that created the site
     async_add_entities([CurtailmentSwitch(pv_coordinator)])
     _LOGGER.info("SunSpec setpoint switch was set up")
\ No newline at end of file
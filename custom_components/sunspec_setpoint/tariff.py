@@ -0,0 +1,168 @@
+import bisect
+import datetime
+import logging
+
+from typing import Any, Mapping
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.core import State
+from homeassistant.util import dt as dt_util
+
+_LOGGER = logging.getLogger(__name__)
+
+# Attributes that hold the day-ahead price series, as published by the common price integrations
+# (Nord Pool, ENTSO-e, EnergyZero, Tibber)
+PRICE_SERIES_ATTRS = ("raw_today", "raw_tomorrow", "prices_today", "prices_tomorrow", "prices")
+START_KEYS = ("start", "time", "from", "startsAt", "start_time")
+END_KEYS = ("end", "till", "to", "end_time")
+PRICE_KEYS = ("value", "price", "total")
+
+def parse_time(value: Any) -> float | None:
+    """Timestamp of a datetime or ISO string"""
+    if isinstance(value, str):
+        value = dt_util.parse_datetime(value)
+    if not isinstance(value, datetime.datetime):
+        return None
+    return dt_util.as_utc(value).timestamp()
+
+def first_key(entry: Mapping[str, Any], keys: tuple[str, ...]) -> Any:
+    for key in keys:
+        if key in entry:
+            return entry[key]
+    return None
+
+class TariffSchedule:
+    """
+    Day-ahead prices indexed by interval. With equal intervals (the normal case) the interval
+    of a time is computed instead of searched, the current interval is cached between ticks
+    """
+
+    def __init__(self, starts: list[float], ends: list[float], prices: list[float], cutoff: float) -> None:
+        self.starts = starts    # Interval starts, timestamps in ascending order
+        self.ends = ends        # Interval ends
+        self.prices = prices
+        self.cutoff = cutoff    # Curtail during intervals priced below the cutoff
+        self.step: float | None = None  # Interval length if the intervals are equal and contiguous
+        lengths = {end - start for start, end in zip(starts, ends)}
+        if len(lengths) == 1 and all(end == next_start for end, next_start in zip(ends, starts[1:])):
+            self.step = lengths.pop()
+        self.windows: list[tuple[float, float]] = self.curtailment_windows()
+        self.transitions: list[float] = sorted({time for window in self.windows for time in window})
+        self._current: int | None = None  # Index of the interval found by the last lookup
+
+    @classmethod
+    def from_attributes(cls, attributes: Mapping[str, Any], cutoff: float) -> "TariffSchedule | None":
+        """Parse the price series of the tariff entity, None if it publishes none"""
+        intervals: dict[float, tuple[float | None, float]] = {}
+        for attr in PRICE_SERIES_ATTRS:
+            series = attributes.get(attr)
+            if not isinstance(series, list):
+                continue
+            for entry in series:
+                if not isinstance(entry, Mapping):
+                    continue
+                start = parse_time(first_key(entry, START_KEYS))
+                price = first_key(entry, PRICE_KEYS)
+                if start == None or price == None:
+                    continue
+                try:
+                    intervals[start] = (parse_time(first_key(entry, END_KEYS)), float(price))
+                except (TypeError, ValueError):
+                    continue
+        if len(intervals) == 0:
+            return None
+
+        starts = sorted(intervals)
+        ends, prices = [], []
+        for i, start in enumerate(starts):
+            end, price = intervals[start]
+            if end == None:
+                # Without end times an interval lasts until the next one, the last one as long as the one before
+                if i + 1 < len(starts):
+                    end = starts[i + 1]
+                else:
+                    end = start + (start - starts[i - 1] if i > 0 else 3600)
+            ends.append(end)
+            prices.append(price)
+        return cls(starts=starts, ends=ends, prices=prices, cutoff=cutoff)
+
+    def index(self, now: float) -> int | None:
+        """Interval containing now, None if the series doesn't cover it"""
+        current = self._current
+        if current != None and self.starts[current] <= now < self.ends[current]:
+            return current
+        if self.step != None:
+            i = int((now - self.starts[0]) // self.step)
+        else:
+            i = bisect.bisect_right(self.starts, now) - 1
+        if i < 0 or i >= len(self.starts) or not now < self.ends[i]:
+            return None
+        self._current = i
+        return i
+
+    def price_at(self, now: float) -> float | None:
+        i = self.index(now)
+        return None if i == None else self.prices[i]
+
+    def curtailment_windows(self) -> list[tuple[float, float]]:
+        """Merge consecutive intervals priced below the cutoff into (start, end) windows"""
+        windows: list[tuple[float, float]] = []
+        for start, end, price in zip(self.starts, self.ends, self.prices):
+            if price >= self.cutoff:
+                continue
+            if windows and windows[-1][1] == start:
+                windows[-1] = (windows[-1][0], end)
+            else:
+                windows.append((start, end))
+        return windows
+
+    def next_transition(self, now: float) -> float | None:
+        """Next start or end of a curtailment window"""
+        i = bisect.bisect_right(self.transitions, now)
+        return self.transitions[i] if i < len(self.transitions) else None
+
+class TariffEngine:
+    """Injection tariff of the tariff entity, from its day-ahead series if it publishes one, else from its state"""
+
+    def __init__(self, cutoff: float) -> None:
+        self.cutoff = cutoff                                    # Curtail below this injection tariff
+        self.schedule: TariffSchedule | None = None
+        self._attributes: Mapping[str, Any] | None = None      # Attributes the schedule was built from
+
+    def set_cutoff(self, cutoff: float) -> None:
+        if cutoff != self.cutoff:
+            self.cutoff = cutoff
+            self._attributes = None  # windows depend on the cutoff
+
+    def update(self, state: State) -> bool:
+        """Rebuild the schedule if the attributes of the entity changed, returns True if it was rebuilt"""
+        if state.attributes is self._attributes:
+            return False
+        self._attributes = state.attributes
+        self.schedule = TariffSchedule.from_attributes(state.attributes, cutoff=self.cutoff)
+        if self.schedule != None:
+            _LOGGER.debug(f"Tariff schedule with {len(self.schedule.starts)} intervals and {len(self.schedule.windows)} curtailment windows")
+        return True
+
+    def price(self, state: State, now: datetime.datetime) -> float | None:
+        """Injection tariff at now, None if it is unknown"""
+        self.update(state)
+        if self.schedule != None:
+            price = self.schedule.price_at(now.timestamp())
+            if price != None:
+                return price
+        if state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+            return None
+        try:
+            return float(state.state)
+        except ValueError:
+            _LOGGER.warning(f"The state \"{state.state}\" of the injection tariff entity {state.entity_id} could not be parsed as a number")
+            return None
+
+    def next_transition(self, now: datetime.datetime) -> datetime.datetime | None:
+        """Next start or end of a curtailment window, None without a day-ahead series"""
+        if self.schedule == None:
+            return None
+        transition = self.schedule.next_transition(now.timestamp())
+        if transition == None:
+            return None
+        return dt_util.utc_from_timestamp(transition)
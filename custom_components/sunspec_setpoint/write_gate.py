@@ -0,0 +1,64 @@
+from collections import deque
+
+from .const import DEFAULT_MIN_DELTA_PCT, DEFAULT_MIN_WRITE_INTERVAL, DEFAULT_MAX_WRITES_PER_HOUR
+
+class WriteGate:
+    """
+    Decides whether a setpoint is worth writing to an inverter. Some inverters store
+    the power limit in flash, so small, frequent or excessive writes are suppressed
+    """
+
+    def __init__(
+            self,
+            min_delta_pct: float = DEFAULT_MIN_DELTA_PCT,
+            min_interval: float = DEFAULT_MIN_WRITE_INTERVAL,
+            max_writes_per_hour: int = DEFAULT_MAX_WRITES_PER_HOUR,
+    ) -> None:
+        self.min_delta_pct = min_delta_pct              # [%] smaller setpoint changes are not written
+        self.min_interval = min_interval                # [s] min time between two writes
+        self.max_writes_per_hour = max_writes_per_hour  # write budget per rolling hour
+        self.last_pct: float | None = None              # Last written setpoint [%]
+        self.last_write_time: float | None = None       # Monotonic timestamp of the last write
+        self.write_times: deque[float] = deque()        # Timestamps of the writes in the last hour
+        self.write_count: int = 0                       # Total number of writes
+        self.suppressed_count: int = 0                  # Total number of suppressed writes
+        self.verify_fail_count: int = 0                 # Total number of writes that did not read back correctly
+
+    def configure(self, min_delta_pct: float, min_interval: float, max_writes_per_hour: int) -> None:
+        self.min_delta_pct = min_delta_pct
+        self.min_interval = min_interval
+        self.max_writes_per_hour = max_writes_per_hour
+
+    def writes_last_hour(self, now: float) -> int:
+        while self.write_times and now - self.write_times[0] > 3600:
+            self.write_times.popleft()
+        return len(self.write_times)
+
+    def allow(self, sp_pct: float, now: float, force: bool = False) -> bool:
+        """
+        Check if a setpoint should be written, force is used for user and safety commands
+        which skip the interval and budget checks, but are still not repeated. A forced repeat
+        isn't counted as suppressed, it's sent every update while the system switch is off
+        """
+        if self.last_pct != None:
+            delta = abs(sp_pct - self.last_pct)
+            to_limit = sp_pct in (0, 100)  # always allow fully releasing or fully curtailing
+            if delta == 0 or (delta < self.min_delta_pct and not to_limit):
+                if not (force and delta == 0):
+                    self.suppressed_count += 1
+                return False
+        if force:
+            return True
+        if self.last_write_time != None and now - self.last_write_time < self.min_interval:
+            self.suppressed_count += 1
+            return False
+        if self.writes_last_hour(now) >= self.max_writes_per_hour:
+            self.suppressed_count += 1
+            return False
+        return True
+
+    def record_write(self, sp_pct: float, now: float) -> None:
+        self.last_pct = sp_pct
+        self.last_write_time = now
+        self.write_times.append(now)
+        self.write_count += 1
@@ -0,0 +1,256 @@
+"""Replay of recorded site data through the control loop, for tests and option sweeps."""
+import array
+import csv
+import itertools
+import logging
+import math
+from typing import Any, Iterable, Mapping, NamedTuple, TextIO
+
+from homeassistant.util import dt as dt_util
+
+from custom_components.sunspec_setpoint import controller as controller_module
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.coordinator import PvCurtailingCoordinator
+from custom_components.sunspec_setpoint.history import reversals
+from custom_components.sunspec_setpoint.meter import MeterSnapshot
+from custom_components.sunspec_setpoint.tariff import parse_time
+from custom_components.sunspec_setpoint.write_gate import WriteGate
+
+# Columns of a replay series, pv_W is the PV power that was produced while recording,
+# it defaults to pv_potential_W for a recording without curtailment
+SERIES_COLUMNS = ("import_W", "export_W", "tariff", "pv_potential_W", "pv_W")
+REQUIRED_COLUMNS = SERIES_COLUMNS[:4]
+
+def parse_timestamp(value: Any) -> float | None:
+    """Timestamp of epoch seconds, or of a datetime or ISO string"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return parse_time(value)
+
+class ReplaySeries:
+    """Recorded site data sampled every step seconds, stored as one float array per column"""
+
+    def __init__(self, start: float, step: float, columns: Mapping[str, Iterable[float]]) -> None:
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise ValueError(f"Replay series is missing the columns {missing}")
+        self.start = start  # Timestamp of the first sample
+        self.step = step    # [s] time between two samples
+        self.import_W = array.array("d", columns["import_W"])
+        self.export_W = array.array("d", columns["export_W"])
+        self.tariff = array.array("d", columns["tariff"])
+        self.pv_potential_W = array.array("d", columns["pv_potential_W"])
+        self.pv_W = array.array("d", columns.get("pv_W", self.pv_potential_W))
+        if len({len(getattr(self, column)) for column in SERIES_COLUMNS}) != 1:
+            raise ValueError("Replay series columns have different lengths")
+
+    def __len__(self) -> int:
+        return len(self.tariff)
+
+    @property
+    def duration(self) -> float:
+        return len(self) * self.step
+
+    @classmethod
+    def from_history(
+            cls,
+            histories: Mapping[str, Iterable[tuple[float, float]]],
+            step: float,
+            start: float | None = None,
+            end: float | None = None,
+    ) -> "ReplaySeries":
+        """
+        Resample (timestamp, value) histories per column, like the recorder stores them (a row per
+        change), to one sample every step seconds. Every sample holds the last value before it
+        """
+        points = {column: sorted(history) for column, history in histories.items()}
+        if any(len(history) == 0 for history in points.values()):
+            raise ValueError("Replay series has a column without values")
+        if start == None:
+            start = max(history[0][0] for history in points.values())
+        if end == None:
+            end = max(history[-1][0] for history in points.values())
+        count = int((end - start) // step) + 1
+
+        columns: dict[str, array.array] = {}
+        for column, history in points.items():
+            values = array.array("d", bytes(8 * count))
+            i, value = 0, history[0][1]
+            for n in range(count):
+                t = start + n * step
+                while i < len(history) and history[i][0] <= t:
+                    value = history[i][1]
+                    i += 1
+                values[n] = value
+            columns[column] = values
+        return cls(start=start, step=step, columns=columns)
+
+    @classmethod
+    def from_csv(cls, file: TextIO, step: float) -> "ReplaySeries":
+        """
+        Read a CSV with a timestamp column (epoch seconds or ISO) and the series columns,
+        rows with values that are not numbers are skipped for that column
+        """
+        histories: dict[str, list[tuple[float, float]]] = {}
+        for row in csv.DictReader(file):
+            timestamp = parse_timestamp(row.get("timestamp"))
+            if timestamp == None:
+                continue
+            for column in SERIES_COLUMNS:
+                try:
+                    value = float(row[column])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                histories.setdefault(column, []).append((timestamp, value))
+        return cls.from_history(histories, step=step)
+
+    @classmethod
+    def from_history_csv(cls, file: TextIO, entity_columns: Mapping[str, str], step: float) -> "ReplaySeries":
+        """
+        Read the CSV export of the HA history panel (entity_id, state, last_changed), entity_columns
+        maps the entity ids to the series columns. Unavailable and unknown states are skipped
+        """
+        histories: dict[str, list[tuple[float, float]]] = {}
+        for row in csv.DictReader(file):
+            column = entity_columns.get(row.get("entity_id", ""))
+            timestamp = parse_timestamp(row.get("last_changed"))
+            if column == None or timestamp == None:
+                continue
+            try:
+                value = float(row["state"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            histories.setdefault(column, []).append((timestamp, value))
+        return cls.from_history(histories, step=step)
+
+class ReplayResult(NamedTuple):
+    """Metrics of one replay"""
+    duration: float                     # [s] replayed time
+    negative_price_export_Wh: float     # Energy exported while the tariff was negative
+    curtailed_yield_Wh: float           # PV energy that was available but not produced
+    write_count: int                    # Setpoints written to the inverter
+    suppressed_count: int               # Setpoints suppressed by the write gate
+    setpoint_reversals: int             # Times the setpoint changed direction
+    setpoint_travel_W: float            # Summed absolute setpoint changes
+
+class ReplayEngine:
+    """
+    Replays a recorded series through the setpoint calculation of a coordinator and a first order
+    inverter model, on simulated time. The grid power follows from the recorded household load
+    (import - export + recorded PV power) and the simulated inverter power
+    """
+
+    def __init__(
+            self,
+            coordinator: PvCurtailingCoordinator,
+            rating: float,
+            ramp_time: float = 5.0,
+            control_interval: float = UPDATE_INTERVAL,
+            meter_interval: float | None = None,
+    ) -> None:
+        self.coordinator = coordinator
+        self.rating = rating                        # [W] rated power of the simulated inverter
+        self.ramp_time = ramp_time                  # [s] time constant of the inverter following its limit
+        self.control_interval = control_interval    # [s] time between two setpoint calculations
+        self.meter_interval = control_interval if meter_interval == None else meter_interval  # [s] time between two meter readings
+
+    def reset(self) -> None:
+        """Start the coordinator from scratch, like after a restart"""
+        coordinator = self.coordinator
+        coordinator.controller.reset()
+        coordinator.curtailing = False
+        coordinator.setpoint_W = None
+        coordinator.setpoint_pct = None
+        coordinator.last_meter_time = None
+
+    def run(self, series: ReplaySeries, options: Mapping[str, Any] | None = None) -> ReplayResult:
+        """Replay the series, with the given options applied to the coordinator first"""
+        # The controllers log every calculation, which would dominate the replay time
+        controller_logger = logging.getLogger(controller_module.__name__)
+        level = controller_logger.level
+        controller_logger.setLevel(logging.WARNING)
+        try:
+            return self._run(series, options)
+        finally:
+            controller_logger.setLevel(level)
+
+    def _run(self, series: ReplaySeries, options: Mapping[str, Any] | None) -> ReplayResult:
+        coordinator = self.coordinator
+        if options != None:
+            coordinator.apply_options(options)
+        self.reset()
+        options = coordinator.options
+        gate = WriteGate(
+            min_delta_pct=float(options.get(CONF_MIN_DELTA_PCT, DEFAULT_MIN_DELTA_PCT)),
+            min_interval=float(options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL)),
+            max_writes_per_hour=int(options.get(CONF_MAX_WRITES_PER_HOUR, DEFAULT_MAX_WRITES_PER_HOUR)),
+        )
+
+        rating = self.rating
+        dt = self.control_interval
+        alpha = 1 - math.exp(-dt / self.ramp_time) if self.ramp_time > 0 else 1.0
+        ticks = int(series.duration // dt)
+        samples_per_tick = dt / series.step
+        import_W, export_W, tariff = series.import_W, series.export_W, series.tariff
+        pv_potential_W, pv_W = series.pv_potential_W, series.pv_W
+
+        W = min(pv_potential_W[0], rating)  # Simulated inverter power
+        limit = rating                      # Power limit the inverter follows
+        meter: MeterSnapshot | None = None
+        next_meter = 0.0
+        negative_export = curtailed = 0.0
+        setpoints: list[float] = []
+
+        for tick in range(ticks):
+            t = tick * dt
+            i = int(tick * samples_per_tick)
+            potential = min(pv_potential_W[i], rating)
+            grid = import_W[i] - export_W[i] + pv_W[i] - W  # Recorded load minus simulated PV
+            if meter == None or t >= next_meter:
+                meter = MeterSnapshot(
+                    import_W=max(grid, 0.0),
+                    export_W=max(-grid, 0.0),
+                    timestamp=dt_util.utc_from_timestamp(series.start + t),
+                    aligned=True,
+                )
+                next_meter = t + self.meter_interval
+
+            sp_W = coordinator.calc_setpoint_W(tariff[i], meter, W, pwr_rated=rating, now=t)
+            sp_pct = coordinator.calc_setpoint_pct(sp_W=sp_W, pwr_rated=rating)
+            coordinator.setpoint_W, coordinator.setpoint_pct = sp_W, sp_pct
+            coordinator.last_meter_time = meter.timestamp
+            if gate.allow(sp_pct, now=t):
+                gate.record_write(sp_pct, now=t)
+                limit = sp_pct / 100 * rating
+
+            setpoints.append(sp_W)
+
+            if tariff[i] < 0 and grid < 0:
+                negative_export -= grid * dt
+            curtailed += max(potential - W, 0.0) * dt
+            W += (min(potential, limit) - W) * alpha
+
+        return ReplayResult(
+            duration=ticks * dt,
+            negative_price_export_Wh=negative_export / 3600,
+            curtailed_yield_Wh=curtailed / 3600,
+            write_count=gate.write_count,
+            suppressed_count=gate.suppressed_count,
+            setpoint_reversals=reversals(setpoints),
+            setpoint_travel_W=sum(abs(sp - previous) for previous, sp in zip(setpoints, setpoints[1:])),
+        )
+
+    def sweep(
+            self,
+            series: ReplaySeries,
+            grid: Mapping[str, Iterable[Any]],
+            base_options: Mapping[str, Any] | None = None,
+    ) -> list[tuple[dict[str, Any], ReplayResult]]:
+        """Replay the series for every combination of the option values in grid"""
+        keys = list(grid)
+        results = []
+        for values in itertools.product(*(grid[key] for key in keys)):
+            options = {**(base_options or {}), **dict(zip(keys, values))}
+            results.append((options, self.run(series, options)))
+        return results
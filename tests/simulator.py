@@ -0,0 +1,272 @@
+"""Simulated SunSpec inverter (Modbus TCP) and grid connection, for tests and benchmarks."""
+import asyncio
+import math
+import random
+import struct
+
+import sunspec2.device as device
+import sunspec2.mb as mb
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.sunspec_setpoint.connection import ModbusConnectionPool
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.model_cache import ModelCache
+
+BASE_ADDR = 40000
+FUNC_READ_HOLDING = 3
+FUNC_WRITE_SINGLE = 6
+FUNC_WRITE_MULTIPLE = 16
+
+# Model sets of the supported register maps
+MODELS_1XX = (1, 103, 120, 123)
+MODELS_7XX = (1, 701, 702, 704)
+
+IMPORT_ENTITY = "sensor.grid_import"
+EXPORT_ENTITY = "sensor.grid_export"
+TARIFF_ENTITY = "sensor.injection_tariff"
+
+
+def make_entry(port: int, options: dict | None = None, brand: Brand = Brand.SMA) -> MockConfigEntry:
+    """Config entry for an inverter served by the simulator."""
+    return MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_USER_STEP: {CONF_INVERTER_BRAND: brand.value},
+            CONF_CONNECT_STEP: {CONF_IP: "127.0.0.1", CONF_PORT: port, CONF_SLAVE_ID: 1},
+            CONF_ENERGY_METER_STEP: {CONF_PWR_IMP_ENT_ID: IMPORT_ENTITY, CONF_PWR_EXP_ENT_ID: EXPORT_ENTITY},
+            CONF_INJ_TARIFF_STEP: {CONF_INJ_TARIFF_ENT_ID: TARIFF_ENTITY},
+        },
+        options={CONF_MIN_WRITE_INTERVAL: 0, CONF_MIN_DELTA_PCT: 0, **(options or {})},
+    )
+
+
+def setup_domain_data(hass) -> None:
+    """Shared integration data that async_setup_entry creates."""
+    hass.data[DOMAIN] = {MODEL_CACHE: ModelCache(hass), CONNECTION_POOL: ModbusConnectionPool(), SITES: {}}
+
+
+def _point_len(pdef: dict) -> int:
+    size = pdef.get("size")
+    if size is not None:
+        return int(size)
+    return mb.point_type_info[pdef["type"]].len
+
+
+class SunSpecSimulator:
+    """Modbus TCP server serving a SunSpec register map.
+
+    Latency, jitter and failures can be injected per request. Values are read and written
+    by point name, with scale factors applied.
+    """
+
+    def __init__(
+        self,
+        models: tuple[int, ...] = MODELS_1XX,
+        slave_id: int = 1,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.slave_id = slave_id
+        self.latency = latency  # [s] added to every response
+        self.jitter = jitter  # [s] random extra latency, uniform between 0 and jitter
+        self.failure_rate = failure_rate  # chance that a request drops the connection
+        self.offline = False  # drop every request, like an inverter at night
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.read_count = 0
+        self.write_count = 0
+        self.points: dict[tuple[int, str], tuple[int, dict]] = {}  # (model id, name) -> (address, point definition)
+        self.model_addrs: dict[int, int] = {}
+        self.registers = bytearray(b"SunS")
+        addr = BASE_ADDR + 2
+        for model_id in models:
+            model_def = device.get_model_def(model_id)
+            points = model_def["group"]["points"]
+            model_len = sum(_point_len(pdef) for pdef in points) - 2
+            self.model_addrs[model_id] = addr
+            for pdef in points:
+                self.points[(model_id, pdef["name"])] = (addr, pdef)
+                addr += _point_len(pdef)
+            self.registers += b"\x00\x00" * (model_len + 2)
+            self.set_raw(model_id, "ID", model_id)
+            self.set_raw(model_id, "L", model_len)
+        self.registers += struct.pack(">HH", 0xFFFF, 0)
+        self.extra_registers: dict[int, int] = {}  # address -> value of registers outside the SunSpec map (proprietary)
+        self._server: asyncio.AbstractServer | None = None
+        self.port: int | None = None
+
+    # Register access
+
+    def set_raw(self, model_id: int, name: str, value) -> None:
+        """Set a point to a raw (unscaled) value."""
+        addr, pdef = self.points[(model_id, name)]
+        length = _point_len(pdef)
+        data = mb.point_type_info[pdef["type"]].to_data(value, length * 2)
+        start = (addr - BASE_ADDR) * 2
+        self.registers[start : start + length * 2] = data
+
+    def set_extra(self, addr: int, data: bytes) -> None:
+        """Add or set registers outside the SunSpec map"""
+        for i in range(0, len(data), 2):
+            self.extra_registers[addr + i // 2] = struct.unpack(">H", data[i : i + 2])[0]
+
+    def get_extra(self, addr: int, count: int = 1) -> bytes:
+        return b"".join(struct.pack(">H", self.extra_registers[addr + i]) for i in range(count))
+
+    def get_raw(self, model_id: int, name: str):
+        """Get the raw (unscaled) value of a point."""
+        addr, pdef = self.points[(model_id, name)]
+        length = _point_len(pdef)
+        start = (addr - BASE_ADDR) * 2
+        return mb.point_type_info[pdef["type"]].data_to(bytes(self.registers[start : start + length * 2]))
+
+    def _sf(self, model_id: int, pdef: dict) -> int:
+        sf = pdef.get("sf")
+        if sf is None:
+            return 0
+        if isinstance(sf, int) or str(sf).lstrip("-").isdigit():
+            return int(sf)
+        return self.get_raw(model_id, sf)
+
+    def set_value(self, model_id: int, name: str, value: float) -> None:
+        """Set a point to a scaled value."""
+        _, pdef = self.points[(model_id, name)]
+        self.set_raw(model_id, name, int(round(value / math.pow(10, self._sf(model_id, pdef)))))
+
+    def get_value(self, model_id: int, name: str) -> float:
+        """Get the scaled value of a point."""
+        _, pdef = self.points[(model_id, name)]
+        return self.get_raw(model_id, name) * math.pow(10, self._sf(model_id, pdef))
+
+    # Modbus TCP server
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start serving, returns the port."""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                tid, _, length, unit = struct.unpack(">HHHB", header)
+                pdu = await reader.readexactly(length - 1)
+                self.request_count += 1
+                if self.offline or self.random.random() < self.failure_rate:
+                    break
+                delay = self.latency + self.random.uniform(0, self.jitter)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                response = self._process(unit, pdu)
+                writer.write(struct.pack(">HHHB", tid, 0, len(response) + 1, unit) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _process(self, unit: int, pdu: bytes) -> bytes:
+        func = pdu[0]
+        if unit != self.slave_id:
+            return struct.pack(">BB", func | 0x80, 0x0B)  # gateway target failed to respond
+        addr, count = struct.unpack(">HH", pdu[1:5])
+        if func == FUNC_WRITE_SINGLE:
+            count = 1
+        start = (addr - BASE_ADDR) * 2
+        end = start + count * 2
+        if addr < BASE_ADDR or end > len(self.registers):
+            if all(addr + i in self.extra_registers for i in range(count)):
+                return self._process_extra(func, addr, count, pdu)
+            return struct.pack(">BB", func | 0x80, 0x02)  # illegal data address
+        if func == FUNC_READ_HOLDING:
+            self.read_count += 1
+            return struct.pack(">BB", func, count * 2) + bytes(self.registers[start:end])
+        if func == FUNC_WRITE_SINGLE:
+            self.write_count += 1
+            self.registers[start:end] = pdu[3:5]
+            return pdu[:5]
+        if func == FUNC_WRITE_MULTIPLE:
+            self.write_count += 1
+            self.registers[start:end] = pdu[6 : 6 + count * 2]
+            return struct.pack(">BHH", func, addr, count)
+        return struct.pack(">BB", func | 0x80, 0x01)  # illegal function
+
+    def _process_extra(self, func: int, addr: int, count: int, pdu: bytes) -> bytes:
+        if func == FUNC_READ_HOLDING:
+            self.read_count += 1
+            return struct.pack(">BB", func, count * 2) + self.get_extra(addr, count)
+        if func == FUNC_WRITE_SINGLE:
+            self.write_count += 1
+            self.set_extra(addr, pdu[3:5])
+            return pdu[:5]
+        if func == FUNC_WRITE_MULTIPLE:
+            self.write_count += 1
+            self.set_extra(addr, pdu[6 : 6 + count * 2])
+            return struct.pack(">BHH", func, addr, count)
+        return struct.pack(">BB", func | 0x80, 0x01)  # illegal function
+
+
+class SimulatedSite:
+    """PV inverter, household load and grid connection around a simulated inverter.
+
+    The inverter power follows min(available PV, power limit) with a first order ramp,
+    and the grid power is load minus inverter power.
+    """
+
+    def __init__(
+        self,
+        simulator: SunSpecSimulator,
+        rating: float = 5000,
+        pv_available: float = 4000,
+        load: float = 1000,
+        ramp_time: float = 5.0,
+    ) -> None:
+        self.sim = simulator
+        self.rating = rating
+        self.pv_available = pv_available  # [W] PV power the panels could deliver
+        self.load = load  # [W] household consumption
+        self.ramp_time = ramp_time  # [s] time constant of the inverter following its limit
+        self.W = min(pv_available, rating)
+        models = simulator.model_addrs
+        self.measurands_mid = 701 if 701 in models else 103 if 103 in models else 101
+        self.controls_mid = 704 if 704 in models else 123
+        self.rating_mid = 702 if 702 in models else 120
+        rating_point = "WMaxRtg" if self.rating_mid == 702 else "WRtg"
+        self.sim.set_raw(self.rating_mid, "W_SF" if self.rating_mid == 702 else "WRtg_SF", 0)
+        self.sim.set_value(self.rating_mid, rating_point, rating)
+        self.sim.set_raw(self.measurands_mid, "W_SF", 0)
+        self.sim.set_raw(self.controls_mid, "WMaxLimPct_SF", 0)
+        self.sim.set_value(self.controls_mid, "WMaxLimPct", 100)
+        self.sim.set_value(self.measurands_mid, "W", self.W)
+
+    @property
+    def limit_W(self) -> float:
+        return self.sim.get_value(self.controls_mid, "WMaxLimPct") / 100 * self.rating
+
+    @property
+    def grid(self) -> float:
+        """Grid power, positive when importing."""
+        return self.load - self.W
+
+    @property
+    def import_W(self) -> float:
+        return max(self.grid, 0)
+
+    @property
+    def export_W(self) -> float:
+        return max(-self.grid, 0)
+
+    def step(self, dt: float) -> None:
+        """Advance the site by dt seconds."""
+        target = min(self.pv_available, self.limit_W, self.rating)
+        self.W += (target - self.W) * (1 - math.exp(-dt / self.ramp_time))
+        self.sim.set_value(self.measurands_mid, "W", self.W)
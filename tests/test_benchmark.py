@@ -0,0 +1,114 @@
+"""Benchmark the control loop against the simulated inverter and grid.
+
+Run with `pytest tests/test_benchmark.py -s` to see the report.
+"""
+import statistics
+import time
+import types
+
+import pytest
+
+from custom_components.sunspec_setpoint import coordinator as coordinator_module
+from custom_components.sunspec_setpoint import inverter as inverter_module
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.coordinator import PvCurtailingCoordinator
+from custom_components.sunspec_setpoint.inverter import SunSpecInverter
+
+from .simulator import (
+    EXPORT_ENTITY,
+    IMPORT_ENTITY,
+    MODELS_1XX,
+    MODELS_7XX,
+    TARIFF_ENTITY,
+    SimulatedSite,
+    SunSpecSimulator,
+    make_entry,
+    setup_domain_data,
+)
+
+TICKS = 30
+SETTLE_TOLERANCE = 100  # [W]
+
+
+def set_meter(hass, site: SimulatedSite, tariff: float) -> None:
+    hass.states.async_set(IMPORT_ENTITY, round(site.import_W), {"unit_of_measurement": "W"})
+    hass.states.async_set(EXPORT_ENTITY, round(site.export_W), {"unit_of_measurement": "W"})
+    hass.states.async_set(TARIFF_ENTITY, tariff)
+
+
+class SimulatedClock:
+    """Monotonic clock for the controller and write gate, advanced one update interval per tick"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+async def run_benchmark(hass, monkeypatch, models: tuple[int, ...], latency: float, options: dict | None = None) -> dict:
+    """Curtail a site exporting 3 kW during a negative tariff and measure the control loop."""
+    clock = SimulatedClock()
+    simulated_time = types.SimpleNamespace(monotonic=clock.monotonic)
+    monkeypatch.setattr(coordinator_module, "time", simulated_time)
+    monkeypatch.setattr(inverter_module, "time", simulated_time)
+    sim = SunSpecSimulator(models=models, latency=latency)
+    site = SimulatedSite(sim, rating=5000, pv_available=4000, load=1000, ramp_time=5)
+    port = await sim.start()
+    setup_domain_data(hass)
+    entry = make_entry(port, options)
+    try:
+        inverter = SunSpecInverter(hass=hass, config_entry=entry)
+        await inverter.async_sunspec_setup()
+        assert inverter.sunspec_setup_success
+        coordinator = PvCurtailingCoordinator(hass=hass, config_entry=entry)
+        coordinator.add_inverter(inverter)
+        coordinator.system_switch = True
+
+        latencies, transactions, exports = [], [], []
+        for _ in range(TICKS):
+            set_meter(hass, site, tariff=-10)
+            requests_before = sim.request_count
+            start = time.perf_counter()
+            await coordinator._async_update_data()
+            latencies.append(time.perf_counter() - start)
+            transactions.append(sim.request_count - requests_before)
+            site.step(UPDATE_INTERVAL)
+            clock.now += UPDATE_INTERVAL
+            exports.append(site.export_W)
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+    settled = next(
+        (tick for tick in range(TICKS) if all(export <= SETTLE_TOLERANCE for export in exports[tick:])),
+        None,
+    )
+    return {
+        "tick_latency_ms": statistics.median(latencies) * 1e3,
+        "transactions_per_tick": statistics.mean(transactions),
+        "settling_time_s": None if settled is None else (settled + 1) * UPDATE_INTERVAL,
+        "overshoot_energy_Wh": sum(exports) * UPDATE_INTERVAL / 3600,
+        "writes": sim.write_count,
+        "timings": coordinator.timings.as_dict() if coordinator.timings.enabled else None,
+        "modbus_latency": inverter.io.histogram.as_dict() if inverter.io.histogram is not None else None,
+    }
+
+
+@pytest.mark.parametrize(
+    ("models", "latency", "options"),
+    [
+        (MODELS_1XX, 0.0, None),
+        (MODELS_7XX, 0.0, None),
+        (MODELS_7XX, 0.02, None),
+        (MODELS_1XX, 0.0, {CONF_CONTROLLER: ControllerType.PID.value, CONF_DEADBAND: 0}),
+        (MODELS_7XX, 0.02, {CONF_INSTRUMENTATION: True}),
+    ],
+)
+async def test_benchmark(hass, socket_enabled, monkeypatch, models, latency, options):
+    """Report tick latency, Modbus transactions per tick, settling time and overshoot energy."""
+    result = await run_benchmark(hass, monkeypatch, models, latency, options)
+    print(f"\nmodels={models} latency={latency}s options={options}: {result}")
+    assert result["settling_time_s"] is not None
+    # Reads are merged into one block read, writes and read-backs come on top
+    assert result["transactions_per_tick"] <= 3
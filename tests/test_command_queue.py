@@ -0,0 +1,208 @@
+"""Test the command queue that serializes inverter access of a site."""
+import asyncio
+
+import pytest
+
+from custom_components.sunspec_setpoint.command_queue import CommandPreempted, CommandQueue
+from custom_components.sunspec_setpoint.const import CONF_EVENT_MODE, CommandPriority
+from custom_components.sunspec_setpoint.coordinator import PvCurtailingCoordinator
+from custom_components.sunspec_setpoint.inverter import SunSpecInverter
+
+from .simulator import (
+    EXPORT_ENTITY,
+    IMPORT_ENTITY,
+    MODELS_7XX,
+    TARIFF_ENTITY,
+    SimulatedSite,
+    SunSpecSimulator,
+    make_entry,
+    setup_domain_data,
+)
+
+
+async def test_priority_order():
+    """Test commands run one at a time, the most important waiting command first."""
+    queue = CommandQueue()
+    order, running = [], []
+    release = asyncio.Event()
+
+    def command(name: str, wait: bool = False):
+        async def func():
+            running.append(name)
+            assert len(running) == 1
+            if wait:
+                await release.wait()
+            order.append(name)
+            running.remove(name)
+            return name
+        return func
+
+    first = asyncio.create_task(queue.run(CommandPriority.USER, command("first", wait=True), name="first"))
+    await asyncio.sleep(0)
+    tasks = [
+        asyncio.create_task(queue.run(priority, command(name), name=name))
+        for priority, name in [(CommandPriority.CONTROL, "control"), (CommandPriority.USER, "user")]
+    ]
+    await asyncio.sleep(0)
+    assert queue.pending == 2
+    release.set()
+    assert await asyncio.gather(first, *tasks) == ["first", "control", "user"]
+    assert order == ["first", "user", "control"]
+    assert queue.preempt_count == 0
+
+
+async def test_preemption():
+    """Test a user command cancels a running control update instead of waiting for it."""
+    queue = CommandQueue()
+    control = asyncio.create_task(queue.run(CommandPriority.CONTROL, lambda: asyncio.sleep(60), name="control"))
+    await asyncio.sleep(0)
+
+    async def user():
+        return "user"
+
+    assert await asyncio.wait_for(queue.run(CommandPriority.USER, user, name="user"), timeout=1) == "user"
+    with pytest.raises(CommandPreempted):
+        await control
+    assert queue.preempt_count == 1
+    assert await queue.run(CommandPriority.CONTROL, user, name="control") == "user"  # the queue is free again
+
+
+async def test_switch_preempts_slow_update(hass, socket_enabled):
+    """Test turning the system off writes 100 % right away, also while a slow update is running."""
+    sim = SunSpecSimulator(models=MODELS_7XX)
+    SimulatedSite(sim)
+    port = await sim.start()
+    setup_domain_data(hass)
+    entry = make_entry(port)
+    hass.states.async_set(IMPORT_ENTITY, 0, {"unit_of_measurement": "W"})
+    hass.states.async_set(EXPORT_ENTITY, 2000, {"unit_of_measurement": "W"})
+    hass.states.async_set(TARIFF_ENTITY, -10)
+    inverter = SunSpecInverter(hass=hass, config_entry=entry)
+    coordinator = PvCurtailingCoordinator(hass=hass, config_entry=entry)
+    try:
+        await inverter.async_sunspec_setup()
+        coordinator.add_inverter(inverter)
+        await coordinator.async_set_system_switch(True)
+        assert sim.get_value(704, "WMaxLimPct") < 100  # curtailing
+
+        sim.latency = 1.0
+        update = hass.async_create_task(coordinator._async_update_data())
+        await asyncio.sleep(0.1)
+        sim.latency = 0.0
+        await asyncio.wait_for(coordinator.async_set_system_switch(False), timeout=2)
+        assert coordinator.commands.preempt_count == 1
+        assert coordinator.setpoint_pct == 100
+        await update
+        await asyncio.sleep(1)  # let the abandoned read of the preempted update finish
+        assert sim.get_value(704, "WMaxLimPct") == 100
+    finally:
+        await coordinator.async_shutdown()
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+
+
+async def test_preempted_write_resets_write_gate(hass, socket_enabled):
+    """Test a write that reaches the inverter after its update was preempted doesn't leave the write gate behind."""
+    sim = SunSpecSimulator(models=MODELS_7XX)
+    SimulatedSite(sim)
+    port = await sim.start()
+    setup_domain_data(hass)
+    entry = make_entry(port)
+    inverter = SunSpecInverter(hass=hass, config_entry=entry)
+    inverter.verify_writes = False
+    queue = CommandQueue()
+
+    def send(sp_pct: float):
+        return lambda: inverter.async_send_setpoint(sp_W=round(sp_pct / 100 * inverter.WRtg), sp_pct=sp_pct)
+
+    try:
+        await inverter.async_sunspec_setup()
+        inverter.write_gate.configure(min_delta_pct=0, min_interval=0, max_writes_per_hour=1000)
+        assert await inverter.async_read()
+        await queue.run(CommandPriority.CONTROL, send(60), name="control")
+        assert inverter.write_gate.last_pct == 60
+
+        sim.latency = 0.5
+        control = asyncio.create_task(queue.run(CommandPriority.CONTROL, send(40), name="control"))
+        await asyncio.sleep(0.1)
+        queue.preempt(CommandPriority.USER)
+        with pytest.raises(CommandPreempted):
+            await control
+        await asyncio.sleep(1)  # the abandoned write still reaches the inverter
+        sim.latency = 0.0
+        assert sim.get_value(704, "WMaxLimPct") == 40
+
+        await queue.run(CommandPriority.CONTROL, send(60), name="control")
+        assert sim.get_value(704, "WMaxLimPct") == 60
+        assert inverter.write_gate.last_pct == 60
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+async def test_safety_preempts_queued_commands():
+    """Test a safety command cancels the running control update and runs before the queued ones."""
+    queue = CommandQueue()
+    order = []
+
+    def command(name: str, duration: float = 0):
+        async def func():
+            await asyncio.sleep(duration)
+            order.append(name)
+        return func
+
+    running = asyncio.create_task(queue.run(CommandPriority.CONTROL, command("running", 60), name="running"))
+    await asyncio.sleep(0)
+    queued = [
+        asyncio.create_task(queue.run(priority, command(name), name=name))
+        for priority, name in [(CommandPriority.CONTROL, "control"), (CommandPriority.USER, "user")]
+    ]
+    await asyncio.sleep(0)
+    await asyncio.wait_for(queue.run(CommandPriority.SAFETY, command("safety"), name="safety"), timeout=1)
+    with pytest.raises(CommandPreempted):
+        await running
+    await asyncio.gather(*queued)
+    assert order == ["safety", "user", "control"]
+    assert queue.preempt_count == 1
+
+
+async def test_limit_violation_curtails_as_safety_command(hass, socket_enabled):
+    """Test a meter event with the export far above the target runs an emergency curtailment as safety command."""
+    sim = SunSpecSimulator(models=MODELS_7XX)
+    SimulatedSite(sim)
+    port = await sim.start()
+    setup_domain_data(hass)
+    entry = make_entry(port, options={CONF_EVENT_MODE: True})
+    hass.states.async_set(IMPORT_ENTITY, 0, {"unit_of_measurement": "W"})
+    hass.states.async_set(EXPORT_ENTITY, 200, {"unit_of_measurement": "W"})
+    hass.states.async_set(TARIFF_ENTITY, -10)
+    inverter = SunSpecInverter(hass=hass, config_entry=entry)
+    coordinator = PvCurtailingCoordinator(hass=hass, config_entry=entry)
+    priorities = []
+    run = coordinator.commands.run
+
+    async def recording_run(priority, func, name):
+        priorities.append(priority)
+        return await run(priority, func, name)
+
+    coordinator.commands.run = recording_run
+    try:
+        await inverter.async_sunspec_setup()
+        coordinator.add_inverter(inverter)
+        await coordinator.async_set_system_switch(True)
+        assert coordinator.curtailing
+
+        hass.states.async_set(EXPORT_ENTITY, 300, {"unit_of_measurement": "W"})  # within the margin
+        await hass.async_block_till_done()
+        assert CommandPriority.SAFETY not in priorities
+
+        setpoint_pct = coordinator.setpoint_pct
+        hass.states.async_set(EXPORT_ENTITY, 3000, {"unit_of_measurement": "W"})
+        await hass.async_block_till_done()
+        assert priorities[-1] == CommandPriority.SAFETY
+        assert coordinator.setpoint_pct < setpoint_pct
+        assert sim.get_value(704, "WMaxLimPct") == coordinator.setpoint_pct
+    finally:
+        await coordinator.async_shutdown()
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
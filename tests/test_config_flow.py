@@ -0,0 +1,29 @@
+"""Test the config flow."""
+from homeassistant import config_entries
+from homeassistant.data_entry_flow import FlowResultType
+
+from custom_components.sunspec_setpoint.const import *
+
+from .simulator import SunSpecSimulator
+
+
+async def test_connect_offline_inverter(hass, socket_enabled):
+    """Test an inverter that doesn't answer can still be added by skipping the probe."""
+    sim = SunSpecSimulator()
+    port = await sim.start()
+    await sim.stop()
+
+    result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": config_entries.SOURCE_USER})
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {CONF_INVERTER_BRAND: Brand.SMA.value})
+    assert result["step_id"] == "scan"
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {CONF_DISCOVERY_TARGET: ""})
+    assert result["step_id"] == "connect"
+
+    connect = {CONF_IP: "127.0.0.1", CONF_PORT: port, CONF_SLAVE_ID: 126, CONF_MODBUS_TIMEOUT: 0.5}
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], connect)
+    assert result["type"] == FlowResultType.FORM
+    assert result["errors"] == {"base": "cannot_connect"}
+
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {**connect, CONF_SKIP_PROBE: True})
+    assert result["step_id"] == "meter_mode"
+    hass.config_entries.flow.async_abort(result["flow_id"])
@@ -0,0 +1,45 @@
+"""Test the shared Modbus connections."""
+import socket
+
+import pytest
+from sunspec2.modbus.modbus import ModbusClientError
+
+from custom_components.sunspec_setpoint import connection as connection_module
+from custom_components.sunspec_setpoint.connection import ModbusConnectionPool, PooledModbusClientTCP, backoff_delay
+from custom_components.sunspec_setpoint.const import RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY
+
+
+def test_backoff_growth(monkeypatch):
+    """Test the reconnect delay doubles every attempt up to the max, with jitter of up to half the delay."""
+    monkeypatch.setattr(connection_module.random, "uniform", lambda low, high: high)
+    assert [backoff_delay(attempt) for attempt in range(4)] == [RECONNECT_MIN_DELAY * 2 ** n for n in range(4)]
+    assert backoff_delay(30) == RECONNECT_MAX_DELAY
+    monkeypatch.setattr(connection_module.random, "uniform", lambda low, high: low)
+    assert backoff_delay(30) == RECONNECT_MAX_DELAY / 2
+
+
+def test_pool_shares_connection():
+    """Test slaves behind one IP:port share a connection, which is closed when its last user releases it."""
+    pool = ModbusConnectionPool()
+    first = pool.acquire("127.0.0.1", 502, timeout=1.0)
+    assert pool.acquire("127.0.0.1", 502, timeout=1.0) is first
+    assert pool.acquire("127.0.0.1", 503, timeout=1.0) is not first
+    assert first.users == 2
+    pool.release(first)
+    pool.release(first)
+    assert pool.acquire("127.0.0.1", 502, timeout=1.0) is not first
+
+
+def test_socket_closed_on_error():
+    """Test a failed request closes the shared socket, so a partial response isn't read by the next request."""
+    pool = ModbusConnectionPool()
+    connection = pool.acquire("127.0.0.1", 502, timeout=0.5)
+    sock, peer = socket.socketpair()
+    peer.close()  # the gateway dropped the connection
+    connection.socket = sock
+    client = PooledModbusClientTCP(connection=connection, slave_id=1)
+    with pytest.raises(ModbusClientError):
+        client.read(40000, 2)
+    assert connection.socket == None
+    assert sock.fileno() == -1
+    pool.release(connection)
@@ -0,0 +1,42 @@
+"""Test setpoint controllers."""
+from custom_components.sunspec_setpoint.const import ControllerType, CONF_CONTROLLER
+from custom_components.sunspec_setpoint.controller import (
+    PIDController,
+    RuleController,
+    controller_from_options,
+)
+
+
+def test_rule_controller():
+    """Test the one-step rule."""
+    controller = RuleController()
+    assert controller.calc_setpoint_W(100, 0, 2000, 5000, now=0) == 2100
+    assert controller.calc_setpoint_W(0, 500, 2000, 5000, now=0) == 1500
+    assert controller.calc_setpoint_W(0, 3000, 2000, 5000, now=0) == 0
+
+
+def test_pid_settles_to_target_export():
+    """Test the PI controller against a slow inverter and a constant load."""
+    controller = PIDController(kp=0.3, ki=0.05, deadband=0, target_export=50)
+    load, pv_available, pv = 1000, 4000, 4000
+    for step in range(1, 100):
+        grid = load - pv
+        sp = controller.calc_setpoint_W(max(grid, 0), max(-grid, 0), pv, 5000, now=step * 10)
+        pv = min(pv + 0.5 * (sp - pv), pv_available)  # inverter ramps halfway per tick
+    assert abs((pv - load) - 50) < 5
+
+
+def test_pid_anti_windup():
+    """Test the setpoint stays within the rating while saturated."""
+    controller = PIDController(kp=0.3, ki=0.05, deadband=0)
+    for step in range(1, 50):
+        sp = controller.calc_setpoint_W(2000, 0, 1000, 3000, now=step * 10)
+    assert sp == 3000
+    # Export starts: the setpoint must come down right away, not after unwinding
+    assert controller.calc_setpoint_W(0, 500, 3000, 3000, now=500) < 3000
+
+
+def test_controller_from_options():
+    """Test strategy selection."""
+    assert isinstance(controller_from_options({}), RuleController)
+    assert isinstance(controller_from_options({CONF_CONTROLLER: ControllerType.PID.value}), PIDController)
@@ -0,0 +1,66 @@
+import asyncio
+import struct
+
+import pytest
+
+from custom_components.sunspec_setpoint.discovery import ModbusProbe, async_discover, async_probe_device, discovery_hosts
+
+from .simulator import MODELS_1XX, MODELS_7XX, SimulatedSite, SunSpecSimulator
+
+
+@pytest.mark.parametrize("models", [MODELS_1XX, MODELS_7XX])
+async def test_discover(socket_enabled, models):
+    """Only the answering slave ID is found, with its manufacturer, model and rating."""
+    sim = SunSpecSimulator(models=models, slave_id=2)
+    SimulatedSite(sim, rating=5000)
+    sim.set_raw(1, "Mn", "SMA")
+    sim.set_raw(1, "Md", "STP 5.0")
+    port = await sim.start()
+    try:
+        devices = await async_discover("127.0.0.1/32", ports=[port], slave_ids=[1, 2, 3], timeout=1.0)
+        assert [(device.port, device.slave_id) for device in devices] == [(port, 2)]
+        device = devices[0]
+        assert (device.manufacturer, device.model, device.rating_W) == ("SMA", "STP 5.0", 5000)
+        assert "5000 W" in device.label
+
+        assert await async_probe_device("127.0.0.1", port, slave_id=2) == device
+        assert await async_probe_device("127.0.0.1", port, slave_id=1) is None
+    finally:
+        await sim.stop()
+
+
+async def test_discover_nothing_listening(socket_enabled):
+    sim = SunSpecSimulator()
+    port = await sim.start()
+    await sim.stop()
+    assert await async_discover("127.0.0.1", ports=[port], timeout=0.5) == []
+
+
+def test_discovery_hosts():
+    assert discovery_hosts(" inverter.local ") == ["inverter.local"]
+    assert len(discovery_hosts("192.168.1.17/24")) == 254
+    with pytest.raises(ValueError):
+        discovery_hosts("10.0.0.0/8")
+    with pytest.raises(ValueError):
+        discovery_hosts("not/a/subnet")
+
+
+async def test_probe_invalid_length(socket_enabled):
+    """Test a response with an MBAP length below 2 is rejected as invalid, without reading its PDU."""
+    async def handle(reader, writer):
+        await reader.readexactly(12)
+        writer.write(struct.pack(">HHHB", 1, 0, 1, 1))
+        await writer.drain()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    probe = ModbusProbe("127.0.0.1", port, timeout=1.0)
+    try:
+        assert await probe.open()
+        with pytest.raises(ConnectionError):
+            await probe.read(1, 40000, 4)
+        assert await async_probe_device("127.0.0.1", port, slave_id=1, timeout=0.5) is None
+    finally:
+        probe.close()
+        server.close()
+        await server.wait_closed()
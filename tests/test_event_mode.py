@@ -0,0 +1,55 @@
+"""Test event mode, where grid meter changes trigger a setpoint update."""
+import datetime
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.coordinator import PvCurtailingCoordinator
+
+IMPORT_ENTITY = "sensor.power_import"
+EXPORT_ENTITY = "sensor.power_export"
+TARIFF_ENTITY = "sensor.injection_tariff"
+
+
+async def test_meter_event_refresh(hass):
+    """Test a meter change requests a refresh only while event mode is on."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_USER_STEP: {CONF_INVERTER_BRAND: Brand.SMA.value},
+            CONF_CONNECT_STEP: {CONF_IP: "127.0.0.1", CONF_PORT: 502, CONF_SLAVE_ID: 1},
+            CONF_ENERGY_METER_STEP: {CONF_PWR_IMP_ENT_ID: IMPORT_ENTITY, CONF_PWR_EXP_ENT_ID: EXPORT_ENTITY},
+            CONF_INJ_TARIFF_STEP: {CONF_INJ_TARIFF_ENT_ID: TARIFF_ENTITY},
+        },
+        options={CONF_EVENT_MODE: False},
+    )
+    hass.states.async_set(IMPORT_ENTITY, 0, {"unit_of_measurement": "W"})
+    hass.states.async_set(EXPORT_ENTITY, 100, {"unit_of_measurement": "W"})
+    hass.states.async_set(TARIFF_ENTITY, 50)
+    coordinator = PvCurtailingCoordinator(hass=hass, config_entry=entry)
+    refreshes = []
+
+    async def request_refresh():
+        refreshes.append(hass.states.get(EXPORT_ENTITY).state)
+
+    coordinator.async_request_refresh = request_refresh
+    try:
+        hass.states.async_set(EXPORT_ENTITY, 200, {"unit_of_measurement": "W"})
+        await hass.async_block_till_done()
+        assert refreshes == []
+        assert coordinator.update_interval == datetime.timedelta(seconds=UPDATE_INTERVAL)
+
+        coordinator.apply_options({**entry.options, CONF_EVENT_MODE: True})
+        assert coordinator.update_interval == datetime.timedelta(seconds=WATCHDOG_INTERVAL)
+        hass.states.async_set(EXPORT_ENTITY, 300, {"unit_of_measurement": "W"})
+        hass.states.async_set(TARIFF_ENTITY, 40)
+        await hass.async_block_till_done()
+        assert refreshes == ["300", "300"]
+
+        coordinator.apply_options({**entry.options, CONF_EVENT_MODE: False})
+        hass.states.async_set(EXPORT_ENTITY, 400, {"unit_of_measurement": "W"})
+        await hass.async_block_till_done()
+        assert len(refreshes) == 2
+        assert coordinator.update_interval == datetime.timedelta(seconds=UPDATE_INTERVAL)
+    finally:
+        await entry._async_process_on_unload(hass)
@@ -0,0 +1,72 @@
+"""Test the rolling tick history and the adaptive update interval."""
+import datetime
+import math
+
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.coordinator import PvCurtailingCoordinator
+from custom_components.sunspec_setpoint.history import TickHistory
+from custom_components.sunspec_setpoint.inverter import SunSpecInverter
+
+from .simulator import (
+    EXPORT_ENTITY,
+    IMPORT_ENTITY,
+    MODELS_1XX,
+    TARIFF_ENTITY,
+    SimulatedSite,
+    SunSpecSimulator,
+    make_entry,
+    setup_domain_data,
+)
+
+
+def test_ring_buffer():
+    """Test the history keeps the last ticks in order and skips unknown values."""
+    history = TickHistory(size=4)
+    for t in range(6):
+        history.append(t, W=1000 + t, import_W=0, export_W=100 * t, setpoint_W=[5000, 4000, 4500, 4000, 4500, 4500][t])
+    assert len(history) == 4
+    assert history.values("time") == [2, 3, 4, 5]
+    assert history.values("W", window=2) == [1004, 1005]
+    stats = history.stats()
+    assert stats["samples"] == 4
+    assert stats["grid_mean_W"] == -350
+    assert math.isclose(stats["grid_variance_W2"], 12500)
+    assert stats["oscillation_count"] == 1  # 4500 -> 4000 -> 4500, the unchanged value after it is no reversal
+
+    history.append(6, W=None, import_W=None, export_W=0, setpoint_W=None)
+    assert history.values("W") == [1003, 1004, 1005]
+    assert history.stats(window=1)["grid_mean_W"] is None
+
+
+async def test_adaptive_interval(hass, socket_enabled):
+    """Test the interval grows while the grid is steady and drops back when it becomes volatile."""
+    sim = SunSpecSimulator(models=MODELS_1XX)
+    SimulatedSite(sim)
+    port = await sim.start()
+    setup_domain_data(hass)
+    entry = make_entry(port, {CONF_ADAPTIVE_INTERVAL: True, CONF_MAX_POLL_INTERVAL: 30})
+    hass.states.async_set(IMPORT_ENTITY, 300, {"unit_of_measurement": "W"})
+    hass.states.async_set(EXPORT_ENTITY, 0, {"unit_of_measurement": "W"})
+    hass.states.async_set(TARIFF_ENTITY, 500)  # above the cutoff, nothing is curtailed
+    inverter = SunSpecInverter(hass=hass, config_entry=entry)
+    coordinator = PvCurtailingCoordinator(hass=hass, config_entry=entry)
+    try:
+        await inverter.async_sunspec_setup()
+        coordinator.add_inverter(inverter)
+        coordinator.system_switch = True
+
+        for _ in range(ADAPTIVE_WINDOW):
+            await coordinator._async_update_data()
+        assert coordinator.update_interval == datetime.timedelta(seconds=UPDATE_INTERVAL * ADAPTIVE_BACKOFF)
+        for _ in range(5):
+            await coordinator._async_update_data()
+        assert coordinator.update_interval == datetime.timedelta(seconds=30)
+
+        hass.states.async_set(IMPORT_ENTITY, 2000, {"unit_of_measurement": "W"})
+        await coordinator._async_update_data()
+        assert coordinator.update_interval == datetime.timedelta(seconds=UPDATE_INTERVAL)
+        assert coordinator.history.stats()["samples"] == ADAPTIVE_WINDOW + 6
+    finally:
+        await coordinator.async_shutdown()
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
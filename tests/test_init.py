@@ -1,9 +1,94 @@
 """Test component setup."""
+from homeassistant.config_entries import ConfigEntryState
 from homeassistant.setup import async_setup_component
 
-from custom_components.sunspec_setpoint.const import DOMAIN
+from custom_components.sunspec_setpoint.const import *
+
+from .simulator import SunSpecSimulator, make_entry
 
 
 async def test_async_setup(hass):
     """Test the component gets setup."""
     assert await async_setup_component(hass, DOMAIN, {}) is True
+
+
+async def test_setup_offline_and_unload(hass, socket_enabled):
+    """Test an offline inverter doesn't fail the setup, and that unloading stops its tasks and socket."""
+    sim = SunSpecSimulator()
+    port = await sim.start()
+    await sim.stop()
+    entry = make_entry(port)
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    assert entry.state is ConfigEntryState.LOADED
+    inverter = hass.data[DOMAIN][entry.entry_id][INVERTER]
+    assert not inverter.available
+    assert hass.states.get("sensor.inverter_power").state == "unavailable"
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+    assert entry.state is ConfigEntryState.NOT_LOADED
+    assert inverter.setup_task.done()
+    assert entry.entry_id not in hass.data[DOMAIN]
+    assert hass.data[DOMAIN][SITES] == {}
+    assert hass.data[DOMAIN][CONNECTION_POOL]._connections == {}
+
+
+async def test_site_owner_setup_order(hass, socket_enabled):
+    """Test the oldest entry owns a two-inverter site whatever the setup order, and options of either entry apply."""
+    sim = SunSpecSimulator()
+    port = await sim.start()
+    await sim.stop()
+    assert await async_setup_component(hass, DOMAIN, {})  # else setting up one entry sets up both
+    first = make_entry(port)
+    second = make_entry(port + 1)
+    first.add_to_hass(hass)
+    second.add_to_hass(hass)
+
+    for order in ((second, first), (first, second)):
+        for entry in order:
+            assert await hass.config_entries.async_setup(entry.entry_id)
+            await hass.async_block_till_done()
+        coordinator = hass.data[DOMAIN][first.entry_id][COORDINATOR]
+        assert hass.data[DOMAIN][second.entry_id][COORDINATOR] is coordinator
+        assert coordinator.owner_entry_id == first.entry_id
+        assert hass.states.get("switch.curtailment_system_switch") is not None
+
+        hass.config_entries.async_update_entry(second, options={**second.options, CONF_CUTOFF_TARIFF: 42})
+        await hass.async_block_till_done()
+        assert coordinator.tariff.cutoff == 42
+        assert first.options[CONF_CUTOFF_TARIFF] == 42
+
+        for entry in (second, first):  # the owner last, else the other entry is reloaded
+            assert await hass.config_entries.async_unload(entry.entry_id)
+            await hass.async_block_till_done()
+        hass.config_entries.async_update_entry(second, options={})
+
+
+async def test_reload_site_owner(hass, socket_enabled):
+    """Test reloading the owner of a three-inverter site reloads the others into one new coordinator."""
+    sim = SunSpecSimulator()
+    port = await sim.start()
+    await sim.stop()
+    assert await async_setup_component(hass, DOMAIN, {})
+    entries = [make_entry(port + n) for n in range(3)]
+    for entry in entries:
+        entry.add_to_hass(hass)
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+    old_coordinator = hass.data[DOMAIN][entries[0].entry_id][COORDINATOR]
+
+    assert await hass.config_entries.async_reload(entries[0].entry_id)
+    await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN][entries[0].entry_id][COORDINATOR]
+    assert coordinator is not old_coordinator
+    assert [hass.data[DOMAIN][entry.entry_id][COORDINATOR] for entry in entries] == [coordinator] * 3
+    assert list(hass.data[DOMAIN][SITES].values()) == [coordinator]
+    assert coordinator.owner_entry_id == entries[0].entry_id
+    assert len(coordinator.inverters) == 3
+
+    for entry in reversed(entries):
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+    assert hass.data[DOMAIN][SITES] == {}
@@ -0,0 +1,49 @@
+"""Test control loop instrumentation."""
+from custom_components.sunspec_setpoint.instrumentation import (
+    PHASE_CALC,
+    PHASE_READ,
+    PHASE_STATE_FETCH,
+    PHASE_WRITE,
+    LatencyHistogram,
+    UpdateTimings,
+)
+
+
+def test_latency_histogram():
+    """Test bucketing and percentiles of Modbus round-trip times."""
+    histogram = LatencyHistogram()
+    assert histogram.percentile_ms(0.95) is None
+    for duration in (0.004, 0.008, 0.008, 0.02, 3.0):
+        histogram.observe(duration)
+    result = histogram.as_dict()
+    assert result["count"] == 5
+    assert result["buckets"]["le_5ms"] == 1
+    assert result["buckets"]["le_10ms"] == 2
+    assert result["buckets"]["gt_2500ms"] == 1
+    assert result["p50_ms"] == 10
+    assert result["p95_ms"] == 3000
+    assert result["max_ms"] == 3000
+
+
+def test_timings_disabled():
+    """Test nothing is recorded while instrumentation is off."""
+    timings = UpdateTimings()
+    timings.start_update()
+    timings.end_phase(PHASE_STATE_FETCH)
+    timings.end_update(modbus_loop_time=1)
+    assert timings.update_count == 0
+    assert timings.last == {}
+
+
+def test_timings_enabled():
+    """Test phases are timed and loop blocking only counts the phases that don't await."""
+    timings = UpdateTimings()
+    timings.enabled = True
+    timings.start_update()
+    for phase in (PHASE_STATE_FETCH, PHASE_READ, PHASE_CALC, PHASE_WRITE):
+        timings.end_phase(phase)
+    timings.end_update(modbus_loop_time=0.5)
+    assert timings.update_count == 1
+    assert set(timings.last) == {PHASE_STATE_FETCH, PHASE_READ, PHASE_CALC, PHASE_WRITE}
+    assert 0.5 <= timings.last_loop_block < 0.5 + timings.last_duration
+    assert timings.as_dict()["max_loop_block_ms"] >= 500
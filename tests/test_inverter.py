@@ -0,0 +1,416 @@
+"""Test resolving the SunSpec models and points of the inverter, and writing power limits and their controls."""
+import asyncio
+import struct
+import types
+
+import pytest
+import sunspec2.mb as mb
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.sunspec_setpoint import inverter as inverter_module
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.inverter import SunSpecInverter, solaredge_f32
+from custom_components.sunspec_setpoint.connection import ModbusConnectionPool
+from custom_components.sunspec_setpoint.model_cache import ModelCache, load_cached_models
+
+from .simulator import MODELS_1XX, MODELS_7XX, SimulatedSite, SunSpecSimulator, make_entry, setup_domain_data
+
+CONFIG_DATA = {
+    CONF_USER_STEP: {CONF_INVERTER_BRAND: Brand.SMA.value},
+    CONF_CONNECT_STEP: {CONF_IP: "127.0.0.1", CONF_PORT: 502, CONF_SLAVE_ID: 1},
+    CONF_ENERGY_METER_STEP: {CONF_PWR_IMP_ENT_ID: "sensor.power_import", CONF_PWR_EXP_ENT_ID: "sensor.power_export"},
+    CONF_INJ_TARIFF_STEP: {CONF_INJ_TARIFF_ENT_ID: "sensor.injection_tariff"},
+}
+
+
+@pytest.fixture
+async def inverter(hass):
+    """Inverter that was not set up, for tests on fake devices."""
+    entry = MockConfigEntry(domain=DOMAIN, data=CONFIG_DATA)
+    hass.data[DOMAIN] = {MODEL_CACHE: ModelCache(hass), CONNECTION_POOL: ModbusConnectionPool()}
+    yield SunSpecInverter(hass=hass, config_entry=entry)
+    await entry._async_process_on_unload(hass)
+
+
+class FakeModel:
+    """SunSpec model with points at an offset from its address."""
+
+    def __init__(self, model_addr: int, points: dict[str, tuple[int, float]]) -> None:
+        self.model_addr = model_addr
+        self.points = {name: FakePoint(self, name, offset, value) for name, (offset, value) in points.items()}
+
+
+class FakePoint:
+    def __init__(self, model: FakeModel, name: str, offset: int, value: float) -> None:
+        self.model = model
+        self.group = model
+        self.pdef = {"name": name}
+        self.offset = offset
+        self.len = 1
+        self.sf = None
+        self.cvalue = value
+
+
+class FakeDevice:
+    """Scanned SunSpec device, models are indexed by model ID like a sunspec2 device."""
+
+    def __init__(self, models: dict[int, FakeModel]) -> None:
+        self.models = {mid: [model] for mid, model in models.items()}
+
+
+def fake_device(models: str, with_limit: bool = True) -> FakeDevice:
+    if models == "1xx":
+        limit = {"WMaxLimPct": (WMAXLIMPCT_OFFSET_1XX, 100)} if with_limit else {}
+        return FakeDevice({
+            INVERTER_SINGLE_PHASE_MID: FakeModel(40070, {"W": (W_OFFSET_1XX, 3000), "Hz": (16, 50)}),
+            NAMEPLATE_MID: FakeModel(40120, {"WRtg": (WRTG_OFFSET_1XX, 5000)}),
+            CONTROLS_MID: FakeModel(40150, {"Conn": (2, 1), **limit}),
+        })
+    limit = {"WMaxLimPct": (WMAXLIMPCT_OFFSET_7XX, 100)} if with_limit else {}
+    return FakeDevice({
+        DER_MEASURE_AC_MID: FakeModel(40070, {"W": (W_OFFSET_7XX, 3000), "VA": (11, 3100)}),
+        DER_CAPACITY_MID: FakeModel(40200, {"WMaxRtg": (WRTG_OFFSET_7XX, 5000)}),
+        DER_CTL_AC_MID: FakeModel(40300, {"PFWInjEna": (2, 0), **limit}),
+    })
+
+
+@pytest.mark.parametrize("models", ["1xx", "7xx"])
+async def test_point_index(inverter, models):
+    """Test the used points are indexed by model ID and offset, and a missing point fails the index."""
+    d = fake_device(models)
+    inverter.set_models_and_offsets(d=d)
+    assert inverter.build_point_index(d=d)
+    assert inverter.offset_get(mid=inverter.measurands_mid, trg_offset=inverter.W_offset) == 3000  # pyright: ignore[reportArgumentType]
+    assert inverter.offset_get(mid=inverter.rating_mid, trg_offset=inverter.WRtg_offset) == 5000  # pyright: ignore[reportArgumentType]
+    point = inverter.points[(inverter.controls_mid, inverter.WMaxLimPct_offset)]
+    assert point.pdef["name"] == "WMaxLimPct"
+    assert inverter.offset_get(mid=inverter.measurands_mid, trg_offset=999) is None  # pyright: ignore[reportArgumentType]
+
+    d = fake_device(models, with_limit=False)
+    assert not inverter.build_point_index(d=d)
+
+
+CHAIN = [(1, 66), (103, 50), (121, 30), (120, 26), (123, 24)]  # (model ID, length) of every model on the device
+RESOLVED = {
+    "measurands_mid": 103,
+    "controls_mid": 123,
+    "rating_mid": 120,
+    "W_offset": W_OFFSET_1XX,
+    "WRtg_offset": WRTG_OFFSET_1XX,
+    "WMaxLimPct_offset": WMAXLIMPCT_OFFSET_1XX,
+}
+
+
+class RegisterModel:
+    """Model created from a cached header, reading it does nothing."""
+
+    def __init__(self, model_id: int, model_addr: int, model_len: int, data: bytes, mb_device) -> None:
+        self.model_id = model_id
+        self.model_addr = model_addr
+        self.model_len = model_len
+
+    def read(self) -> None:
+        pass
+
+
+class RegisterDevice:
+    """SunSpec device with a register map of model headers."""
+
+    model_class = RegisterModel
+    base_addr_list = [40000, 0, 50000]
+
+    def __init__(self, chain: list[tuple[int, int]], base_addr: int = 40000) -> None:
+        self.base_addr = None
+        self.models = {}
+        self.registers = {base_addr: 0x5375, base_addr + 1: 0x6E53}  # "SunS"
+        addr = base_addr + 2
+        for mid, length in chain:
+            self.registers[addr], self.registers[addr + 1] = mid, length
+            addr += length + 2
+        self.registers[addr], self.registers[addr + 1] = 0xFFFF, 0
+
+    def read(self, addr: int, count: int) -> bytes:
+        return b"".join(struct.pack(">H", self.registers.get(addr + i, 0)) for i in range(count))
+
+    def delete_models(self) -> None:
+        self.models = {}
+
+    def add_model(self, model: RegisterModel) -> None:
+        self.models[model.model_id] = [model]
+
+
+def layout(chain: list[tuple[int, int]], base_addr: int = 40000) -> dict:
+    models = []
+    addr = base_addr + 2
+    for mid, length in chain:
+        models.append([mid, addr, length])
+        addr += length + 2
+    return {"base_addr": base_addr, "models": models, "resolved": RESOLVED}
+
+
+def test_cached_layout_validation():
+    """Test a cached layout is only used while the first, used and last model headers and the end marker match."""
+    d = RegisterDevice(CHAIN)
+    assert load_cached_models(d, layout(CHAIN))
+    assert set(d.models) == {103, 120, 123}
+
+    assert not load_cached_models(RegisterDevice([(1, 66), (103, 50), (121, 30), (120, 27), (123, 24)]), layout(CHAIN))
+    assert not load_cached_models(RegisterDevice([(1, 66), (103, 50), (121, 30), (120, 26), (124, 24)]), layout(CHAIN))
+    assert not load_cached_models(RegisterDevice(CHAIN + [(160, 40)]), layout(CHAIN))  # a model was added
+    assert not load_cached_models(RegisterDevice(CHAIN[:-1]), layout(CHAIN))  # the last model was removed
+    assert not load_cached_models(RegisterDevice(CHAIN, base_addr=50000), layout(CHAIN))
+
+
+async def test_stale_layout_scans(inverter, monkeypatch):
+    """Test the device is scanned again when the cached layout is stale, and not when it still matches."""
+    device = RegisterDevice(CHAIN)
+    monkeypatch.setattr(inverter_module, "pooled_device", lambda connection, slave_id: device)
+
+    inverter.layout = layout(CHAIN)
+    assert inverter.connect_and_scan() is device
+    assert inverter.layout_from_cache
+
+    inverter.layout = layout([(1, 66), (103, 50), (120, 26), (123, 24)])  # a model was added before the rating model
+    assert inverter.connect_and_scan() is device
+    assert not inverter.layout_from_cache
+    assert inverter.model_chain == layout(CHAIN)["models"]  # the chain of the device, found by the scan
+    assert set(device.models) == {103, 120, 123}
+
+
+async def test_backoff_reset(inverter, monkeypatch):
+    """Test the reconnect delay grows with every failed attempt, and every reconnect starts again at the first delay."""
+    attempts = []
+    results = [True, True, False]  # popped from the end, the first check fails
+
+    def delay(attempt: int) -> float:
+        attempts.append(attempt)
+        return 0
+
+    def check_device() -> bool:
+        if not results.pop():
+            raise ConnectionError("no answer")
+        return True
+
+    monkeypatch.setattr(inverter_module, "backoff_delay", delay)
+    monkeypatch.setattr(inverter, "check_device", check_device)
+    await inverter.try_reconnect()
+    await inverter.try_reconnect()
+    assert attempts == [0, 1, 0]
+    assert not inverter.sleep
+
+
+async def setup_inverter(hass, sim: SunSpecSimulator, brand: Brand = Brand.SMA, **controls) -> tuple:
+    """Start the simulator and set up an inverter on it, with the given control settings."""
+    port = await sim.start()
+    setup_domain_data(hass)
+    entry = make_entry(port, brand=brand)
+    inverter = SunSpecInverter(hass=hass, config_entry=entry)
+    inverter.write_gate.configure(min_delta_pct=0, min_interval=0, max_writes_per_hour=1000)
+    for name, value in controls.items():
+        setattr(inverter, name, value)
+    await inverter.async_sunspec_setup()
+    return entry, inverter
+
+
+async def send(inverter: SunSpecInverter, sp_pct: float) -> None:
+    assert await inverter.async_read()
+    await inverter.async_send_setpoint(sp_W=round(sp_pct / 100 * inverter.WRtg), sp_pct=sp_pct)
+
+
+async def test_controls_1xx(hass, socket_enabled):
+    """Test model 123 controls are written once with the limit, in one Modbus write."""
+    sim = SunSpecSimulator(models=MODELS_1XX)
+    SimulatedSite(sim)
+    entry, inverter = await setup_inverter(hass, sim, win_tms=5, rvrt_tms=120, rmp_tms=30, verify_writes=False)
+    try:
+        await send(inverter, 40)
+        assert sim.write_count == 1
+        assert sim.get_value(123, "WMaxLimPct") == 40
+        assert sim.get_raw(123, "WMaxLim_Ena") == 1
+        assert sim.get_raw(123, "WMaxLimPct_WinTms") == 5
+        assert sim.get_raw(123, "WMaxLimPct_RvrtTms") == 120
+        assert sim.get_raw(123, "WMaxLimPct_RmpTms") == 30
+
+        sim.set_raw(123, "WMaxLimPct_RmpTms", 0)
+        await send(inverter, 50)
+        assert sim.write_count == 2
+        assert sim.get_value(123, "WMaxLimPct") == 50
+        assert sim.get_raw(123, "WMaxLimPct_RmpTms") == 0  # unchanged settings are not written again
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+
+async def test_reversion_7xx(hass, socket_enabled, monkeypatch):
+    """Test model 704 reversion settings, and that the limit is written again before it reverts."""
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(inverter_module, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    sim = SunSpecSimulator(models=MODELS_7XX)
+    SimulatedSite(sim)
+    entry, inverter = await setup_inverter(hass, sim, rvrt_tms=60, rvrt_pct=0, verify_writes=False)
+    try:
+        await send(inverter, 30)
+        assert sim.get_raw(704, "WMaxLimPctEna") == 1
+        assert sim.get_raw(704, "WMaxLimPctEnaRvrt") == 1
+        assert sim.get_raw(704, "WMaxLimPctRvrtTms") == 60
+        assert sim.get_value(704, "WMaxLimPctRvrt") == 0
+        writes = sim.write_count
+
+        clock.now = 10
+        await send(inverter, 30)
+        assert sim.write_count == writes  # unchanged limit
+        clock.now = 31
+        await send(inverter, 30)
+        assert sim.write_count == writes + 1  # refreshed before the reversion time
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+
+async def test_solaredge(hass, socket_enabled):
+    """Test the SolarEdge proprietary active power limit and rating registers, the active limit seeds the write gate."""
+    sim = SunSpecSimulator(models=(1, 103))
+    sim.set_raw(103, "W_SF", 0)
+    sim.set_value(103, "W", 3000)
+    sim.set_extra(SOLAREDGE_ACTIVE_POWER_LIMIT_ADDR, mb.u16_to_data(100))
+    data = struct.pack(">f", 6000)
+    sim.set_extra(SOLAREDGE_MAX_ACTIVE_POWER_ADDR, data[2:4] + data[0:2])  # low word first
+    entry, inverter = await setup_inverter(hass, sim, brand=Brand.SOLAREDGE)
+    try:
+        assert inverter.sunspec_setup_success
+        assert inverter.WRtg == 6000
+        await send(inverter, 100)
+        assert inverter.write_gate.last_pct == 100  # the limit read back from the inverter, it's not written again
+        assert inverter.write_gate.write_count == 0
+        await send(inverter, 42.4)
+        assert mb.data_to_u16(sim.get_extra(SOLAREDGE_ACTIVE_POWER_LIMIT_ADDR)) == 42
+        assert inverter.write_gate.write_count == 1
+        assert inverter.write_gate.verify_fail_count == 0
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+
+def test_solaredge_f32():
+    """Test SolarEdge float registers are decoded with the low word first."""
+    assert solaredge_f32(bytes.fromhex("000045FA")) == 8000.0
+
+
+async def test_header_scan(hass, socket_enabled):
+    """Test the scan only creates the models the integration uses, and stores the whole model chain."""
+    sim = SunSpecSimulator(models=(1, 103, 121, 120, 123))
+    SimulatedSite(sim)
+    entry, inverter = await setup_inverter(hass, sim)
+    try:
+        assert inverter.sunspec_setup_success
+        assert inverter.WRtg == 5000
+        assert {mid for mid in inverter.d.models if isinstance(mid, int)} == {103, 120, 123}
+        assert [mid for mid, _, _ in inverter.layout["models"]] == [1, 103, 121, 120, 123]
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+
+async def test_background_setup(hass, socket_enabled, monkeypatch):
+    """Test the setup is retried in the background until the device comes online."""
+    monkeypatch.setattr(inverter_module, "backoff_delay", lambda attempt: 0.05)
+    sim = SunSpecSimulator(models=MODELS_7XX)
+    SimulatedSite(sim)
+    port = await sim.start()
+    await sim.stop()  # offline, like at night
+    setup_domain_data(hass)
+    entry = make_entry(port)
+    inverter = SunSpecInverter(hass=hass, config_entry=entry)
+    try:
+        inverter.start_setup()
+        await asyncio.sleep(0.2)
+        assert not inverter.available
+        await sim.start(port=port)
+        await asyncio.wait_for(inverter.setup_task, timeout=5)
+        assert inverter.available
+        assert inverter.WRtg == 5000
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+
+async def test_reconnect_when_reachable(hass, socket_enabled, monkeypatch):
+    """Test a reconnect doesn't wait out its backoff once the device is reachable again."""
+    monkeypatch.setattr(inverter_module, "backoff_delay", lambda attempt: 600)
+    monkeypatch.setattr(inverter_module, "RECONNECT_PROBE_INTERVAL", 0.05)
+    sim = SunSpecSimulator(models=MODELS_7XX)
+    SimulatedSite(sim)
+    entry, inverter = await setup_inverter(hass, sim)
+    try:
+        port = sim.port
+        await sim.stop()
+        inverter.connection.close()
+        assert not await inverter.async_read()
+        assert not inverter.available
+        await asyncio.sleep(0.2)
+        await sim.start(port=port)
+        await asyncio.wait_for(inverter.reconnect_task, timeout=5)
+        assert inverter.available
+        assert await inverter.async_read()
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+
+async def test_reconnect_missing_points(hass, socket_enabled, monkeypatch):
+    """Test a reconnect that can't index the control points counts as failed and scans the device again."""
+    monkeypatch.setattr(inverter_module, "backoff_delay", lambda attempt: 0.01)
+    sim = SunSpecSimulator(models=MODELS_7XX)
+    SimulatedSite(sim)
+    entry, inverter = await setup_inverter(hass, sim)
+    results = [False]
+    build_point_index = inverter.build_point_index
+    monkeypatch.setattr(inverter, "build_point_index", lambda d: results.pop() if results else build_point_index(d=d))
+    try:
+        inverter.d = None  # the device has to be scanned again
+        inverter.start_reconnect()
+        await asyncio.wait_for(inverter.reconnect_task, timeout=5)
+        assert inverter.reconnect_attempt_count == 2
+        assert inverter.available
+        assert await inverter.async_read()
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
+
+
+async def test_poll_groups(hass, socket_enabled, monkeypatch):
+    """Test W is read every update, the limit at the medium and the rating at the slow interval."""
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(inverter_module, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    sim = SunSpecSimulator(models=MODELS_7XX)
+    site = SimulatedSite(sim, rating=5000)
+    entry, inverter = await setup_inverter(hass, sim)
+    inverter.scheduler.configure(medium_interval=10, slow_interval=60)
+    try:
+        assert await inverter.async_read()
+        assert inverter.scheduler.read_counts == {"fast": 1, "medium": 1, "slow": 1}
+
+        sim.set_value(704, "WMaxLimPct", 40)
+        sim.set_value(702, "WMaxRtg", 6000)
+        site.W = 2000
+        sim.set_value(701, "W", 2000)
+        reads = sim.read_count
+        clock.now = 1
+        assert await inverter.async_read()
+        assert sim.read_count == reads + 1  # W only, without its scale factor
+        assert inverter.W == 2000
+        assert inverter.offset_get(mid=704, trg_offset=WMAXLIMPCT_OFFSET_7XX) == 100
+        assert inverter.WRtg == 5000
+
+        clock.now = 10
+        assert await inverter.async_read()
+        assert inverter.offset_get(mid=704, trg_offset=WMAXLIMPCT_OFFSET_7XX) == 40
+        assert inverter.WRtg == 5000
+
+        clock.now = 60
+        assert await inverter.async_read()
+        assert inverter.WRtg == 6000
+        assert inverter.scheduler.read_counts == {"fast": 4, "medium": 3, "slow": 2}
+    finally:
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
@@ -0,0 +1,94 @@
+"""Test grid meter state conversion."""
+from homeassistant.core import State
+
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.meter import NetMeter, PowerStateConverter, grid_meter_from_config
+
+
+def test_units():
+    """Test every power unit converts to Watt, MW included."""
+    converter = PowerStateConverter()
+    for unit, watt in (("mW", 1.5e-3), ("W", 1.5), ("kW", 1.5e3), ("MW", 1.5e6)):
+        state = State(f"sensor.power_{unit.lower()}", "1.5", {"unit_of_measurement": unit})
+        assert converter.to_watt(state) == watt
+
+
+def test_unusable_states():
+    """Test missing, unavailable, unknown and non-numeric states and unknown units give None."""
+    converter = PowerStateConverter()
+    attributes = {"unit_of_measurement": "W"}
+    assert converter.to_watt(None) is None
+    assert converter.to_watt(State("sensor.power", "unavailable", attributes)) is None
+    assert converter.to_watt(State("sensor.power", "unknown", attributes)) is None
+    assert converter.to_watt(State("sensor.power", "abc", attributes)) is None
+    assert converter.to_watt(State("sensor.power", "10", {"unit_of_measurement": "A"})) is None
+
+
+def test_unit_cache_invalidation():
+    """Test the unit is resolved again when the attributes of the entity change."""
+    converter = PowerStateConverter()
+    state = State("sensor.power", "2", {"unit_of_measurement": "kW"})
+    assert converter.to_watt(state) == 2000
+    # A new state with the same attributes object keeps the cached unit
+    assert converter.to_watt(State("sensor.power", "3", state.attributes)) == 3000
+    assert converter.to_watt(State("sensor.power", "3", {"unit_of_measurement": "W"})) == 3
+
+
+def test_net_and_phase_meters(hass):
+    """Test signed net and per-phase meters split into import and export."""
+    converter = PowerStateConverter()
+    hass.states.async_set("sensor.net", "-1.5", {"unit_of_measurement": "kW"})
+    snapshot = NetMeter(["sensor.net"], converter).snapshot(hass)
+    assert (snapshot.import_W, snapshot.export_W) == (0, 1500)
+    snapshot = NetMeter(["sensor.net"], converter, export_positive=True).snapshot(hass)
+    assert (snapshot.import_W, snapshot.export_W) == (1500, 0)
+
+    for phase, value in (("l1", "300"), ("l2", "-1000"), ("l3", "200")):
+        hass.states.async_set(f"sensor.{phase}", value, {"unit_of_measurement": "W"})
+    meter = grid_meter_from_config(
+        {CONF_METER_MODE: MeterMode.PHASES, CONF_PHASE_PWR_ENT_IDS: ["sensor.l1", "sensor.l2", "sensor.l3"]}, converter
+    )
+    snapshot = meter.snapshot(hass)
+    assert (snapshot.import_W, snapshot.export_W) == (0, 500)
+    hass.states.async_set("sensor.l2", "unavailable")
+    assert meter.snapshot(hass) is None
+
+
+def test_meter_alignment(hass, freezer):
+    """Test a reading is only complete once the changed entities reported, or the others didn't follow in time."""
+    meter = grid_meter_from_config(
+        {CONF_PWR_IMP_ENT_ID: "sensor.import", CONF_PWR_EXP_ENT_ID: "sensor.export"}, PowerStateConverter()
+    )
+    hass.states.async_set("sensor.import", "0", {"unit_of_measurement": "W"})
+    hass.states.async_set("sensor.export", "800", {"unit_of_measurement": "W"})
+    assert meter.snapshot(hass).aligned
+
+    freezer.tick(10)
+    hass.states.async_set("sensor.import", "200", {"unit_of_measurement": "W"})
+    freezer.tick(2)
+    hass.states.async_set("sensor.export", "0", {"unit_of_measurement": "W"})
+    assert not meter.snapshot(hass).aligned  # changes of different readings
+    freezer.tick(METER_MAX_SKEW + 0.1)
+    snapshot = meter.snapshot(hass)
+    assert snapshot.aligned  # no other change followed
+    assert (snapshot.import_W, snapshot.export_W) == (200, 0)
+
+    freezer.tick(10)
+    hass.states.async_set("sensor.import", "300", {"unit_of_measurement": "W"})
+    hass.states.async_set("sensor.export", "0", {"unit_of_measurement": "W"})
+    assert meter.snapshot(hass).aligned
+
+
+def test_meter_alignment_static_entity(hass, freezer):
+    """Test an entity that doesn't change (export while importing) doesn't hold back the readings of a fast one."""
+    meter = grid_meter_from_config(
+        {CONF_PWR_IMP_ENT_ID: "sensor.import", CONF_PWR_EXP_ENT_ID: "sensor.export"}, PowerStateConverter()
+    )
+    hass.states.async_set("sensor.export", "0", {"unit_of_measurement": "W"})
+    freezer.tick(3 * 3600)
+    for value in range(10):
+        hass.states.async_set("sensor.import", str(500 + value), {"unit_of_measurement": "W"})
+        snapshot = meter.snapshot(hass)
+        assert snapshot.aligned
+        assert snapshot.import_W == 500 + value
+        freezer.tick(1)
@@ -0,0 +1,46 @@
+"""Test running blocking Modbus calls in the executor."""
+import threading
+import time
+
+import pytest
+
+from custom_components.sunspec_setpoint.modbus_io import ModbusIO
+
+
+async def test_timeout_releases_lock(hass):
+    """Test a timed out call raises, and the next call runs once the stuck call finished instead of overlapping it."""
+    io = ModbusIO(hass, timeout=0.1)
+    release = threading.Event()
+    running = []
+
+    def stuck():
+        running.append("stuck")
+        release.wait(timeout=5)
+        running.remove("stuck")
+
+    def read():
+        assert running == []  # never overlaps with the stuck call
+        return b"SunS"
+
+    with pytest.raises(TimeoutError):
+        await io.async_call(stuck)
+    assert (io.call_count, io.timeout_count) == (1, 1)
+
+    release.set()
+    assert await io.async_call(read) == b"SunS"
+    assert io.timeout_count == 1
+
+
+async def test_call_errors(hass):
+    """Test a failing call raises its own error and doesn't count as timeout, and the tick wait time adds up."""
+    io = ModbusIO(hass, timeout=1.0)
+
+    def fail():
+        raise ConnectionError("socket closed")
+
+    io.start_tick()
+    with pytest.raises(ConnectionError):
+        await io.async_call(fail)
+    assert io.timeout_count == 0
+    assert await io.async_call(time.sleep, 0.01) is None
+    assert io.tick_wait_time >= 0.01
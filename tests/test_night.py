@@ -0,0 +1,62 @@
+"""Test night mode, entered when the sun is down and the inverter sleeps."""
+import datetime
+
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.coordinator import PvCurtailingCoordinator
+from custom_components.sunspec_setpoint.inverter import SunSpecInverter
+
+from .simulator import (
+    EXPORT_ENTITY,
+    IMPORT_ENTITY,
+    MODELS_1XX,
+    TARIFF_ENTITY,
+    SimulatedSite,
+    SunSpecSimulator,
+    make_entry,
+    setup_domain_data,
+)
+
+
+async def test_night_mode(hass, socket_enabled):
+    """Test the poll rate drops while the inverter sleeps at night, and recovers at sunrise."""
+    sim = SunSpecSimulator(models=MODELS_1XX)
+    SimulatedSite(sim, pv_available=0)
+    sim.set_raw(103, "St", 2)  # SLEEPING
+    port = await sim.start()
+    setup_domain_data(hass)
+    entry = make_entry(port, {CONF_NIGHT_POLL_INTERVAL: 0})
+    hass.states.async_set(IMPORT_ENTITY, 300, {"unit_of_measurement": "W"})
+    hass.states.async_set(EXPORT_ENTITY, 0, {"unit_of_measurement": "W"})
+    hass.states.async_set(TARIFF_ENTITY, 50)
+    inverter = SunSpecInverter(hass=hass, config_entry=entry)
+    coordinator = PvCurtailingCoordinator(hass=hass, config_entry=entry)
+    try:
+        await inverter.async_sunspec_setup()
+        coordinator.add_inverter(inverter)
+
+        # Without the sun integration there is no night mode
+        await coordinator._async_update_data()
+        assert inverter.status == 2 and inverter.idle
+        assert not coordinator.night
+
+        hass.states.async_set(SUN_ENTITY_ID, "below_horizon", {"elevation": -20})
+        await coordinator._async_update_data()
+        assert coordinator.night and inverter.night
+        assert coordinator.update_interval is None  # polling stops until sunrise
+
+        hass.states.async_set(SUN_ENTITY_ID, "above_horizon", {"elevation": 1})
+        await hass.async_block_till_done()
+        assert not coordinator.night and not inverter.night
+        assert coordinator.update_interval == datetime.timedelta(seconds=UPDATE_INTERVAL)
+
+        # An inverter that produces ends night mode, also when the sun is still low
+        hass.states.async_set(SUN_ENTITY_ID, "below_horizon", {"elevation": -20})
+        await coordinator._async_update_data()
+        assert coordinator.night
+        sim.set_raw(103, "St", 4)  # MPPT
+        await coordinator._async_update_data()
+        assert not coordinator.night
+    finally:
+        await coordinator.async_shutdown()
+        await entry._async_process_on_unload(hass)
+        await sim.stop()
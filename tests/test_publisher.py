@@ -0,0 +1,44 @@
+"""Test rate-limited publishing of sensor values."""
+from custom_components.sunspec_setpoint.publisher import PublishFilter, PublishSettings, PublishThrottle
+
+
+def test_threshold_and_intervals():
+    """Test small changes wait for the max interval and changes within the min interval are held."""
+    publish_filter = PublishFilter(PublishSettings(threshold=10, min_interval=10, max_interval=60))
+    assert publish_filter.update(1000, now=0)
+    assert not publish_filter.update(1500, now=5)
+    assert publish_filter.update(1500, now=10)
+    assert not publish_filter.update(1505, now=30)
+    assert publish_filter.update(1505, now=70)
+    assert publish_filter.value == 1505
+
+
+def test_window_stats():
+    """Test skipped values end up in the mean, min and max of the next published value."""
+    publish_filter = PublishFilter(PublishSettings(threshold=10, min_interval=10, max_interval=60))
+    publish_filter.update(100, now=0)
+    for now, value in ((2, 50), (4, 150), (6, 100)):
+        assert not publish_filter.update(value, now=now)
+    assert publish_filter.update(200, now=10)
+    assert publish_filter.stats == {"window_mean": 125.0, "window_min": 50, "window_max": 200, "window_samples": 4}
+
+
+def test_unknown_values():
+    """Test a value becoming unknown or known again is published right away."""
+    publish_filter = PublishFilter(PublishSettings(threshold=10, min_interval=10, max_interval=60))
+    publish_filter.update(100, now=0)
+    assert publish_filter.update(None, now=1)
+    assert publish_filter.value is None
+    assert not publish_filter.update(None, now=100)
+    assert publish_filter.update(100, now=101)
+
+
+def test_throttle():
+    """Test per-update diagnostic states are written once per max interval, and on availability changes."""
+    throttle = PublishThrottle(PublishSettings(max_interval=60))
+    assert throttle.update(True, now=0)
+    assert not throttle.update(True, now=10)
+    assert throttle.update(False, now=20)
+    assert not throttle.update(False, now=30)
+    assert throttle.update(False, now=80)
+
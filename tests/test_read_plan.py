@@ -0,0 +1,70 @@
+"""Test merging SunSpec points into bulk register reads."""
+import types
+
+import pytest
+
+from custom_components.sunspec_setpoint.const import MAX_READ_COUNT
+from custom_components.sunspec_setpoint.read_plan import ReadPlan
+
+
+class FakePoint:
+    """Point of a SunSpec model at model_addr + offset, that keeps the data it's decoded from."""
+
+    def __init__(self, model, offset: int, length: int = 1, sf: str | None = None) -> None:
+        self.model = model
+        self.group = model
+        self.offset = offset
+        self.len = length
+        self.sf = sf
+        self.data: bytes | None = None
+
+    def set_mb(self, data: bytes, dirty: bool) -> None:
+        self.data = data
+
+
+class FakeDevice:
+    """Device whose registers hold their own address."""
+
+    def __init__(self) -> None:
+        self.reads: list[tuple[int, int]] = []
+
+    def read(self, addr: int, count: int) -> bytes:
+        self.reads.append((addr, count))
+        return b"".join((addr + i).to_bytes(2, "big") for i in range(count))
+
+
+def model(model_addr: int) -> types.SimpleNamespace:
+    return types.SimpleNamespace(model_addr=model_addr, points={})
+
+
+def test_merge_across_gap():
+    """Test points with a gap between them are read in one block, including their scale factor."""
+    m = model(40000)
+    sf = FakePoint(m, offset=20)
+    m.points["W_SF"] = sf
+    w = FakePoint(m, offset=4, sf="W_SF")
+    limit = FakePoint(m, offset=10, length=2)
+    plan = ReadPlan([w, limit])
+    assert [(start, count) for start, count, _ in plan.blocks] == [(40004, 17)]
+
+    d = FakeDevice()
+    plan.execute(d)
+    assert d.reads == [(40004, 17)]
+    assert w.data == (40004).to_bytes(2, "big")
+    assert limit.data == (40010).to_bytes(2, "big") + (40011).to_bytes(2, "big")
+    assert sf.data == (40020).to_bytes(2, "big")
+
+
+def test_split_large_gap():
+    """Test points further apart than one read request are read in separate blocks."""
+    first = FakePoint(model(40000), offset=0)
+    second = FakePoint(model(40000 + MAX_READ_COUNT), offset=0)
+    plan = ReadPlan([second, first])
+    assert [(start, count) for start, count, _ in plan.blocks] == [(40000, 1), (40000 + MAX_READ_COUNT, 1)]
+
+
+def test_incomplete_response():
+    point = FakePoint(model(40000), offset=0, length=2)
+    d = types.SimpleNamespace(read=lambda addr, count: b"\x00\x01")
+    with pytest.raises(ValueError):
+        ReadPlan([point]).execute(d)
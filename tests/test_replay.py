@@ -0,0 +1,95 @@
+"""Test the control loop replay on recorded days."""
+import io
+import math
+import time
+
+from custom_components.sunspec_setpoint.const import *
+from custom_components.sunspec_setpoint.coordinator import PvCurtailingCoordinator
+
+from .replay import ReplayEngine, ReplaySeries
+from .simulator import make_entry
+
+STEP = 10  # [s]
+DAY = 86400  # [s]
+
+
+def sunny_days(days: int = 1, peak: float = 4000, load: float = 500) -> ReplaySeries:
+    """Uncurtailed recording of sunny days with a negative tariff from 11:00 to 15:00."""
+    pv, imports, exports, tariff = [], [], [], []
+    for n in range(days * DAY // STEP):
+        t = n * STEP % DAY
+        pv_W = max(peak * math.sin(math.pi * (t - 6 * 3600) / (12 * 3600)), 0) if 6 * 3600 <= t < 18 * 3600 else 0
+        pv.append(pv_W)
+        imports.append(max(load - pv_W, 0))
+        exports.append(max(pv_W - load, 0))
+        tariff.append(-10 if 11 * 3600 <= t < 15 * 3600 else 50)
+    return ReplaySeries(
+        start=0,
+        step=STEP,
+        columns={"import_W": imports, "export_W": exports, "tariff": tariff, "pv_potential_W": pv},
+    )
+
+
+def make_engine(hass, options: dict | None = None) -> ReplayEngine:
+    entry = make_entry(port=502, options={CONF_CUTOFF_TARIFF: 0, **(options or {})})
+    coordinator = PvCurtailingCoordinator(hass=hass, config_entry=entry)
+    return ReplayEngine(coordinator, rating=5000)
+
+
+async def test_replay_curtails_negative_prices(hass):
+    """Test curtailing removes most of the export during negative prices."""
+    series = sunny_days()
+    recorded_export_Wh = sum(
+        export * STEP / 3600 for export, tariff in zip(series.export_W, series.tariff) if tariff < 0
+    )
+    result = make_engine(hass).run(series)
+    assert result.duration == DAY
+    assert result.negative_price_export_Wh < 0.05 * recorded_export_Wh
+    # Only the PV power above the load is curtailed, during the 4 negative hours
+    assert 0 < result.curtailed_yield_Wh < 1.05 * recorded_export_Wh
+    assert 0 < result.write_count < len(series)
+
+
+async def test_replay_sweep(hass):
+    """Test a parameter sweep over the PID gain and the write gate."""
+    engine = make_engine(hass, {CONF_CONTROLLER: ControllerType.PID.value})
+    results = engine.sweep(
+        sunny_days(),
+        {CONF_KP: [0.3, 1.0], CONF_MIN_DELTA_PCT: [0, 5]},
+        base_options={**engine.coordinator.options},
+    )
+    assert len(results) == 4
+    export = {(options[CONF_KP], options[CONF_MIN_DELTA_PCT]): result.negative_price_export_Wh for options, result in results}
+    assert export[(1.0, 0)] < export[(0.3, 0)]
+    assert all(result.negative_price_export_Wh < 500 and result.write_count > 0 for _, result in results)
+
+
+async def test_replay_month_speed(hass):
+    """Test a month of 10 second samples replays in seconds."""
+    series = sunny_days(days=30)
+    start = time.perf_counter()
+    result = make_engine(hass).run(series)
+    assert time.perf_counter() - start < 10
+    assert result.duration == 30 * DAY
+
+
+def test_history_csv():
+    """Test the history panel export is resampled with the last value before every sample."""
+    export = io.StringIO(
+        "entity_id,state,last_changed\n"
+        "sensor.import,100,2024-06-01T12:00:00+00:00\n"
+        "sensor.import,unavailable,2024-06-01T12:00:05+00:00\n"
+        "sensor.import,300,2024-06-01T12:00:25+00:00\n"
+        "sensor.export,0,2024-06-01T12:00:00+00:00\n"
+        "sensor.tariff,-5,2024-06-01T12:00:00+00:00\n"
+        "sensor.pv,2000,2024-06-01T12:00:00+00:00\n"
+        "sensor.pv,2500,2024-06-01T12:00:30+00:00\n"
+    )
+    series = ReplaySeries.from_history_csv(
+        export,
+        {"sensor.import": "import_W", "sensor.export": "export_W", "sensor.tariff": "tariff", "sensor.pv": "pv_potential_W"},
+        step=10,
+    )
+    assert list(series.import_W) == [100, 100, 100, 300]
+    assert list(series.pv_potential_W) == [2000, 2000, 2000, 2500]
+    assert list(series.pv_W) == list(series.pv_potential_W)
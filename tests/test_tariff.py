@@ -0,0 +1,69 @@
+"""Test the day-ahead tariff schedule."""
+import datetime
+
+from homeassistant.core import State
+from homeassistant.util import dt as dt_util
+
+from custom_components.sunspec_setpoint.tariff import TariffEngine, TariffSchedule
+
+MIDNIGHT = datetime.datetime(2026, 6, 1, tzinfo=datetime.timezone.utc)
+PRICES = [50, 20, -5, -10, 30, -1]
+
+
+def hour(h: float) -> datetime.datetime:
+    return MIDNIGHT + datetime.timedelta(hours=h)
+
+
+def test_nord_pool_series():
+    """Test equal intervals with end times are indexed arithmetically and merged into windows."""
+    attributes = {
+        "raw_today": [{"start": hour(h), "end": hour(h + 1), "value": price} for h, price in enumerate(PRICES)]
+    }
+    schedule = TariffSchedule.from_attributes(attributes, cutoff=0)
+    assert schedule.step == 3600
+    assert schedule.price_at(hour(2.5).timestamp()) == -5
+    assert schedule.price_at(hour(3).timestamp()) == -10
+    assert schedule.price_at(hour(7).timestamp()) is None
+    assert schedule.windows == [(hour(2).timestamp(), hour(4).timestamp()), (hour(5).timestamp(), hour(6).timestamp())]
+    assert schedule.next_transition(hour(0.5).timestamp()) == hour(2).timestamp()
+    assert schedule.next_transition(hour(2).timestamp()) == hour(4).timestamp()
+    assert schedule.next_transition(hour(6).timestamp()) is None
+
+
+def test_entsoe_series_without_end_times():
+    """Test ISO start times, intervals lasting until the next start and a bisect lookup for unequal intervals."""
+    attributes = {
+        "prices": [
+            {"time": hour(0).isoformat(), "price": 10},
+            {"time": hour(1).isoformat(), "price": -3},
+            {"time": hour(1.5).isoformat(), "price": 4},
+        ]
+    }
+    schedule = TariffSchedule.from_attributes(attributes, cutoff=0)
+    assert schedule.step is None
+    assert schedule.price_at(hour(1.25).timestamp()) == -3
+    assert schedule.price_at(hour(1.75).timestamp()) == 4  # lasts as long as the interval before
+    assert schedule.price_at(hour(2).timestamp()) is None
+
+
+def test_engine_falls_back_to_state():
+    """Test the state is used without a series, and unusable states give None."""
+    engine = TariffEngine(cutoff=0)
+    now = dt_util.utcnow()
+    assert engine.price(State("sensor.tariff", "-12.5"), now) == -12.5
+    assert engine.next_transition(now) is None
+    assert engine.price(State("sensor.tariff", "unavailable"), now) is None
+    assert engine.price(State("sensor.tariff", "abc"), now) is None
+
+
+def test_engine_rebuilds_on_new_prices_and_cutoff():
+    """Test the schedule is only rebuilt when the attributes or the cutoff change."""
+    engine = TariffEngine(cutoff=0)
+    state = State("sensor.tariff", "50", {"raw_today": [{"start": hour(h), "value": p} for h, p in enumerate(PRICES)]})
+    assert engine.update(state)
+    assert not engine.update(State("sensor.tariff", "20", state.attributes))
+    assert engine.price(state, hour(3.5)) == -10
+    assert engine.next_transition(hour(0)) == hour(2)
+    engine.set_cutoff(25)
+    assert engine.update(state)
+    assert engine.next_transition(hour(0)) == hour(1)
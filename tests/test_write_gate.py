@@ -0,0 +1,39 @@
+"""Test setpoint write gating."""
+from custom_components.sunspec_setpoint.write_gate import WriteGate
+
+
+def test_min_delta():
+    """Test small setpoint changes are suppressed, except to 0 or 100 %."""
+    gate = WriteGate(min_delta_pct=2, min_interval=0, max_writes_per_hour=100)
+    assert gate.allow(50, now=0)
+    gate.record_write(50, now=0)
+    assert not gate.allow(51, now=10)
+    assert not gate.allow(50, now=10, force=True)
+    assert gate.allow(53, now=10)
+    gate.record_write(99, now=20)
+    assert gate.allow(100, now=30)
+    assert gate.suppressed_count == 1
+
+
+def test_forced_repeat_not_counted():
+    """Test re-sending the same setpoint every update while the switch is off isn't counted as suppressed."""
+    gate = WriteGate(min_delta_pct=2, min_interval=0, max_writes_per_hour=100)
+    gate.record_write(100, now=0)
+    for now in (10, 20, 30):
+        assert not gate.allow(100, now=now, force=True)
+    assert gate.suppressed_count == 0
+    assert not gate.allow(100, now=40)
+    assert gate.suppressed_count == 1
+
+
+def test_interval_and_budget():
+    """Test min interval and hourly budget, and that forced writes skip them."""
+    gate = WriteGate(min_delta_pct=0, min_interval=5, max_writes_per_hour=3)
+    for now in (0, 10, 20):
+        assert gate.allow(now, now=now)
+        gate.record_write(now, now=now)
+    assert not gate.allow(40, now=22)
+    assert not gate.allow(40, now=30)
+    assert gate.allow(40, now=30, force=True)
+    assert gate.allow(40, now=3601)
+    assert gate.writes_last_hour(3601) == 2